@@ -0,0 +1,210 @@
+"""
+Cache de respuestas de la API
+LRU con expiración (TTL), límite de entradas y de bytes, contadores y
+etiquetas para invalidar grupos de entradas cuando cambian los datos.
+El almacén se elige con CACHE_BACKEND (ver app/cache/backends.py)
+"""
+from functools import wraps
+from flask import request, current_app, copy_current_request_context
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from app.cache.backends import CacheLocal, CacheSQLite, CacheRedis, crear_backend
+import hashlib
+import json
+import threading
+import time
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Instancia de cache del proceso (se crea con la configuración de la app)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = crear_backend(current_app.config)
+    return _cache
+
+
+def _rol_actual():
+    """Rol del usuario autenticado (claim 'rol' del token, o consulta si es un token viejo)"""
+    try:
+        rol = get_jwt().get('rol')
+        if rol:
+            return rol
+        identidad = get_jwt_identity()
+    except RuntimeError:
+        return 'anonimo'
+    if not identidad:
+        return 'anonimo'
+    from app.models import Usuario
+    usuario = Usuario.query.get(int(identidad))
+    return usuario.rol if usuario else 'anonimo'
+
+
+def cache_key(f, por_usuario=False):
+    """Clave de cache: vista + ruta + parámetros de la URL + rol (y usuario si aplica)"""
+    argumentos = sorted((k, v) for k in request.args for v in request.args.getlist(k))
+    partes = [f'{f.__module__}.{f.__name__}', request.path, json.dumps(argumentos), _rol_actual()]
+    if por_usuario:
+        try:
+            partes.append(str(get_jwt_identity()))
+        except RuntimeError:
+            partes.append('')
+    return hashlib.md5('|'.join(partes).encode()).hexdigest()
+
+
+# Segundos máximos que una petición espera a que otra termine el mismo cálculo
+ESPERA_MAXIMA = 30
+INTERVALO_ESPERA = 0.05
+
+# Cálculos en curso en este proceso: clave -> threading.Event
+_en_vuelo = {}
+_en_vuelo_lock = threading.Lock()
+
+
+def _serializar_respuesta(response, fresco_hasta):
+    cabecera = json.dumps({
+        'status': response.status_code,
+        'content_type': response.content_type,
+        'fresco_hasta': fresco_hasta
+    })
+    return cabecera.encode() + b'\n' + response.get_data()
+
+
+def _deserializar_respuesta(datos):
+    """Devuelve (respuesta, vigente); vigente=False si ya pasó el TTL y está en el período stale"""
+    cabecera, cuerpo = datos.split(b'\n', 1)
+    meta = json.loads(cabecera)
+    response = current_app.response_class(cuerpo, status=meta['status'], content_type=meta['content_type'])
+    return response, meta.get('fresco_hasta', float('inf')) > time.time()
+
+
+def _calcular_y_guardar(f, args, kwargs, cache, key, timeout, stale, tags):
+    response = current_app.make_response(f(*args, **kwargs))
+    # Solo respuestas 200 completas (no streaming ni archivos)
+    if response.status_code == 200 and not response.is_streamed and not response.direct_passthrough:
+        cache.set(key, _serializar_respuesta(response, time.time() + timeout), timeout + stale, tags)
+    return response
+
+
+def _refrescar_en_segundo_plano(f, args, kwargs, cache, key, timeout, stale, tags):
+    """Recalcular una entrada vencida en otro hilo mientras se sirve la copia vieja"""
+    @copy_current_request_context
+    def refrescar():
+        try:
+            # El hilo tiene su propio contexto de app (g vacío): volver a leer el token
+            verify_jwt_in_request(optional=True)
+            _calcular_y_guardar(f, args, kwargs, cache, key, timeout, stale, tags)
+        except Exception as e:
+            current_app.logger.warning(f'No se pudo refrescar el cache de {f.__name__}: {e}')
+        finally:
+            cache.liberar(key)
+
+    threading.Thread(target=refrescar, daemon=True).start()
+
+
+def _esperar_calculo(cache, key, evento):
+    """
+    Esperar el resultado de otra petición. Devuelve (respuesta o None, bloqueo_tomado):
+    si el otro worker soltó el bloqueo sin guardar nada, este se queda con el
+    bloqueo (y debe liberarlo); si se agota la espera no tiene el bloqueo.
+    """
+    limite = time.time() + ESPERA_MAXIMA
+    if evento is not None:
+        evento.wait(ESPERA_MAXIMA)
+        datos = cache.get(key)
+        return (_deserializar_respuesta(datos)[0] if datos is not None else None), False
+    # El cálculo está en otro worker: consultar el almacén hasta que aparezca
+    while time.time() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        datos = cache.get(key)
+        if datos is not None:
+            return _deserializar_respuesta(datos)[0], False
+        if cache.adquirir(key, ESPERA_MAXIMA):
+            # Pudo guardarse entre la lectura y el bloqueo
+            datos = cache.get(key)
+            if datos is not None:
+                cache.liberar(key)
+                return _deserializar_respuesta(datos)[0], False
+            return None, True
+    return None, False
+
+
+def cached(timeout=300, tags=(), por_usuario=False, stale=0):
+    """
+    Decorador para cachear respuestas GET exitosas.
+    Va debajo de @jwt_required() para que la clave incluya el rol del usuario.
+
+    Las peticiones idénticas que llegan mientras se calcula una respuesta esperan
+    ese mismo cálculo (en este worker o en otro) en lugar de repetirlo.
+    Con `stale` > 0, durante esos segundos después del TTL se sigue sirviendo la
+    respuesta vieja mientras un solo hilo la recalcula en segundo plano.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            cache = get_cache()
+            key = cache_key(f, por_usuario)
+
+            datos = cache.get(key)
+            if datos is not None:
+                response, vigente = _deserializar_respuesta(datos)
+                if not vigente and cache.adquirir(key, ESPERA_MAXIMA):
+                    _refrescar_en_segundo_plano(f, args, kwargs, cache, key, timeout, stale, tags)
+                return response
+
+            with _en_vuelo_lock:
+                evento = _en_vuelo.get(key)
+                lider = evento is None
+                if lider:
+                    evento = _en_vuelo[key] = threading.Event()
+
+            if not lider:
+                response, _ = _esperar_calculo(cache, key, evento)
+                if response is not None:
+                    return response
+                return _calcular_y_guardar(f, args, kwargs, cache, key, timeout, stale, tags)
+
+            try:
+                tomado = cache.adquirir(key, ESPERA_MAXIMA)
+                if not tomado:
+                    response, tomado = _esperar_calculo(cache, key, None)
+                    if response is not None:
+                        return response
+                # Sin el bloqueo (el otro worker sigue pasado ESPERA_MAXIMA) se calcula
+                # igual, pero sin liberar un bloqueo ajeno
+                try:
+                    return _calcular_y_guardar(f, args, kwargs, cache, key, timeout, stale, tags)
+                finally:
+                    if tomado:
+                        cache.liberar(key)
+            finally:
+                with _en_vuelo_lock:
+                    _en_vuelo.pop(key, None)
+                evento.set()
+        return decorated_function
+    return decorator
+
+
+def invalidate(tag):
+    """Invalidar todas las respuestas cacheadas con la etiqueta"""
+    return get_cache().invalidar(tag)
+
+
+def cache_stats():
+    """Contadores del almacén (hits/misses de este proceso) y tasa de aciertos"""
+    stats = get_cache().estadisticas()
+    consultas = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / consultas, 4) if consultas else 0.0
+    return stats
+
+
+def clear_cache():
+    """Limpiar todo el cache"""
+    get_cache().limpiar()
@@ -0,0 +1,478 @@
+"""
+Almacenes para el cache de respuestas
+- CacheLocal: memoria del proceso (cada worker de gunicorn tiene el suyo)
+- CacheSQLite: archivo SQLite compartido por todos los workers de la máquina
+- CacheRedis: servidor Redis compartido por varias máquinas
+Todos guardan bytes con la misma semántica: TTL por entrada, desalojo LRU
+al pasar el máximo de entradas o de bytes, etiquetas para invalidar y
+contadores con ventana de tiempo (rate limiting) y bloqueos con vencimiento
+(para que un solo proceso recalcule una entrada a la vez)
+"""
+from collections import OrderedDict
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class CacheLocal:
+    """Cache LRU+TTL en memoria del proceso, segura entre hilos"""
+
+    def __init__(self, max_entradas=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()  # clave -> (valor, expira, etiquetas)
+        self._etiquetas = {}         # etiqueta -> set(claves)
+        self._ventanas = {}          # clave -> [valor, expira]
+        self._bloqueos = {}          # clave -> expira
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._contadores = {'hits': 0, 'misses': 0, 'evictions': 0, 'expiradas': 0, 'invalidadas': 0}
+
+    def get(self, clave):
+        """Devuelve los bytes guardados o None"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self._contadores['misses'] += 1
+                return None
+            valor, expira, _ = entrada
+            if expira <= time.time():
+                self._quitar(clave)
+                self._contadores['expiradas'] += 1
+                self._contadores['misses'] += 1
+                return None
+            self._datos.move_to_end(clave)
+            self._contadores['hits'] += 1
+            return valor
+
+    def set(self, clave, valor, ttl, etiquetas=()):
+        if len(valor) > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (valor, time.time() + ttl, tuple(etiquetas))
+            self._bytes += len(valor)
+            for etiqueta in etiquetas:
+                self._etiquetas.setdefault(etiqueta, set()).add(clave)
+            while len(self._datos) > self.max_entradas or self._bytes > self.max_bytes:
+                antigua = next(iter(self._datos))
+                self._quitar(antigua)
+                self._contadores['evictions'] += 1
+
+    def delete(self, clave):
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+
+    def invalidar(self, etiqueta):
+        """Eliminar todas las entradas marcadas con la etiqueta"""
+        with self._lock:
+            claves = self._etiquetas.pop(etiqueta, set())
+            for clave in claves:
+                if clave in self._datos:
+                    self._quitar(clave)
+                    self._contadores['invalidadas'] += 1
+            return len(claves)
+
+    def incrementar(self, clave, ventana):
+        """Sumar 1 al contador de la clave; el contador se reinicia tras `ventana` segundos"""
+        ahora = time.time()
+        with self._lock:
+            actual = self._ventanas.get(clave)
+            if actual is None or actual[1] <= ahora:
+                if len(self._ventanas) > self.max_entradas:
+                    self._ventanas = {k: v for k, v in self._ventanas.items() if v[1] > ahora}
+                actual = self._ventanas[clave] = [0, ahora + ventana]
+            actual[0] += 1
+            return actual[0]
+
+    def adquirir(self, clave, ttl):
+        """Tomar un bloqueo con vencimiento; False si otro lo tiene"""
+        ahora = time.time()
+        with self._lock:
+            if self._bloqueos.get(clave, 0) > ahora:
+                return False
+            self._bloqueos[clave] = ahora + ttl
+            return True
+
+    def liberar(self, clave):
+        with self._lock:
+            self._bloqueos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._etiquetas.clear()
+            self._ventanas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(
+                self._contadores,
+                backend='memoria',
+                entradas=len(self._datos),
+                bytes=self._bytes,
+                max_entradas=self.max_entradas,
+                max_bytes=self.max_bytes
+            )
+
+    def _quitar(self, clave):
+        valor, _, etiquetas = self._datos.pop(clave)
+        self._bytes -= len(valor)
+        for etiqueta in etiquetas:
+            claves = self._etiquetas.get(etiqueta)
+            if claves:
+                claves.discard(clave)
+                if not claves:
+                    del self._etiquetas[etiqueta]
+
+
+class CacheSQLite:
+    """
+    Cache compartida entre procesos de la misma máquina.
+    Por defecto el archivo vive en /dev/shm (memoria compartida) si existe.
+    """
+
+    # Para no escribir en cada hit, el acceso LRU se refresca como mucho cada segundo
+    RESOLUCION_LRU = 1.0
+
+    def __init__(self, ruta=None, max_entradas=1000, max_bytes=64 * 1024 * 1024):
+        if not ruta:
+            carpeta = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            ruta = os.path.join(carpeta, 'centro_diagnostico_cache.db')
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._contadores = {'hits': 0, 'misses': 0, 'evictions': 0, 'expiradas': 0, 'invalidadas': 0}
+        self._crear_tablas()
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (los workers se crean con fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _crear_tablas(self):
+        conn = self._conexion()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                clave TEXT PRIMARY KEY,
+                valor BLOB NOT NULL,
+                expira REAL NOT NULL,
+                acceso REAL NOT NULL,
+                tamano INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entradas_acceso ON entradas(acceso);
+            CREATE TABLE IF NOT EXISTS etiquetas (
+                etiqueta TEXT NOT NULL,
+                clave TEXT NOT NULL,
+                PRIMARY KEY (etiqueta, clave)
+            );
+            CREATE TABLE IF NOT EXISTS ventanas (
+                clave TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL,
+                expira REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bloqueos (
+                clave TEXT PRIMARY KEY,
+                expira REAL NOT NULL
+            );
+        """)
+
+    def get(self, clave):
+        conn = self._conexion()
+        ahora = time.time()
+        fila = conn.execute(
+            'SELECT valor, expira, acceso FROM entradas WHERE clave = ?', (clave,)
+        ).fetchone()
+        if fila is None:
+            self._contadores['misses'] += 1
+            return None
+        valor, expira, acceso = fila
+        if expira <= ahora:
+            conn.execute('DELETE FROM entradas WHERE clave = ?', (clave,))
+            self._contadores['expiradas'] += 1
+            self._contadores['misses'] += 1
+            return None
+        if ahora - acceso > self.RESOLUCION_LRU:
+            conn.execute('UPDATE entradas SET acceso = ? WHERE clave = ?', (ahora, clave))
+        self._contadores['hits'] += 1
+        return bytes(valor)
+
+    def set(self, clave, valor, ttl, etiquetas=()):
+        if len(valor) > self.max_bytes:
+            return
+        conn = self._conexion()
+        ahora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO entradas (clave, valor, expira, acceso, tamano) VALUES (?, ?, ?, ?, ?)',
+                (clave, sqlite3.Binary(valor), ahora + ttl, ahora, len(valor))
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO etiquetas (etiqueta, clave) VALUES (?, ?)',
+                [(etiqueta, clave) for etiqueta in etiquetas]
+            )
+            self._desalojar(conn, ahora)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _desalojar(self, conn, ahora):
+        entradas, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM entradas').fetchone()
+        if entradas <= self.max_entradas and total <= self.max_bytes:
+            return
+        expiradas = conn.execute('DELETE FROM entradas WHERE expira <= ?', (ahora,)).rowcount
+        self._contadores['expiradas'] += expiradas
+        entradas -= expiradas
+        if expiradas:
+            total = conn.execute('SELECT COALESCE(SUM(tamano), 0) FROM entradas').fetchone()[0]
+        # Borrar las menos usadas hasta volver a estar dentro de ambos límites
+        for clave, tamano in conn.execute('SELECT clave, tamano FROM entradas ORDER BY acceso').fetchall():
+            if entradas <= self.max_entradas and total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM entradas WHERE clave = ?', (clave,))
+            entradas -= 1
+            total -= tamano
+            self._contadores['evictions'] += 1
+        conn.execute('DELETE FROM etiquetas WHERE clave NOT IN (SELECT clave FROM entradas)')
+
+    def delete(self, clave):
+        self._conexion().execute('DELETE FROM entradas WHERE clave = ?', (clave,))
+
+    def invalidar(self, etiqueta):
+        conn = self._conexion()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            borradas = conn.execute(
+                'DELETE FROM entradas WHERE clave IN (SELECT clave FROM etiquetas WHERE etiqueta = ?)',
+                (etiqueta,)
+            ).rowcount
+            conn.execute('DELETE FROM etiquetas WHERE etiqueta = ?', (etiqueta,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._contadores['invalidadas'] += borradas
+        return borradas
+
+    def incrementar(self, clave, ventana):
+        conn = self._conexion()
+        ahora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM ventanas WHERE clave = ? AND expira <= ?', (clave, ahora))
+            conn.execute(
+                'INSERT INTO ventanas (clave, valor, expira) VALUES (?, 1, ?) '
+                'ON CONFLICT(clave) DO UPDATE SET valor = valor + 1',
+                (clave, ahora + ventana)
+            )
+            valor = conn.execute('SELECT valor FROM ventanas WHERE clave = ?', (clave,)).fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return valor
+
+    def adquirir(self, clave, ttl):
+        conn = self._conexion()
+        ahora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM bloqueos WHERE clave = ? AND expira <= ?', (clave, ahora))
+            tomado = conn.execute(
+                'INSERT OR IGNORE INTO bloqueos (clave, expira) VALUES (?, ?)', (clave, ahora + ttl)
+            ).rowcount == 1
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return tomado
+
+    def liberar(self, clave):
+        self._conexion().execute('DELETE FROM bloqueos WHERE clave = ?', (clave,))
+
+    def limpiar(self):
+        self._conexion().executescript(
+            'DELETE FROM entradas; DELETE FROM etiquetas; DELETE FROM ventanas; DELETE FROM bloqueos;'
+        )
+
+    def estadisticas(self):
+        entradas, total = self._conexion().execute(
+            'SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM entradas'
+        ).fetchone()
+        return dict(
+            self._contadores,
+            backend='sqlite',
+            ruta=self.ruta,
+            entradas=entradas,
+            bytes=total,
+            max_entradas=self.max_entradas,
+            max_bytes=self.max_bytes
+        )
+
+
+class CacheRedis:
+    """Cache compartida en Redis (o un servidor compatible) entre workers y máquinas"""
+
+    # SET + registro LRU + desalojo en un solo paso atómico
+    _SCRIPT_SET = """
+        local lru, tamanos, total_key, clave = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+        local valor, ttl, ahora = ARGV[1], ARGV[2], ARGV[3]
+        local max_n, max_b = tonumber(ARGV[4]), tonumber(ARGV[5])
+        local previo = redis.call('HGET', tamanos, clave)
+        if previo then redis.call('DECRBY', total_key, previo) end
+        redis.call('SET', clave, valor, 'PX', ttl)
+        redis.call('ZADD', lru, ahora, clave)
+        redis.call('HSET', tamanos, clave, string.len(valor))
+        local total = redis.call('INCRBY', total_key, string.len(valor))
+        local desalojadas = 0
+        while redis.call('ZCARD', lru) > max_n or total > max_b do
+            local viejo = redis.call('ZPOPMIN', lru)[1]
+            if not viejo then break end
+            local t = redis.call('HGET', tamanos, viejo)
+            if t then
+                total = redis.call('DECRBY', total_key, t)
+                redis.call('HDEL', tamanos, viejo)
+            end
+            if redis.call('DEL', viejo) == 1 then desalojadas = desalojadas + 1 end
+        end
+        return desalojadas
+    """
+
+    _SCRIPT_QUITAR = """
+        local lru, tamanos, total_key = KEYS[1], KEYS[2], KEYS[3]
+        local borradas = 0
+        for i = 1, #ARGV do
+            local t = redis.call('HGET', tamanos, ARGV[i])
+            if t then
+                redis.call('DECRBY', total_key, t)
+                redis.call('HDEL', tamanos, ARGV[i])
+            end
+            redis.call('ZREM', lru, ARGV[i])
+            borradas = borradas + redis.call('DEL', ARGV[i])
+        end
+        return borradas
+    """
+
+    _SCRIPT_INCREMENTAR = """
+        local v = redis.call('INCR', KEYS[1])
+        if v == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end
+        return v
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', max_entradas=1000, max_bytes=64 * 1024 * 1024,
+                 prefijo='centro:cache:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.prefijo = prefijo
+        self._lru = prefijo + '_lru'
+        self._tamanos = prefijo + '_tamanos'
+        self._total = prefijo + '_bytes'
+        self._set = self._redis.register_script(self._SCRIPT_SET)
+        self._quitar = self._redis.register_script(self._SCRIPT_QUITAR)
+        self._incrementar = self._redis.register_script(self._SCRIPT_INCREMENTAR)
+        self._contadores = {'hits': 0, 'misses': 0, 'evictions': 0, 'expiradas': 0, 'invalidadas': 0}
+
+    def _k(self, clave):
+        return self.prefijo + 'e:' + clave
+
+    def get(self, clave):
+        k = self._k(clave)
+        valor = self._redis.get(k)
+        if valor is None:
+            self._contadores['misses'] += 1
+            # Si expiró por TTL, limpiar su registro LRU y de tamaño
+            if self._redis.zscore(self._lru, k) is not None:
+                self._quitar(keys=[self._lru, self._tamanos, self._total], args=[k])
+                self._contadores['expiradas'] += 1
+            return None
+        self._redis.zadd(self._lru, {k: time.time()})
+        self._contadores['hits'] += 1
+        return valor
+
+    def set(self, clave, valor, ttl, etiquetas=()):
+        if len(valor) > self.max_bytes:
+            return
+        k = self._k(clave)
+        desalojadas = self._set(
+            keys=[self._lru, self._tamanos, self._total, k],
+            args=[valor, int(ttl * 1000), time.time(), self.max_entradas, self.max_bytes]
+        )
+        self._contadores['evictions'] += desalojadas
+        if etiquetas:
+            pipe = self._redis.pipeline()
+            for etiqueta in etiquetas:
+                pipe.sadd(self.prefijo + 't:' + etiqueta, k)
+            pipe.execute()
+
+    def delete(self, clave):
+        self._quitar(keys=[self._lru, self._tamanos, self._total], args=[self._k(clave)])
+
+    def invalidar(self, etiqueta):
+        clave_etiqueta = self.prefijo + 't:' + etiqueta
+        pipe = self._redis.pipeline()
+        pipe.smembers(clave_etiqueta)
+        pipe.delete(clave_etiqueta)
+        claves, _ = pipe.execute()
+        if not claves:
+            return 0
+        borradas = self._quitar(keys=[self._lru, self._tamanos, self._total], args=list(claves))
+        self._contadores['invalidadas'] += borradas
+        return borradas
+
+    def incrementar(self, clave, ventana):
+        return int(self._incrementar(keys=[self.prefijo + 'v:' + clave], args=[int(ventana * 1000)]))
+
+    def adquirir(self, clave, ttl):
+        return bool(self._redis.set(self.prefijo + 'b:' + clave, os.getpid(), nx=True, px=int(ttl * 1000)))
+
+    def liberar(self, clave):
+        self._redis.delete(self.prefijo + 'b:' + clave)
+
+    def limpiar(self):
+        claves = list(self._redis.scan_iter(match=self.prefijo + '*'))
+        if claves:
+            self._redis.delete(*claves)
+
+    def estadisticas(self):
+        pipe = self._redis.pipeline()
+        pipe.zcard(self._lru)
+        pipe.get(self._total)
+        entradas, total = pipe.execute()
+        return dict(
+            self._contadores,
+            backend='redis',
+            entradas=entradas,
+            bytes=int(total or 0),
+            max_entradas=self.max_entradas,
+            max_bytes=self.max_bytes
+        )
+
+
+def crear_backend(config):
+    """Crear el almacén indicado en CACHE_BACKEND (memoria | sqlite | redis)"""
+    tipo = config.get('CACHE_BACKEND', 'memoria')
+    limites = {
+        'max_entradas': config.get('CACHE_MAX_ENTRIES', 1000),
+        'max_bytes': config.get('CACHE_MAX_BYTES', 64 * 1024 * 1024),
+    }
+    if tipo == 'sqlite':
+        return CacheSQLite(ruta=config.get('CACHE_URL'), **limites)
+    if tipo == 'redis':
+        return CacheRedis(url=config.get('CACHE_URL') or 'redis://localhost:6379/0', **limites)
+    return CacheLocal(**limites)
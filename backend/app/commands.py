@@ -0,0 +1,137 @@
+"""
+Comandos de mantenimiento (flask <comando>)
+"""
+import click
+import logging
+from datetime import datetime
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+def _fecha(valor):
+    return datetime.fromisoformat(valor).date() if valor else None
+
+
+@click.command('reconstruir-resumenes')
+@click.option('--desde', help='Fecha inicial YYYY-MM-DD (por defecto todo el histórico)')
+@click.option('--hasta', help='Fecha final YYYY-MM-DD')
+@with_appcontext
+def reconstruir_resumenes(desde, hasta):
+    """Recalcular las tablas de resumen del dashboard"""
+    from app.services.resumenes import ResumenService
+
+    ResumenService.reconstruir(_fecha(desde), _fecha(hasta))
+    click.echo('Resúmenes reconstruidos')
+
+
+@click.command('recalcular-saldos')
+@with_appcontext
+def recalcular_saldos():
+    """Recalcular monto_pagado/saldo de las facturas a partir de los pagos"""
+    from app.services.facturacion import FacturacionService
+
+    total = FacturacionService.recalcular_saldos()
+    click.echo(f'{total} facturas actualizadas')
+
+
+@click.command('detectar-duplicados')
+@click.option('--reindexar', is_flag=True, help='Recalcular antes las claves de bloqueo de todos los pacientes')
+@with_appcontext
+def detectar_duplicados(reindexar):
+    """Buscar pacientes duplicados comparando solo los que comparten clave de bloqueo"""
+    from app.services.duplicados import DuplicadosService
+
+    if reindexar:
+        total = DuplicadosService.reindexar()
+        click.echo(f'Claves recalculadas para {total} pacientes')
+    bloques, evaluados, nuevos = DuplicadosService.detectar()
+    click.echo(f'{bloques} bloques, {evaluados} pares evaluados, {nuevos} duplicados nuevos')
+
+
+@click.command('registrar-huecos-ncf')
+@click.option('--gracia', default=10, show_default=True, help='Minutos de espera tras liberar un bloque')
+@with_appcontext
+def registrar_huecos_ncf(gracia):
+    """Registrar los NCF reservados que no llegaron a ninguna factura"""
+    from app.services.ncf import NCFService
+
+    total = NCFService.registrar_huecos(gracia)
+    click.echo(f'{total} NCF sin usar registrados')
+
+
+@click.command('facturar-lote')
+@click.option('--lote', 'lote_id', type=int, help='Reanudar un lote existente')
+@click.option('--seguro', help='Seguro médico (ARS) de los pacientes')
+@click.option('--desde', help='Fecha inicial de las órdenes YYYY-MM-DD')
+@click.option('--hasta', help='Fecha final de las órdenes YYYY-MM-DD')
+@click.option('--tipo', default='B01', show_default=True, help='Tipo de comprobante')
+@click.option('--itbis', is_flag=True, help='Incluir ITBIS')
+@with_appcontext
+def facturar_lote(lote_id, seguro, desde, hasta, tipo, itbis):
+    """Facturar en lote las órdenes pendientes (para cierres grandes, sin límite de tiempo del worker)"""
+    from app.services.facturacion_lotes import FacturacionLoteService
+
+    if not lote_id:
+        try:
+            lote_id = FacturacionLoteService.crear({
+                'seguro_medico': seguro, 'desde': desde, 'hasta': hasta,
+                'tipo_comprobante': tipo, 'incluir_itbis': itbis
+            }, None).id
+        except ValueError as e:
+            raise click.UsageError(f'{e} (--seguro o --desde y --hasta)')
+    for evento in FacturacionLoteService.procesar(lote_id):
+        if evento['evento'] == 'progreso':
+            click.echo(f"{evento['procesadas']}/{evento['total']} órdenes, {evento['facturas_creadas']} facturas")
+        elif evento['evento'] == 'fin':
+            lote = evento['lote'] or {}
+            click.echo(f"Lote {lote.get('id')}: {lote.get('estado')} {evento.get('error') or lote.get('mensaje') or ''}")
+
+
+@click.command('servidor-mllp')
+@click.option('--host', help='Interfaz donde escuchar (por defecto MLLP_HOST)')
+@click.option('--puerto', type=int, help='Puerto TCP (por defecto MLLP_PUERTO)')
+@with_appcontext
+def servidor_mllp(host, puerto):
+    """Recibir resultados HL7 de los equipos por MLLP/TCP (proceso de larga duración)"""
+    from app.services.mllp import ServidorMLLP
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    config = current_app.config
+    ServidorMLLP(
+        current_app._get_current_object(),
+        host or config['MLLP_HOST'], puerto or config['MLLP_PUERTO'],
+        config['MLLP_LOTE'], config['MLLP_ESPERA_LOTE'], config['MLLP_INACTIVIDAD']
+    ).ejecutar()
+
+
+@click.command('recuperar-ingesta')
+@with_appcontext
+def recuperar_ingesta():
+    """Guardar los diarios de ingesta de resultados que quedaron pendientes (p. ej. tras una caída)"""
+    from app.services.ingesta import IngestaService
+
+    guardados, rechazados = IngestaService.recuperar()
+    click.echo(f'{guardados} resultados guardados, {rechazados} rechazados')
+
+
+@click.command('reconstruir-valores')
+@click.option('--lote', default=1000, show_default=True, help='Resultados por transacción')
+@with_appcontext
+def reconstruir_valores(lote):
+    """Llenar resultado_valores con los resultados que se guardaron sin separar los valores"""
+    from app.services.ingesta import IngestaService
+
+    resultados, valores = IngestaService.reconstruir_valores(lote)
+    click.echo(f'{valores} valores de {resultados} resultados')
+
+
+def registrar_comandos(app):
+    """Registrar los comandos en la CLI de Flask"""
+    app.cli.add_command(reconstruir_resumenes)
+    app.cli.add_command(recalcular_saldos)
+    app.cli.add_command(detectar_duplicados)
+    app.cli.add_command(registrar_huecos_ncf)
+    app.cli.add_command(facturar_lote)
+    app.cli.add_command(servidor_mllp)
+    app.cli.add_command(recuperar_ingesta)
+    app.cli.add_command(reconstruir_valores)
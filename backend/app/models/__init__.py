@@ -1,5 +1,7 @@
 from datetime import datetime
+import json
 from app import db
+from app.utils.busqueda import texto_busqueda_paciente
 import uuid
 
 class Paciente(db.Model):
@@ -24,7 +26,9 @@ class Paciente(db.Model):
     alergias = db.Column(db.Text)
     notas_medicas = db.Column(db.Text)
     estado = db.Column(db.String(20), default='activo')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Texto normalizado para búsquedas (índice trigram), se mantiene con los eventos de abajo
+    busqueda = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relaciones
@@ -50,6 +54,12 @@ class Paciente(db.Model):
         }
 
 
+@db.event.listens_for(Paciente, 'before_insert')
+@db.event.listens_for(Paciente, 'before_update')
+def _actualizar_busqueda_paciente(mapper, connection, paciente):
+    paciente.busqueda = texto_busqueda_paciente(paciente)
+
+
 class Usuario(db.Model):
     __tablename__ = 'usuarios'
     
@@ -134,7 +144,7 @@ class Orden(db.Model):
     numero_orden = db.Column(db.String(20), unique=True, nullable=False)
     paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), nullable=False)
     medico_referente = db.Column(db.String(100))
-    fecha_orden = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_orden = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=False)
     fecha_cita = db.Column(db.DateTime)
     estado = db.Column(db.String(20), default='pendiente')
     prioridad = db.Column(db.String(20), default='normal')
@@ -164,6 +174,8 @@ class OrdenDetalle(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     orden_id = db.Column(db.Integer, db.ForeignKey('ordenes.id'), nullable=False)
     estudio_id = db.Column(db.Integer, db.ForeignKey('estudios.id'), nullable=False)
+    # Código de la muestra (etiqueta del tubo); los equipos lo devuelven en SPM-2 / OBR-3
+    accesion = db.Column(db.String(20), unique=True, index=True)
     precio = db.Column(db.Numeric(10, 2), nullable=False)
     descuento = db.Column(db.Numeric(10, 2), default=0)
     precio_final = db.Column(db.Numeric(10, 2), nullable=False)
@@ -192,6 +204,92 @@ class NCFSecuencia(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class NCFBloque(db.Model):
+    """Tramo de una secuencia NCF reservado por un proceso (ver services/ncf.py)"""
+    __tablename__ = 'ncf_bloques'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    secuencia_id = db.Column(db.Integer, db.ForeignKey('ncf_secuencias.id'), nullable=False, index=True)
+    tipo_comprobante = db.Column(db.String(20), nullable=False)
+    serie = db.Column(db.String(3), nullable=False)
+    inicio = db.Column(db.BigInteger, nullable=False)
+    fin = db.Column(db.BigInteger, nullable=False)
+    proceso = db.Column(db.String(50))
+    reservado_en = db.Column(db.DateTime, default=datetime.utcnow)
+    liberado_en = db.Column(db.DateTime)
+    revisado = db.Column(db.Boolean, default=False, index=True)
+
+
+class NCFHueco(db.Model):
+    """NCF reservado que no llegó a una factura; se reporta a la DGII como no utilizado"""
+    __tablename__ = 'ncf_huecos'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    ncf = db.Column(db.String(19), unique=True, nullable=False)
+    tipo_comprobante = db.Column(db.String(20), nullable=False)
+    secuencia_id = db.Column(db.Integer, db.ForeignKey('ncf_secuencias.id'))
+    bloque_id = db.Column(db.Integer, db.ForeignKey('ncf_bloques.id'))
+    motivo = db.Column(db.String(50), default='no_emitido')
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=False, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ncf': self.ncf,
+            'tipo_comprobante': self.tipo_comprobante,
+            'motivo': self.motivo,
+            'fecha': self.fecha.isoformat() if self.fecha else None
+        }
+
+
+class Numerador(db.Model):
+    """Contador por serie y período para números de factura y orden (ver services/numeracion.py)"""
+    __tablename__ = 'numeradores'
+    
+    serie = db.Column(db.String(20), primary_key=True)
+    periodo = db.Column(db.String(10), primary_key=True)
+    valor = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class LoteFacturacion(db.Model):
+    """Facturación por lotes de órdenes (p. ej. cierre mensual de una ARS); ver services/facturacion_lotes.py"""
+    __tablename__ = 'lotes_facturacion'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    seguro_medico = db.Column(db.String(100))
+    fecha_desde = db.Column(db.Date)
+    fecha_hasta = db.Column(db.Date)
+    opciones = db.Column(db.Text)  # JSON: tipo_comprobante, incluir_itbis, forma_pago
+    estado = db.Column(db.String(20), default='pendiente')  # pendiente, en_proceso, interrumpido, completado, error
+    total_ordenes = db.Column(db.Integer, default=0)
+    procesadas = db.Column(db.Integer, default=0)
+    facturas_creadas = db.Column(db.Integer, default=0)
+    monto_total = db.Column(db.Numeric(12, 2), default=0)
+    ultima_orden_id = db.Column(db.Integer, default=0)
+    errores = db.Column(db.Text)  # JSON: [{orden_id, error}]
+    mensaje = db.Column(db.Text)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'seguro_medico': self.seguro_medico,
+            'fecha_desde': self.fecha_desde.isoformat() if self.fecha_desde else None,
+            'fecha_hasta': self.fecha_hasta.isoformat() if self.fecha_hasta else None,
+            'estado': self.estado,
+            'total_ordenes': self.total_ordenes,
+            'procesadas': self.procesadas,
+            'facturas_creadas': self.facturas_creadas,
+            'monto_total': float(self.monto_total or 0),
+            'errores': json.loads(self.errores) if self.errores else [],
+            'mensaje': self.mensaje,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 class Factura(db.Model):
     __tablename__ = 'facturas'
     
@@ -202,17 +300,20 @@ class Factura(db.Model):
     tipo_comprobante = db.Column(db.String(3))
     orden_id = db.Column(db.Integer, db.ForeignKey('ordenes.id'))
     paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), nullable=False)
-    fecha_factura = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_factura = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now(), nullable=False)
     fecha_vencimiento = db.Column(db.Date)
     subtotal = db.Column(db.Numeric(10, 2), nullable=False)
     descuento = db.Column(db.Numeric(10, 2), default=0)
     itbis = db.Column(db.Numeric(10, 2), default=0)
     otros_impuestos = db.Column(db.Numeric(10, 2), default=0)
     total = db.Column(db.Numeric(10, 2), nullable=False)
+    monto_pagado = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    saldo = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     estado = db.Column(db.String(20), default='pendiente')
     forma_pago = db.Column(db.String(30))
     notas = db.Column(db.Text)
     usuario_emision_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes_facturacion.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -233,6 +334,8 @@ class Factura(db.Model):
             'descuento': float(self.descuento),
             'itbis': float(self.itbis),
             'total': float(self.total),
+            'monto_pagado': float(self.monto_pagado or 0),
+            'saldo': float(self.saldo or 0),
             'estado': self.estado,
             'forma_pago': self.forma_pago
         }
@@ -278,6 +381,8 @@ class Resultado(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
+    # Identificador de la ingesta (diario / MLLP): evita guardar dos veces el mismo envío
+    id_ingesta = db.Column(db.String(64), unique=True, index=True)
     orden_detalle_id = db.Column(db.Integer, db.ForeignKey('orden_detalles.id'))
     tipo_archivo = db.Column(db.String(10))
     ruta_archivo = db.Column(db.String(500))
@@ -292,6 +397,37 @@ class Resultado(db.Model):
     orden_detalle = db.relationship('OrdenDetalle', back_populates='resultados')
 
 
+class ResultadoValor(db.Model):
+    """Un analito de un resultado (ver services/valores.py); se llena al guardar la ingesta"""
+    __tablename__ = 'resultado_valores'
+    __table_args__ = (
+        # Tendencia de un analito del paciente: un solo recorrido del índice en orden de fecha
+        db.Index('idx_resultado_valores_paciente_analito_fecha', 'paciente_id', 'analito', 'fecha'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resultado_id = db.Column(db.Integer, db.ForeignKey('resultados.id', ondelete='CASCADE'), nullable=False, index=True)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id'), nullable=False)
+    analito = db.Column(db.String(50), nullable=False)  # código del equipo (OBX-3.1), en mayúsculas
+    nombre = db.Column(db.String(100))
+    valor = db.Column(db.Numeric(18, 6))  # vacío si el valor no es numérico
+    valor_texto = db.Column(db.String(100))  # 'Positivo', '>500', ...
+    unidad = db.Column(db.String(30))
+    referencia_min = db.Column(db.Numeric(18, 6))
+    referencia_max = db.Column(db.Numeric(18, 6))
+    bandera = db.Column(db.String(10))  # H, L, HH, LL, A, N (OBX-8)
+    fecha = db.Column(db.DateTime, nullable=False)  # toma de la muestra, o recepción si no se conoce
+
+
+class IngestaRechazo(db.Model):
+    """Registro de ingesta que no se pudo guardar (el detalle completo está en rechazados.jsonl)"""
+    __tablename__ = 'ingesta_rechazos'
+    
+    id_ingesta = db.Column(db.String(64), primary_key=True)
+    motivo = db.Column(db.String(500))
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Configuracion(db.Model):
     __tablename__ = 'configuracion'
     
@@ -301,3 +437,74 @@ class Configuracion(db.Model):
     tipo = db.Column(db.String(20))
     descripcion = db.Column(db.Text)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ResumenDiario(db.Model):
+    __tablename__ = 'resumen_diario'
+    
+    fecha = db.Column(db.Date, primary_key=True)
+    facturas_cantidad = db.Column(db.Integer, nullable=False, default=0)
+    facturas_pagadas = db.Column(db.Integer, nullable=False, default=0)
+    facturado_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    pagos_cantidad = db.Column(db.Integer, nullable=False, default=0)
+    ingresos_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+
+class ResumenMetodoPago(db.Model):
+    __tablename__ = 'resumen_metodo_pago'
+    
+    fecha = db.Column(db.Date, primary_key=True)
+    metodo_pago = db.Column(db.String(30), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+
+class ResumenEstudio(db.Model):
+    __tablename__ = 'resumen_estudio'
+    
+    fecha = db.Column(db.Date, primary_key=True)
+    estudio_id = db.Column(db.Integer, db.ForeignKey('estudios.id'), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    
+    estudio = db.relationship('Estudio')
+
+
+class PacienteClave(db.Model):
+    """Claves de bloqueo para detectar pacientes duplicados (ver services/duplicados.py)"""
+    __tablename__ = 'paciente_claves'
+    
+    clave = db.Column(db.String(80), primary_key=True)
+    paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+
+class PacienteDuplicado(db.Model):
+    __tablename__ = 'paciente_duplicados'
+    __table_args__ = (
+        db.UniqueConstraint('paciente_id', 'duplicado_id', name='uq_paciente_duplicado'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Siempre paciente_id < duplicado_id para no guardar el mismo par dos veces
+    paciente_id = db.Column(db.Integer, db.ForeignKey('pacientes.id', ondelete='CASCADE'), nullable=False)
+    duplicado_id = db.Column(db.Integer, db.ForeignKey('pacientes.id', ondelete='CASCADE'), nullable=False, index=True)
+    puntaje = db.Column(db.Numeric(4, 3), nullable=False)
+    motivos = db.Column(db.String(200))
+    estado = db.Column(db.String(20), default='pendiente', index=True)  # pendiente, confirmado, descartado
+    revisado_por = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    paciente = db.relationship('Paciente', foreign_keys=[paciente_id])
+    duplicado = db.relationship('Paciente', foreign_keys=[duplicado_id])
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'paciente': self.paciente.to_dict() if self.paciente else None,
+            'duplicado': self.duplicado.to_dict() if self.duplicado else None,
+            'puntaje': float(self.puntaje),
+            'motivos': self.motivos.split(',') if self.motivos else [],
+            'estado': self.estado,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
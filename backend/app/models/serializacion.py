@@ -0,0 +1,124 @@
+"""
+Serialización de listados sin consultas N+1
+Cada Serializador declara los campos de una respuesta, las relaciones que
+incluye (se cargan con joinedload/selectinload en la misma consulta) y los
+conteos de colecciones (una consulta agrupada para toda la página).
+Un listado cuesta así un número fijo de consultas, sin importar cuántas filas tenga.
+
+    query = ORDEN_LISTADO.preparar(Orden.query.filter(...))
+    datos = ORDEN_LISTADO.serializar(query.all())
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import Paciente, Orden, Factura, PacienteDuplicado
+
+
+def _convertir(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+class Serializador:
+
+    def __init__(self, modelo, campos, relaciones=None, conteos=None):
+        """
+        campos: nombres de atributos o (clave, función(objeto))
+        relaciones: {atributo de relación: Serializador}
+        conteos: {clave: relación de colección}, p. ej. {'total_estudios': Orden.detalles}
+        """
+        self.modelo = modelo
+        self.campos = [(c, None) if isinstance(c, str) else c for c in campos]
+        self.relaciones = relaciones or {}
+        self.conteos = conteos or {}
+
+    def opciones(self):
+        """Opciones de carga para que las relaciones vengan en la misma consulta"""
+        opciones = []
+        for nombre, serializador in self.relaciones.items():
+            atributo = getattr(self.modelo, nombre)
+            # Muchos-a-uno con JOIN; colecciones con un SELECT ... IN aparte
+            cargar = selectinload(atributo) if atributo.property.uselist else joinedload(atributo)
+            sub = serializador.opciones()
+            opciones.append(cargar.options(*sub) if sub else cargar)
+        return opciones
+
+    def preparar(self, query):
+        opciones = self.opciones()
+        return query.options(*opciones) if opciones else query
+
+    def _contar(self, objetos):
+        """{clave: {id: cantidad}} con una consulta agrupada por cada conteo"""
+        ids = [o.id for o in objetos]
+        conteos = {}
+        for clave, relacion in self.conteos.items():
+            columna = next(iter(relacion.property.remote_side))
+            conteos[clave] = dict(
+                db.session.query(columna, func.count()).filter(
+                    columna.in_(ids)
+                ).group_by(columna).all()
+            ) if ids else {}
+        return conteos
+
+    def _dict(self, objeto, conteos):
+        if objeto is None:
+            return None
+        datos = {}
+        for clave, funcion in self.campos:
+            datos[clave] = _convertir(funcion(objeto) if funcion else getattr(objeto, clave))
+        for nombre, serializador in self.relaciones.items():
+            relacionado = getattr(objeto, nombre)
+            if isinstance(relacionado, list):
+                datos[nombre] = serializador.serializar(relacionado)
+            else:
+                datos[nombre] = serializador._dict(relacionado, {})
+        for clave, por_id in conteos.items():
+            datos[clave] = por_id.get(objeto.id, 0)
+        return datos
+
+    def serializar(self, objetos):
+        conteos = self._contar(objetos)
+        return [self._dict(o, conteos) for o in objetos]
+
+    def uno(self, objeto):
+        return self.serializar([objeto])[0]
+
+
+# =====================
+# Conjuntos de campos por respuesta
+# =====================
+
+# Mismos campos que Paciente.to_dict()
+PACIENTE_RESUMEN = Serializador(Paciente, [
+    'id', 'uuid', 'cedula', 'nombre', 'apellido',
+    ('nombre_completo', lambda p: f"{p.nombre} {p.apellido}"),
+    'fecha_nacimiento', 'sexo', 'telefono', 'celular', 'email', 'direccion', 'seguro_medico', 'estado'
+])
+
+# Mismos campos que Orden.to_dict()
+ORDEN_LISTADO = Serializador(
+    Orden,
+    ['id', 'numero_orden', 'fecha_orden', 'estado'],
+    relaciones={'paciente': PACIENTE_RESUMEN},
+    conteos={'total_estudios': Orden.detalles}
+)
+
+# Mismos campos que Factura.to_dict()
+FACTURA_LISTADO = Serializador(
+    Factura,
+    ['id', 'uuid', 'numero_factura', 'ncf', 'fecha_factura', 'subtotal', 'descuento', 'itbis', 'total',
+     ('monto_pagado', lambda f: f.monto_pagado or 0), ('saldo', lambda f: f.saldo or 0),
+     'estado', 'forma_pago'],
+    relaciones={'paciente': PACIENTE_RESUMEN}
+)
+
+DUPLICADO_LISTADO = Serializador(
+    PacienteDuplicado,
+    ['id', 'puntaje', ('motivos', lambda d: d.motivos.split(',') if d.motivos else []), 'estado', 'created_at'],
+    relaciones={'paciente': PACIENTE_RESUMEN, 'duplicado': PACIENTE_RESUMEN}
+)
@@ -190,3 +190,23 @@ def listar_roles():
             {'id': 'recepcion', 'nombre': 'Recepción', 'descripcion': 'Registro de pacientes y órdenes'},
         ]
     })
+
+
+@bp.route('/cache', methods=['GET'])
+@require_admin
+def estadisticas_cache():
+    """Contadores del cache de respuestas (hits, misses, evictions) de este proceso"""
+    from app.cache import cache_stats
+    return jsonify(cache_stats())
+
+
+@bp.route('/cache', methods=['DELETE'])
+@require_admin
+def limpiar_cache():
+    """Vaciar el cache, o solo una etiqueta con ?etiqueta=reportes"""
+    from app.cache import clear_cache, invalidate
+    etiqueta = sanitize_string(request.args.get('etiqueta', ''), max_length=50)
+    if etiqueta:
+        return jsonify({'success': True, 'invalidadas': invalidate(etiqueta)})
+    clear_cache()
+    return jsonify({'success': True, 'message': 'Cache vaciado'})
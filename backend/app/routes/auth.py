@@ -44,7 +44,7 @@ def login():
         db.session.commit()
 
         identity = str(usuario.id)
-        access_token = create_access_token(identity=identity)
+        access_token = create_access_token(identity=identity, additional_claims={'rol': usuario.rol})
         refresh_token = create_refresh_token(identity=identity)
 
         logger.info(f'Login exitoso: {username}')
@@ -63,7 +63,10 @@ def login():
 @jwt_required(refresh=True)
 def refresh():
     current_user_id = get_jwt_identity()
-    access_token = create_access_token(identity=current_user_id)
+    usuario = Usuario.query.get(int(current_user_id))
+    if not usuario or not usuario.activo:
+        return jsonify({'error': 'Usuario no encontrado'}), 404
+    access_token = create_access_token(identity=current_user_id, additional_claims={'rol': usuario.rol})
     return jsonify({'access_token': access_token})
 
 
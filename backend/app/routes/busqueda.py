@@ -1,81 +1,139 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
 from app import db
 from app.models import Paciente, Orden, Factura, Estudio
 from app.utils.validators import sanitize_string
+from app.utils.busqueda import buscar_texto
+from app.utils.paginacion import paginar_keyset
+from app.services.autocompletado import AutocompletadoService, FUENTES
 from sqlalchemy import or_, cast, String
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
 bp = Blueprint('busqueda', __name__)
 
 
-@bp.route('/global', methods=['GET'])
-@jwt_required()
-def busqueda_global():
-    """Búsqueda global en pacientes, órdenes y facturas"""
-    termino = sanitize_string(request.args.get('q', ''), max_length=100)
+# Hilos compartidos por las búsquedas globales de este worker; cada búsqueda
+# corre en su propio contexto de app y por lo tanto con su propia conexión del pool
+HILOS_BUSQUEDA = 6
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
 
-    if not termino or len(termino) < 2:
-        return jsonify({'error': 'Mínimo 2 caracteres para buscar'}), 400
 
-    search = f'%{termino}%'
-    resultados = {}
+def _get_ejecutor():
+    # Se crea al primer uso (después del fork de gunicorn)
+    global _ejecutor
+    if _ejecutor is None:
+        with _ejecutor_lock:
+            if _ejecutor is None:
+                _ejecutor = ThreadPoolExecutor(max_workers=HILOS_BUSQUEDA, thread_name_prefix='busqueda')
+    return _ejecutor
 
-    # Buscar pacientes
-    pacientes = Paciente.query.filter(
-        or_(
-            Paciente.nombre.ilike(search),
-            Paciente.apellido.ilike(search),
-            Paciente.cedula.ilike(search),
-            Paciente.telefono.ilike(search),
-            Paciente.celular.ilike(search),
-            Paciente.email.ilike(search),
-            Paciente.codigo_paciente.ilike(search)
-        )
+
+def _buscar_pacientes(termino):
+    # Columna normalizada con índice trigram
+    condicion, relevancia = buscar_texto(Paciente.busqueda, termino)
+    if condicion is None:
+        return []
+    pacientes = Paciente.query.filter(condicion).order_by(
+        relevancia.desc(), Paciente.id.desc()
     ).limit(10).all()
 
-    resultados['pacientes'] = [{
+    return [{
         'id': p.id,
         'cedula': p.cedula,
         'nombre': f"{p.nombre} {p.apellido}",
         'telefono': p.telefono or p.celular,
-        'codigo': p.codigo_paciente,
+        'codigo': f"P{p.id:06d}",
         'estado': p.estado
     } for p in pacientes]
 
-    # Buscar órdenes
-    ordenes = Orden.query.filter(
+
+def _buscar_ordenes(termino):
+    search = f'%{termino}%'
+    ordenes = db.session.query(
+        Orden.id, Orden.numero_orden, Orden.fecha_orden, Orden.estado,
+        Paciente.nombre, Paciente.apellido
+    ).outerjoin(
+        Paciente, Paciente.id == Orden.paciente_id
+    ).filter(
         or_(
             Orden.numero_orden.ilike(search),
             Orden.medico_referente.ilike(search)
         )
     ).order_by(Orden.fecha_orden.desc()).limit(10).all()
 
-    resultados['ordenes'] = [{
+    return [{
         'id': o.id,
         'numero_orden': o.numero_orden,
-        'paciente': f"{o.paciente.nombre} {o.paciente.apellido}" if o.paciente else 'N/A',
+        'paciente': f"{o.nombre} {o.apellido}" if o.nombre else 'N/A',
         'fecha': o.fecha_orden.isoformat(),
         'estado': o.estado
     } for o in ordenes]
 
-    # Buscar facturas
-    facturas = Factura.query.filter(
+
+def _buscar_facturas(termino):
+    search = f'%{termino}%'
+    facturas = db.session.query(
+        Factura.id, Factura.numero_factura, Factura.ncf, Factura.total, Factura.estado,
+        Paciente.nombre, Paciente.apellido
+    ).outerjoin(
+        Paciente, Paciente.id == Factura.paciente_id
+    ).filter(
         or_(
             Factura.numero_factura.ilike(search),
             Factura.ncf.ilike(search)
         )
     ).order_by(Factura.fecha_factura.desc()).limit(10).all()
 
-    resultados['facturas'] = [{
+    return [{
         'id': f.id,
         'numero_factura': f.numero_factura,
         'ncf': f.ncf,
-        'paciente': f"{f.paciente.nombre} {f.paciente.apellido}" if f.paciente else 'N/A',
+        'paciente': f"{f.nombre} {f.apellido}" if f.nombre else 'N/A',
         'total': float(f.total),
         'estado': f.estado
     } for f in facturas]
 
-    total = len(resultados['pacientes']) + len(resultados['ordenes']) + len(resultados['facturas'])
+
+BUSQUEDAS_GLOBALES = {
+    'pacientes': _buscar_pacientes,
+    'ordenes': _buscar_ordenes,
+    'facturas': _buscar_facturas,
+}
+
+
+def _en_contexto(app, buscar, termino):
+    with app.app_context():
+        return buscar(termino)
+
+
+@bp.route('/global', methods=['GET'])
+@jwt_required()
+def busqueda_global():
+    """Búsqueda global en pacientes, órdenes y facturas (?types=pacientes,ordenes,facturas)"""
+    termino = sanitize_string(request.args.get('q', ''), max_length=100)
+
+    if not termino or len(termino) < 2:
+        return jsonify({'error': 'Mínimo 2 caracteres para buscar'}), 400
+
+    tipos = [t for t in request.args.get('types', ','.join(BUSQUEDAS_GLOBALES)).split(',')
+             if t in BUSQUEDAS_GLOBALES]
+    if not tipos:
+        return jsonify({'error': f"types debe incluir: {', '.join(BUSQUEDAS_GLOBALES)}"}), 400
+
+    if len(tipos) == 1:
+        resultados = {tipos[0]: BUSQUEDAS_GLOBALES[tipos[0]](termino)}
+    else:
+        # Las búsquedas corren a la vez: la respuesta tarda lo que la más lenta
+        app = current_app._get_current_object()
+        futuros = {
+            tipo: _get_ejecutor().submit(_en_contexto, app, BUSQUEDAS_GLOBALES[tipo], termino)
+            for tipo in tipos
+        }
+        resultados = {tipo: futuro.result() for tipo, futuro in futuros.items()}
+
+    total = sum(len(r) for r in resultados.values())
 
     return jsonify({
         'termino': termino,
@@ -93,18 +151,13 @@ def buscar_pacientes():
     seguro = sanitize_string(request.args.get('seguro', ''), max_length=100)
 
     query = Paciente.query
+    claves = [Paciente.created_at, Paciente.id]
 
     if termino and len(termino) >= 2:
-        search = f'%{termino}%'
-        query = query.filter(
-            or_(
-                Paciente.nombre.ilike(search),
-                Paciente.apellido.ilike(search),
-                Paciente.cedula.ilike(search),
-                Paciente.codigo_paciente.ilike(search),
-                Paciente.telefono.ilike(search)
-            )
-        )
+        condicion, relevancia = buscar_texto(Paciente.busqueda, termino)
+        if condicion is not None:
+            query = query.filter(condicion)
+            claves = [relevancia, Paciente.id]
 
     if estado and estado in ('activo', 'inactivo'):
         query = query.filter(Paciente.estado == estado)
@@ -112,16 +165,52 @@ def buscar_pacientes():
     if seguro:
         query = query.filter(Paciente.seguro_medico.ilike(f'%{seguro}%'))
 
-    page = max(1, request.args.get('page', 1, type=int))
-    per_page = min(50, max(1, request.args.get('per_page', 20, type=int)))
+    return paginar_keyset(query, claves, 'pacientes')
 
-    result = query.order_by(Paciente.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
 
-    return jsonify({
-        'pacientes': [p.to_dict() for p in result.items],
-        'total': result.total,
-        'pages': result.pages,
-        'current_page': page
-    })
+@bp.route('/autocomplete', methods=['GET'])
+@jwt_required()
+def autocomplete():
+    """Sugerencias mientras se escribe (nombre/cédula de pacientes, código/nombre de estudios)"""
+    termino = sanitize_string(request.args.get('q', ''), max_length=100)
+    tipos = [t for t in request.args.get('types', ','.join(FUENTES)).split(',') if t in FUENTES]
+    limite = min(20, max(1, request.args.get('limit', 10, type=int)))
+
+    if not termino or not tipos:
+        return jsonify({'termino': termino, 'resultados': {t: [] for t in tipos}})
+
+    AutocompletadoService.iniciar(current_app._get_current_object())
+
+    if AutocompletadoService.listo():
+        return jsonify({
+            'termino': termino,
+            'fuente': 'indice',
+            'resultados': AutocompletadoService.buscar(termino, tipos, limite)
+        })
+
+    # El índice de este worker se está cargando: responder desde la base de datos
+    resultados = {}
+    if 'pacientes' in tipos:
+        condicion, relevancia = buscar_texto(Paciente.busqueda, termino)
+        pacientes = Paciente.query.filter(condicion).order_by(
+            relevancia.desc()
+        ).limit(limite).all() if condicion is not None else []
+        resultados['pacientes'] = [{
+            'id': p.id,
+            'nombre': f"{p.nombre} {p.apellido}",
+            'cedula': p.cedula
+        } for p in pacientes]
+    if 'estudios' in tipos:
+        search = f'{termino}%'
+        estudios = Estudio.query.filter(
+            Estudio.activo == True,
+            or_(Estudio.codigo.ilike(search), Estudio.nombre.ilike(search))
+        ).order_by(Estudio.nombre).limit(limite).all()
+        resultados['estudios'] = [{
+            'id': e.id,
+            'codigo': e.codigo,
+            'nombre': e.nombre,
+            'precio': float(e.precio)
+        } for e in estudios]
+
+    return jsonify({'termino': termino, 'fuente': 'base_datos', 'resultados': resultados})
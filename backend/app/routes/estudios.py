@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Estudio, CategoriaEstudio, Usuario
 from app.utils.validators import sanitize_string, sanitize_dict
+from app.cache import cached, invalidate
 from sqlalchemy import or_
 
 bp = Blueprint('estudios', __name__)
@@ -10,6 +11,7 @@ bp = Blueprint('estudios', __name__)
 
 @bp.route('/', methods=['GET'])
 @jwt_required()
+@cached(timeout=600, tags=('estudios',))
 def listar_estudios():
     categoria_id = request.args.get('categoria_id', type=int)
     buscar = sanitize_string(request.args.get('buscar', ''), max_length=100)
@@ -53,6 +55,7 @@ def listar_estudios():
 
 @bp.route('/<int:estudio_id>', methods=['GET'])
 @jwt_required()
+@cached(timeout=600, tags=('estudios',))
 def obtener_estudio(estudio_id):
     estudio = Estudio.query.get_or_404(estudio_id)
     return jsonify({
@@ -111,6 +114,7 @@ def crear_estudio():
 
     db.session.add(estudio)
     db.session.commit()
+    invalidate('estudios')
 
     return jsonify({'success': True, 'message': 'Estudio creado', 'estudio': estudio.to_dict()}), 201
 
@@ -150,11 +154,13 @@ def actualizar_estudio(estudio_id):
         estudio.costo = float(datos['costo']) if datos['costo'] else None
 
     db.session.commit()
+    invalidate('estudios')
     return jsonify({'success': True, 'message': 'Estudio actualizado', 'estudio': estudio.to_dict()})
 
 
 @bp.route('/categorias', methods=['GET'])
 @jwt_required()
+@cached(timeout=600, tags=('estudios',))
 def listar_categorias():
     categorias = CategoriaEstudio.query.filter_by(activo=True).order_by(CategoriaEstudio.nombre).all()
     return jsonify({
@@ -170,6 +176,7 @@ def listar_categorias():
 
 @bp.route('/precios', methods=['GET'])
 @jwt_required()
+@cached(timeout=600, tags=('estudios',))
 def lista_precios():
     """Lista de precios agrupada por categoría"""
     categorias = CategoriaEstudio.query.filter_by(activo=True).order_by(CategoriaEstudio.nombre).all()
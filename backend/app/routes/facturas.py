@@ -1,11 +1,15 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models import Factura, Pago, Paciente
+from app.models import Factura, Pago, Paciente, NCFHueco, LoteFacturacion
 from app.services.facturacion import FacturacionService
+from app.services.facturacion_lotes import FacturacionLoteService
+from app.services.ncf import NCFService
 from app.services.pdf_service import PDFService
-import os
-import tempfile
+from app.services.pdf_cache import PDFCache
+from app.models.serializacion import FACTURA_LISTADO
+from app.utils.paginacion import paginar_keyset
+import json
 
 bp = Blueprint('facturas', __name__)
 
@@ -17,8 +21,7 @@ def listar_facturas():
     query = Factura.query
     if estado:
         query = query.filter(Factura.estado == estado)
-    facturas = query.order_by(Factura.fecha_factura.desc()).limit(100).all()
-    return jsonify({'facturas': [f.to_dict() for f in facturas], 'total': len(facturas)})
+    return paginar_keyset(query, [Factura.fecha_factura, Factura.id], 'facturas', FACTURA_LISTADO)
 
 
 @bp.route('/<int:factura_id>', methods=['GET'])
@@ -38,12 +41,10 @@ def obtener_factura(factura_id):
         'monto': float(p.monto), 
         'metodo_pago': p.metodo_pago
     } for p in factura.pagos]
-    total_pagado = sum(float(p.monto) for p in factura.pagos)
     resultado = factura.to_dict()
     resultado['detalles'] = detalles
     resultado['pagos'] = pagos
-    resultado['total_pagado'] = total_pagado
-    resultado['saldo'] = float(factura.total) - total_pagado
+    resultado['total_pagado'] = float(factura.monto_pagado)
     return jsonify(resultado)
 
 
@@ -93,8 +94,72 @@ def registrar_pago(factura_id):
 @bp.route('/pendientes', methods=['GET'])
 @jwt_required()
 def facturas_pendientes():
-    facturas = Factura.query.filter(Factura.estado.in_(['pendiente', 'parcial'])).all()
-    return jsonify({'facturas': [f.to_dict() for f in facturas], 'total': len(facturas)})
+    facturas = FACTURA_LISTADO.preparar(Factura.query).filter(Factura.estado.in_(['pendiente', 'parcial'])).all()
+    return jsonify({'facturas': FACTURA_LISTADO.serializar(facturas), 'total': len(facturas)})
+
+
+def _avance_ndjson(lote_id):
+    """Eventos de avance del lote, uno por línea, a medida que se confirma cada tramo"""
+    eventos = (json.dumps(e, ensure_ascii=False, default=str) + '\n'
+               for e in FacturacionLoteService.procesar(lote_id))
+    return Response(stream_with_context(eventos), content_type='application/x-ndjson; charset=utf-8')
+
+
+@bp.route('/lotes', methods=['POST'])
+@jwt_required()
+def crear_lote():
+    """
+    Facturar en lote las órdenes sin factura de un seguro y/o rango de fechas.
+    Body: {"seguro_medico", "desde", "hasta", "tipo_comprobante": "B01", "incluir_itbis", "forma_pago"}
+    Responde NDJSON con el avance (inicio, progreso por tramo, fin).
+    """
+    datos = request.get_json() or {}
+    try:
+        lote = FacturacionLoteService.crear(datos, int(get_jwt_identity()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _avance_ndjson(lote.id)
+
+
+@bp.route('/lotes/<int:lote_id>/reanudar', methods=['POST'])
+@jwt_required()
+def reanudar_lote(lote_id):
+    """Continuar un lote interrumpido desde el último tramo confirmado"""
+    LoteFacturacion.query.get_or_404(lote_id)
+    return _avance_ndjson(lote_id)
+
+
+@bp.route('/lotes', methods=['GET'])
+@jwt_required()
+def listar_lotes():
+    query = LoteFacturacion.query
+    if request.args.get('estado'):
+        query = query.filter(LoteFacturacion.estado == request.args['estado'])
+    return paginar_keyset(query, [LoteFacturacion.id], 'lotes')
+
+
+@bp.route('/lotes/<int:lote_id>', methods=['GET'])
+@jwt_required()
+def obtener_lote(lote_id):
+    return jsonify(LoteFacturacion.query.get_or_404(lote_id).to_dict())
+
+
+@bp.route('/ncf/pronostico', methods=['GET'])
+@jwt_required()
+def pronostico_ncf():
+    """NCF disponibles por tipo y fecha estimada de agotamiento según el consumo reciente"""
+    dias = min(365, max(1, request.args.get('dias', 30, type=int)))
+    return jsonify({'dias_analizados': dias, 'tipos': NCFService.pronostico(dias)})
+
+
+@bp.route('/ncf/huecos', methods=['GET'])
+@jwt_required()
+def huecos_ncf():
+    """NCF reservados que no llegaron a una factura (para el reporte a la DGII)"""
+    query = NCFHueco.query
+    if request.args.get('tipo'):
+        query = query.filter(NCFHueco.tipo_comprobante == request.args['tipo'])
+    return paginar_keyset(query, [NCFHueco.fecha, NCFHueco.id], 'huecos')
 
 
 @bp.route('/<int:factura_id>/pdf', methods=['GET'])
@@ -102,17 +167,14 @@ def facturas_pendientes():
 def descargar_factura_pdf(factura_id):
     try:
         factura = Factura.query.get_or_404(factura_id)
-        
-        # Usar directorio temporal del sistema
-        pdf_filename = f'factura_{factura.numero_factura.replace("-", "_")}.pdf'
-        pdf_path = os.path.join(tempfile.gettempdir(), pdf_filename)
-        
-        PDFService.generar_factura_pdf(factura, pdf_path)
-        
+        pdf_path = PDFCache.obtener(
+            'factura', PDFCache.version_factura(factura),
+            lambda ruta: PDFService.generar_factura_pdf(factura, ruta)
+        )
         return send_file(
             pdf_path, 
             as_attachment=True, 
-            download_name=pdf_filename, 
+            download_name=f'factura_{factura.numero_factura.replace("-", "_")}.pdf', 
             mimetype='application/pdf'
         )
     except Exception as e:
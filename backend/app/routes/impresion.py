@@ -1,105 +1,132 @@
-from flask import Blueprint, request, jsonify, send_file
-from flask_jwt_extended import jwt_required
-from app import db
-from app.models import Factura, Orden, Pago, Paciente
-from app.services.impresion_termica import ImpresionTermica
-from app.services.pdf_service import PDFService
-import tempfile
 import os
+from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.services.render import RenderService
 
 bp = Blueprint('impresion', __name__)
 
+# Espera de los endpoints directos, por debajo del timeout del worker de gunicorn
+ESPERA_DESCARGA = 10
+
+
+def _enviar(tipo, parametros):
+    """
+    Generar el documento en el pool de render (carril mostrador) y enviarlo.
+    Si no termina a tiempo responde 202 con el trabajo, para seguir con
+    /trabajos/<id>/archivo; ReportLab nunca corre dentro del request.
+    """
+    try:
+        trabajo = RenderService.encolar(tipo, parametros, 'mostrador', int(get_jwt_identity()))
+    except OverflowError as e:
+        return jsonify({'error': str(e)}), 503
+    trabajo = RenderService.estado(trabajo['id'], ESPERA_DESCARGA) or trabajo
+    if trabajo['estado'] == 'error':
+        return jsonify({'error': trabajo['error']}), 404 if trabajo.get('no_encontrado') else 500
+    if trabajo['estado'] != 'listo':
+        return jsonify(_publico(trabajo)), 202
+    return _descargar(trabajo)
+
+
+def _descargar(trabajo):
+    if not os.path.exists(trabajo['ruta']):
+        # Podado del cache después de generarse: se vuelve a generar
+        return _enviar(trabajo['tipo'], trabajo['parametros'])
+    return send_file(
+        trabajo['ruta'],
+        mimetype='image/png' if trabajo['ruta'].endswith('.png') else 'application/pdf',
+        as_attachment=True,
+        download_name=trabajo['nombre']
+    )
+
+
+def _del_usuario(trabajo):
+    # Cada usuario solo ve sus trabajos; los ajenos se responden como inexistentes
+    return trabajo if trabajo and trabajo.get('usuario_id') == int(get_jwt_identity()) else None
+
+
+def _publico(trabajo):
+    # La ruta en disco no se expone al cliente
+    return {k: v for k, v in trabajo.items() if k != 'ruta'}
+
 
 @bp.route('/recibo-pago/<int:pago_id>', methods=['GET'])
 @jwt_required()
 def imprimir_recibo_pago(pago_id):
     """Generar recibo de pago para impresora 80mm"""
-    pago = Pago.query.get_or_404(pago_id)
-    factura = pago.factura
-    
-    if not factura:
-        return jsonify({'error': 'Factura no encontrada'}), 404
-    
-    pdf_buffer = ImpresionTermica.generar_recibo_pago(factura, pago)
-    
-    return send_file(
-        pdf_buffer,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'recibo_{pago_id}.pdf'
-    )
+    return _enviar('recibo_pago', {'pago_id': pago_id})
 
 
 @bp.route('/ticket-orden/<int:orden_id>', methods=['GET'])
 @jwt_required()
 def imprimir_ticket_orden(orden_id):
     """Generar ticket de orden para impresora 80mm"""
-    orden = Orden.query.get_or_404(orden_id)
-    
-    pdf_buffer = ImpresionTermica.generar_ticket_orden(orden)
-    
-    return send_file(
-        pdf_buffer,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'ticket_{orden.numero_orden}.pdf'
-    )
+    return _enviar('ticket_orden', {'orden_id': orden_id})
 
 
 @bp.route('/etiqueta/<int:orden_id>/<int:detalle_id>', methods=['GET'])
 @jwt_required()
 def imprimir_etiqueta(orden_id, detalle_id):
     """Generar etiqueta para muestra"""
-    from app.models import OrdenDetalle
-    
-    orden = Orden.query.get_or_404(orden_id)
-    detalle = OrdenDetalle.query.get_or_404(detalle_id)
-    paciente = orden.paciente
-    
-    estudio_nombre = detalle.estudio.nombre if detalle.estudio else 'Estudio'
-    
-    pdf_buffer = ImpresionTermica.generar_etiqueta_muestra(paciente, orden, estudio_nombre)
-    
-    return send_file(
-        pdf_buffer,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'etiqueta_{paciente.id}_{detalle_id}.pdf'
-    )
+    return _enviar('etiqueta', {'orden_id': orden_id, 'detalle_id': detalle_id})
 
 
 @bp.route('/factura/<int:factura_id>', methods=['GET'])
 @jwt_required()
 def imprimir_factura(factura_id):
     """Generar PDF de factura tamaño carta"""
-    factura = Factura.query.get_or_404(factura_id)
-    
-    pdf_path = os.path.join(tempfile.gettempdir(), f'factura_{factura.numero_factura}.pdf')
-    PDFService.generar_factura_pdf(factura, pdf_path)
-    
-    return send_file(
-        pdf_path,
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'factura_{factura.numero_factura}.pdf'
-    )
+    return _enviar('factura', {'factura_id': factura_id})
 
 
 @bp.route('/factura-termica/<int:factura_id>', methods=['GET'])
 @jwt_required()
 def imprimir_factura_termica(factura_id):
     """Generar factura para impresora 80mm"""
-    from app.services.impresion_service import ImpresionService
-    
-    factura = Factura.query.get_or_404(factura_id)
-    
+    return _enviar('factura_80mm', {'factura_id': factura_id})
+
+
+# =====================
+# Trabajos en segundo plano
+# =====================
+
+@bp.route('/trabajos', methods=['POST'])
+@jwt_required()
+def crear_trabajo():
+    """
+    Encolar un documento para generarlo fuera del request
+    Body: {"tipo": "factura", "parametros": {"factura_id": 1}, "prioridad": "mostrador|normal|lote"}
+    """
+    data = request.get_json() or {}
     try:
-        pdf_buffer = ImpresionService.generar_factura_80mm(factura)
-        return send_file(
-            pdf_buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'factura_{factura.numero_factura}_80mm.pdf'
+        trabajo = RenderService.encolar(
+            data.get('tipo'), data.get('parametros') or {},
+            data.get('prioridad', 'normal'), int(get_jwt_identity())
         )
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except OverflowError as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify(_publico(trabajo)), 202
+
+
+@bp.route('/trabajos/<trabajo_id>', methods=['GET'])
+@jwt_required()
+def estado_trabajo(trabajo_id):
+    """Estado del trabajo; ?esperar=N espera hasta N segundos a que termine"""
+    trabajo = _del_usuario(RenderService.estado(trabajo_id, request.args.get('esperar', 0, type=float)))
+    if not trabajo:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(_publico(trabajo))
+
+
+@bp.route('/trabajos/<trabajo_id>/archivo', methods=['GET'])
+@jwt_required()
+def archivo_trabajo(trabajo_id):
+    """Descargar el documento generado"""
+    trabajo = _del_usuario(RenderService.estado(trabajo_id, request.args.get('esperar', 0, type=float)))
+    if not trabajo:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if trabajo['estado'] == 'error':
+        return jsonify(_publico(trabajo)), 422
+    if trabajo['estado'] != 'listo':
+        return jsonify(_publico(trabajo)), 409
+    return _descargar(trabajo)
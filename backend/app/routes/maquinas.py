@@ -1,66 +1,53 @@
 from flask import Blueprint, request, jsonify
-import psycopg2
-import os
-import json
 from datetime import datetime
+from app.services.ingesta import IngestaService, nuevo_id
 
 bp = Blueprint('maquinas', __name__)
 
-def get_db_connection():
-    return psycopg2.connect(os.getenv('DATABASE_URL'))
-
 @bp.route('/recibir-json', methods=['POST'])
 def recibir_resultado_json():
-    """Recibir resultados en formato JSON desde máquinas"""
+    """Recibir resultados en formato JSON desde máquinas (se guardan por lotes en segundo plano)"""
     try:
         data = request.json
-        
+
         paciente_id = data.get('paciente_id')
         orden_id = data.get('orden_id')
+        accesion = data.get('accesion')  # código del tubo: ubica el estudio exacto de la orden
         valores = data.get('valores', {})
-        
-        if not paciente_id or not orden_id:
-            return jsonify({'error': 'paciente_id y orden_id requeridos'}), 400
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT id FROM orden_detalles WHERE orden_id = %s ORDER BY id DESC LIMIT 1", (orden_id,))
-        row = cur.fetchone()
-        
-        if not row:
-            return jsonify({'error': 'Orden no encontrada'}), 404
-        
-        orden_detalle_id = row[0]
-        
-        cur.execute("""
-            INSERT INTO resultados (
-                orden_detalle_id, tipo_archivo, nombre_archivo, datos_dicom,
-                estado_validacion, fecha_importacion, created_at
-            ) VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-            RETURNING id
-        """, (
-            orden_detalle_id,
-            'json',
-            f'resultado_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json',
-            json.dumps(valores),
-            'pendiente'
-        ))
-        
-        resultado_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+
+        if not paciente_id or not (orden_id or accesion):
+            return jsonify({'error': 'paciente_id y orden_id (o accesion) requeridos'}), 400
+
+        try:
+            fecha_muestra = datetime.fromisoformat(data['fecha_muestra']) if data.get('fecha_muestra') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'fecha_muestra en formato ISO (YYYY-MM-DDTHH:MM)'}), 400
+
+        id_ingesta = IngestaService.recibir({
+            # Con id_mensaje, un reintento del equipo no duplica el resultado
+            'id_ingesta': nuevo_id(f"envio|{data['id_mensaje']}") if data.get('id_mensaje') else nuevo_id(),
+            'orden': str(orden_id or ''),
+            'muestras': [str(accesion)] if accesion else [],
+            'tipo_archivo': 'json',
+            'fecha_muestra': fecha_muestra.isoformat() if fecha_muestra else None,
+            'nombre_archivo': f'resultado_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json',
+            'valores': valores
+        })
+
         return jsonify({
             'success': True,
-            'resultado_id': resultado_id,
+            'id_ingesta': id_ingesta,
             'message': 'Resultado recibido'
-        }), 201
-        
+        }), 202
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/ingesta/<id_ingesta>', methods=['GET'])
+def estado_ingesta(id_ingesta):
+    """Saber si un resultado recibido ya quedó guardado (pendiente | guardado | rechazado)"""
+    return jsonify(IngestaService.estado(id_ingesta)), 200
+
 @bp.route('/estado', methods=['GET'])
 def estado_servicio():
     """Estado del servicio"""
@@ -69,6 +56,7 @@ def estado_servicio():
         'servicio': 'Integración Máquinas',
         'endpoints': {
             'json': '/api/maquinas/recibir-json',
+            'ingesta': '/api/maquinas/ingesta/<id_ingesta>',
             'estado': '/api/maquinas/estado'
         }
     }), 200
@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models import Orden, OrdenDetalle, Paciente, Estudio
-from sqlalchemy import text
+from app.models import Orden
+from app.models.serializacion import ORDEN_LISTADO
+from app.services.ordenes import OrdenService, MAX_ORDENES_LOTE
+from app.utils.paginacion import paginar_keyset
 
 bp = Blueprint('ordenes', __name__)
 
@@ -13,8 +15,7 @@ def listar_ordenes():
     query = Orden.query
     if estado:
         query = query.filter(Orden.estado == estado)
-    ordenes = query.order_by(Orden.fecha_orden.desc()).limit(50).all()
-    return jsonify({'ordenes': [o.to_dict() for o in ordenes], 'total': len(ordenes)})
+    return paginar_keyset(query, [Orden.fecha_orden, Orden.id], 'ordenes', ORDEN_LISTADO)
 
 @bp.route('/<int:orden_id>', methods=['GET'])
 @jwt_required()
@@ -24,6 +25,7 @@ def obtener_orden(orden_id):
     for detalle in orden.detalles:
         detalles.append({
             'id': detalle.id,
+            'accesion': detalle.accesion,
             'estudio': detalle.estudio.to_dict() if detalle.estudio else None,
             'precio': float(detalle.precio),
             'descuento': float(detalle.descuento),
@@ -42,37 +44,50 @@ def crear_orden():
         usuario_id = int(get_jwt_identity())
         if not datos.get('paciente_id') or not datos.get('estudios'):
             return jsonify({'error': 'paciente_id y estudios requeridos'}), 400
-        resultado = db.session.execute(text("SELECT generar_numero_orden()"))
-        numero_orden = resultado.scalar()
-        orden = Orden()
-        orden.numero_orden = numero_orden
-        orden.paciente_id = datos['paciente_id']
-        orden.medico_referente = datos.get('medico_referente', '')
-        orden.prioridad = datos.get('prioridad', 'normal')
-        orden.usuario_registro_id = usuario_id
-        orden.estado = 'pendiente'
-        db.session.add(orden)
-        db.session.flush()
-        total_orden = 0
-        for est in datos['estudios']:
-            estudio = Estudio.query.get(est['estudio_id'])
-            if not estudio:
-                db.session.rollback()
-                return jsonify({'error': f'Estudio no encontrado'}), 404
-            descuento = float(est.get('descuento', 0))
-            precio = float(estudio.precio)
-            precio_final = precio - descuento
-            detalle = OrdenDetalle()
-            detalle.orden_id = orden.id
-            detalle.estudio_id = est['estudio_id']
-            detalle.precio = precio
-            detalle.descuento = descuento
-            detalle.precio_final = precio_final
-            detalle.estado = 'pendiente'
-            db.session.add(detalle)
-            total_orden += precio_final
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Orden creada', 'orden': orden.to_dict(), 'total': float(total_orden)}), 201
+        creadas, errores = OrdenService.crear_ordenes([datos], usuario_id, todo_o_nada=True)
+        if errores:
+            error = errores[0]['error']
+            return jsonify({'error': error}), 404 if 'no encontrado' in error else 400
+        orden = Orden.query.get(creadas[0]['id'])
+        return jsonify({'success': True, 'message': 'Orden creada', 'orden': orden.to_dict(), 'total': creadas[0]['total']}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/lote', methods=['POST'])
+@jwt_required()
+def crear_ordenes_lote():
+    """
+    Crear muchas órdenes en una transacción (jornadas corporativas).
+    Body: {"ordenes": [{"paciente_id", "estudios": [{"estudio_id", "descuento"}], "medico_referente", "prioridad"}]}
+    o los mismos estudios para varios pacientes: {"pacientes": [ids], "estudios": [...], "medico_referente"}
+    Con "todo_o_nada": true no se crea ninguna si alguna tiene errores.
+    """
+    try:
+        datos = request.get_json() or {}
+        usuario_id = int(get_jwt_identity())
+        if 'ordenes' in datos:
+            items = datos['ordenes']
+        else:
+            items = [{
+                'paciente_id': paciente_id,
+                'estudios': datos.get('estudios'),
+                'medico_referente': datos.get('medico_referente', ''),
+                'prioridad': datos.get('prioridad', 'normal')
+            } for paciente_id in datos.get('pacientes', [])]
+        if not items or not isinstance(items, list):
+            return jsonify({'error': 'ordenes o pacientes requeridos'}), 400
+        if len(items) > MAX_ORDENES_LOTE:
+            return jsonify({'error': f'Máximo {MAX_ORDENES_LOTE} órdenes por lote'}), 400
+
+        creadas, errores = OrdenService.crear_ordenes(items, usuario_id, bool(datos.get('todo_o_nada')))
+        return jsonify({
+            'success': bool(creadas),
+            'creadas': creadas,
+            'errores': errores,
+            'total_creadas': len(creadas),
+            'total_errores': len(errores)
+        }), 201 if creadas else 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -80,5 +95,7 @@ def crear_orden():
 @bp.route('/pendientes', methods=['GET'])
 @jwt_required()
 def ordenes_pendientes():
-    ordenes = Orden.query.filter(Orden.estado.in_(['pendiente', 'en_proceso'])).order_by(Orden.fecha_orden.desc()).all()
-    return jsonify({'ordenes': [o.to_dict() for o in ordenes], 'total': len(ordenes)})
+    ordenes = ORDEN_LISTADO.preparar(Orden.query).filter(
+        Orden.estado.in_(['pendiente', 'en_proceso'])
+    ).order_by(Orden.fecha_orden.desc()).all()
+    return jsonify({'ordenes': ORDEN_LISTADO.serializar(ordenes), 'total': len(ordenes)})
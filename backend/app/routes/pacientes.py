@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models import Paciente
-from app.utils.validators import sanitize_string, sanitize_dict, validate_cedula, validate_email, validate_phone, validate_pagination
+from app.models import Paciente, PacienteDuplicado
+from app.utils.validators import sanitize_string, sanitize_dict, validate_cedula, validate_email, validate_phone
+from app.utils.busqueda import buscar_texto
+from app.models.serializacion import DUPLICADO_LISTADO
+from app.utils.paginacion import paginar_keyset
+from app.services.duplicados import DuplicadosService, UMBRAL_DUPLICADO
 from datetime import datetime
-from sqlalchemy import or_
 import random
 import string
 import bcrypt
@@ -15,28 +18,16 @@ bp = Blueprint('pacientes', __name__)
 @bp.route('/', methods=['GET'])
 @jwt_required()
 def listar_pacientes():
-    page, per_page = validate_pagination()
     buscar = sanitize_string(request.args.get('buscar', ''), max_length=100)
 
     query = Paciente.query
+    claves = [Paciente.created_at, Paciente.id]
     if buscar:
-        # Uso seguro con parámetros - NO concatenación de strings
-        search_term = f'%{buscar}%'
-        query = query.filter(
-            or_(
-                Paciente.nombre.ilike(search_term),
-                Paciente.apellido.ilike(search_term),
-                Paciente.cedula.ilike(search_term)
-            )
-        )
-    query = query.order_by(Paciente.created_at.desc())
-    pacientes = query.paginate(page=page, per_page=per_page, error_out=False)
-    return jsonify({
-        'pacientes': [p.to_dict() for p in pacientes.items],
-        'total': pacientes.total,
-        'pages': pacientes.pages,
-        'current_page': page
-    })
+        condicion, relevancia = buscar_texto(Paciente.busqueda, buscar)
+        if condicion is not None:
+            query = query.filter(condicion)
+            claves = [relevancia, Paciente.id]
+    return paginar_keyset(query, claves, 'pacientes')
 
 
 @bp.route('/<int:paciente_id>', methods=['GET'])
@@ -107,12 +98,28 @@ def crear_paciente():
             except (ValueError, TypeError):
                 return jsonify({'error': 'Formato de fecha inválido. Use YYYY-MM-DD'}), 400
 
+        # Posibles duplicados (mismo nombre fonético, fecha de nacimiento, teléfono...)
+        candidatos = DuplicadosService.buscar_candidatos(paciente)
+
         db.session.add(paciente)
+        db.session.flush()
+        DuplicadosService.registrar_pares([
+            (paciente.id, otro.id, puntaje, motivos)
+            for otro, puntaje, motivos in candidatos if puntaje >= UMBRAL_DUPLICADO
+        ])
         db.session.commit()
         return jsonify({
             'success': True,
             'message': 'Paciente creado',
-            'paciente': paciente.to_dict()
+            'paciente': paciente.to_dict(),
+            'posibles_duplicados': [{
+                'id': otro.id,
+                'nombre': f"{otro.nombre} {otro.apellido}",
+                'cedula': otro.cedula,
+                'fecha_nacimiento': otro.fecha_nacimiento.isoformat() if otro.fecha_nacimiento else None,
+                'puntaje': puntaje,
+                'motivos': motivos
+            } for otro, puntaje, motivos in candidatos]
         }), 201
 
     except Exception as e:
@@ -192,3 +199,34 @@ def generar_credenciales(paciente_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Error al generar credenciales'}), 500
+
+
+@bp.route('/duplicados', methods=['GET'])
+@jwt_required()
+def listar_duplicados():
+    """Pares de posibles duplicados para revisar (?estado=pendiente|confirmado|descartado)"""
+    estado = sanitize_string(request.args.get('estado', 'pendiente'), max_length=20)
+
+    query = PacienteDuplicado.query
+    if estado in ('pendiente', 'confirmado', 'descartado'):
+        query = query.filter(PacienteDuplicado.estado == estado)
+
+    return paginar_keyset(query, [PacienteDuplicado.puntaje, PacienteDuplicado.id], 'duplicados',
+                          DUPLICADO_LISTADO)
+
+
+@bp.route('/duplicados/<int:par_id>', methods=['PUT'])
+@jwt_required()
+def revisar_duplicado(par_id):
+    """Marcar un par como confirmado (misma persona) o descartado"""
+    par = PacienteDuplicado.query.get_or_404(par_id)
+    datos = request.get_json() or {}
+
+    if datos.get('estado') not in ('confirmado', 'descartado', 'pendiente'):
+        return jsonify({'error': 'estado debe ser confirmado, descartado o pendiente'}), 400
+
+    par.estado = datos['estado']
+    par.revisado_por = int(get_jwt_identity())
+    db.session.commit()
+
+    return jsonify({'success': True, 'duplicado': par.to_dict()})
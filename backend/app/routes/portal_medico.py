@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from app import db
-from app.models import Paciente, Orden, Resultado, Factura
+from app.models import Paciente
 from app.utils.validators import sanitize_string
-from sqlalchemy import or_
+from app.utils.busqueda import buscar_texto
+from app.utils.paginacion import codificar_cursor, decodificar_cursor
+from app.services.historial import HistorialService
 
 bp = Blueprint('portal_medico', __name__)
 
@@ -11,31 +13,18 @@ bp = Blueprint('portal_medico', __name__)
 @bp.route('/historial/<int:paciente_id>', methods=['GET'])
 @jwt_required()
 def historial_paciente(paciente_id):
-    """Historial completo del paciente para médicos"""
+    """Historial del paciente para médicos (?limit=50&after=<cursor> para ver más atrás)"""
     paciente = Paciente.query.get_or_404(paciente_id)
+    limite = min(200, max(1, request.args.get('limit', 50, type=int)))
 
-    ordenes = Orden.query.filter_by(
-        paciente_id=paciente_id
-    ).order_by(Orden.fecha_orden.desc()).all()
+    despues_de = None
+    if request.args.get('after'):
+        try:
+            despues_de = decodificar_cursor(request.args['after'], 2)
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
 
-    facturas = Factura.query.filter_by(
-        paciente_id=paciente_id
-    ).order_by(Factura.fecha_factura.desc()).all()
-
-    resultados = []
-    for orden in ordenes:
-        for detalle in orden.detalles:
-            if detalle.resultado_disponible:
-                resultado = Resultado.query.filter_by(
-                    orden_detalle_id=detalle.id
-                ).first()
-                if resultado:
-                    resultados.append({
-                        'fecha': resultado.fecha_importacion.isoformat(),
-                        'estudio': detalle.estudio.nombre if detalle.estudio else 'N/A',
-                        'tipo': resultado.tipo_archivo,
-                        'id': resultado.id
-                    })
+    datos, siguiente = HistorialService.linea_de_tiempo(paciente_id, limite, despues_de)
 
     return jsonify({
         'paciente': {
@@ -48,12 +37,10 @@ def historial_paciente(paciente_id):
             'tipo_sangre': paciente.tipo_sangre,
             'alergias': paciente.alergias
         },
-        'ordenes': [o.to_dict() for o in ordenes],
-        'facturas': [f.to_dict() for f in facturas],
-        'resultados': resultados,
-        'total_ordenes': len(ordenes),
-        'total_facturas': len(facturas),
-        'total_resultados': len(resultados)
+        **datos,
+        **HistorialService.totales(paciente_id),
+        'hay_mas': siguiente is not None,
+        'siguiente': codificar_cursor(siguiente) if siguiente else None
     })
 
 
@@ -66,14 +53,12 @@ def buscar_paciente_medico():
     if not termino or len(termino) < 2:
         return jsonify({'pacientes': []})
 
-    search_term = f'%{termino}%'
+    condicion, relevancia = buscar_texto(Paciente.busqueda, termino)
+    if condicion is None:
+        return jsonify({'pacientes': []})
 
-    pacientes = Paciente.query.filter(
-        or_(
-            Paciente.nombre.ilike(search_term),
-            Paciente.apellido.ilike(search_term),
-            Paciente.cedula.ilike(search_term),
-        )
+    pacientes = Paciente.query.filter(condicion).order_by(
+        relevancia.desc(), Paciente.id.desc()
     ).limit(10).all()
 
     return jsonify({
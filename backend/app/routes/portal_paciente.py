@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from app import db
 from app.models import Paciente, Factura, Resultado, Orden
+from app.models.serializacion import FACTURA_LISTADO
 from app.utils.validators import sanitize_string
 from sqlalchemy import text
 import bcrypt
@@ -120,11 +121,11 @@ def mis_facturas():
     current_id = get_jwt_identity()
     paciente_id = int(current_id)
 
-    facturas = Factura.query.filter_by(
+    facturas = FACTURA_LISTADO.preparar(Factura.query).filter_by(
         paciente_id=paciente_id
     ).order_by(Factura.fecha_factura.desc()).all()
 
     return jsonify({
-        'facturas': [f.to_dict() for f in facturas],
+        'facturas': FACTURA_LISTADO.serializar(facturas),
         'total': len(facturas)
     })
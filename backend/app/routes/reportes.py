@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, send_file, stream_with_context
 from flask_jwt_extended import jwt_required
 from app import db
-from app.models import Factura, Orden, Paciente, Estudio, Pago, OrdenDetalle
+from app.models import Factura, Orden, Paciente, Estudio, CategoriaEstudio, Pago, OrdenDetalle, ResumenDiario
+from app.services.resumenes import ResumenService
+from app.services.reportes_fiscales import ReporteFiscalService
 from app.utils.validators import sanitize_string
-from sqlalchemy import func, extract, text, and_, or_
+from app.utils.exportacion import formato_exportacion, respuesta_streaming
+from app.cache import cached
+from sqlalchemy import func, extract, text, and_, or_, case, literal
 from datetime import datetime, timedelta
 from decimal import Decimal
 
@@ -12,110 +16,38 @@ bp = Blueprint('reportes', __name__)
 
 @bp.route('/dashboard', methods=['GET'])
 @jwt_required()
+@cached(timeout=60, tags=('reportes',), stale=300)
 def dashboard():
     """Dashboard principal con todas las estadísticas"""
     hoy = datetime.now().date()
+    manana = hoy + timedelta(days=1)
     inicio_mes = hoy.replace(day=1)
-    inicio_semana = hoy - timedelta(days=hoy.weekday())
 
     # ========== PACIENTES ==========
-    total_pacientes = Paciente.query.filter_by(estado='activo').count()
-
-    pacientes_hoy = Paciente.query.filter(
-        func.date(Paciente.created_at) == hoy
-    ).count()
-
-    pacientes_mes = Paciente.query.filter(
-        Paciente.created_at >= inicio_mes
-    ).count()
+    total_pacientes, pacientes_hoy, pacientes_mes = db.session.query(
+        func.count(Paciente.id).filter(Paciente.estado == 'activo'),
+        func.count(Paciente.id).filter(Paciente.created_at >= hoy, Paciente.created_at < manana),
+        func.count(Paciente.id).filter(Paciente.created_at >= inicio_mes)
+    ).one()
 
     # ========== ÓRDENES ==========
-    ordenes_pendientes = Orden.query.filter(
-        Orden.estado.in_(['pendiente', 'en_proceso'])
-    ).count()
-
-    ordenes_hoy = Orden.query.filter(
-        func.date(Orden.fecha_orden) == hoy
-    ).count()
-
-    ordenes_mes = Orden.query.filter(
-        Orden.fecha_orden >= inicio_mes
-    ).count()
-
-    # ========== FACTURAS ==========
-    facturas_mes = Factura.query.filter(
-        Factura.fecha_factura >= inicio_mes,
-        Factura.estado != 'anulada'
-    ).all()
-
-    total_facturado_mes = sum(float(f.total) for f in facturas_mes)
-    facturas_pendientes = len([f for f in facturas_mes if f.estado in ('pendiente', 'parcial')])
-    facturas_pagadas = len([f for f in facturas_mes if f.estado == 'pagada'])
+    ordenes_pendientes, ordenes_hoy, ordenes_mes = db.session.query(
+        func.count(Orden.id).filter(Orden.estado.in_(['pendiente', 'en_proceso'])),
+        func.count(Orden.id).filter(Orden.fecha_orden >= hoy, Orden.fecha_orden < manana),
+        func.count(Orden.id).filter(Orden.fecha_orden >= inicio_mes)
+    ).one()
 
-    # ========== INGRESOS ==========
-    ingresos_hoy = db.session.query(
-        func.coalesce(func.sum(Pago.monto), 0)
-    ).filter(
-        func.date(Pago.fecha_pago) == hoy
-    ).scalar()
-
-    ingresos_mes = db.session.query(
-        func.coalesce(func.sum(Pago.monto), 0)
-    ).filter(
-        Pago.fecha_pago >= inicio_mes
-    ).scalar()
-
-    ingresos_semana = db.session.query(
-        func.coalesce(func.sum(Pago.monto), 0)
-    ).filter(
-        Pago.fecha_pago >= inicio_semana
-    ).scalar()
+    # ========== FACTURAS, INGRESOS Y ESTUDIOS (tablas de resumen) ==========
+    resumen = ResumenService.dashboard(hoy)
 
     # ========== CUENTAS POR COBRAR ==========
-    facturas_con_saldo = Factura.query.filter(
+    cuentas_por_cobrar = db.session.query(
+        func.coalesce(func.sum(Factura.saldo), 0)
+    ).filter(
         Factura.estado.in_(['pendiente', 'parcial'])
-    ).all()
-
-    cuentas_por_cobrar = 0
-    for f in facturas_con_saldo:
-        pagado = sum(float(p.monto) for p in f.pagos)
-        cuentas_por_cobrar += float(f.total) - pagado
+    ).scalar()
 
-    # ========== ESTUDIOS MÁS SOLICITADOS ==========
-    estudios_populares = db.session.query(
-        Estudio.nombre,
-        func.count(OrdenDetalle.id).label('cantidad')
-    ).join(
-        OrdenDetalle, Estudio.id == OrdenDetalle.estudio_id
-    ).group_by(
-        Estudio.nombre
-    ).order_by(
-        func.count(OrdenDetalle.id).desc()
-    ).limit(5).all()
-
-    # ========== INGRESOS POR DÍA (últimos 7 días) ==========
-    ingresos_diarios = []
-    for i in range(6, -1, -1):
-        dia = hoy - timedelta(days=i)
-        ingreso = db.session.query(
-            func.coalesce(func.sum(Pago.monto), 0)
-        ).filter(
-            func.date(Pago.fecha_pago) == dia
-        ).scalar()
-        ingresos_diarios.append({
-            'fecha': dia.isoformat(),
-            'dia': dia.strftime('%a'),
-            'monto': float(ingreso)
-        })
-
-    # ========== INGRESOS POR MÉTODO DE PAGO ==========
-    pagos_por_metodo = db.session.query(
-        Pago.metodo_pago,
-        func.sum(Pago.monto).label('total'),
-        func.count(Pago.id).label('cantidad')
-    ).filter(
-        Pago.fecha_pago >= inicio_mes
-    ).group_by(Pago.metodo_pago).all()
+    resumen['facturacion']['cuentas_por_cobrar'] = float(cuentas_por_cobrar)
 
     return jsonify({
         'fecha': hoy.isoformat(),
@@ -129,32 +61,16 @@ def dashboard():
             'hoy': ordenes_hoy,
             'mes': ordenes_mes
         },
-        'facturacion': {
-            'total_mes': total_facturado_mes,
-            'facturas_mes': len(facturas_mes),
-            'pendientes': facturas_pendientes,
-            'pagadas': facturas_pagadas,
-            'cuentas_por_cobrar': cuentas_por_cobrar
-        },
-        'ingresos': {
-            'hoy': float(ingresos_hoy),
-            'semana': float(ingresos_semana),
-            'mes': float(ingresos_mes),
-            'diarios': ingresos_diarios
-        },
-        'estudios_populares': [
-            {'nombre': nombre, 'cantidad': cantidad}
-            for nombre, cantidad in estudios_populares
-        ],
-        'pagos_por_metodo': [
-            {'metodo': metodo, 'total': float(total), 'cantidad': cantidad}
-            for metodo, total, cantidad in pagos_por_metodo
-        ]
+        'facturacion': resumen['facturacion'],
+        'ingresos': resumen['ingresos'],
+        'estudios_populares': resumen['estudios_populares'],
+        'pagos_por_metodo': resumen['pagos_por_metodo']
     })
 
 
 @bp.route('/ventas', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',))
 def reporte_ventas():
     """Reporte de ventas con filtros"""
     fecha_inicio = request.args.get('fecha_inicio')
@@ -171,23 +87,58 @@ def reporte_ventas():
         except ValueError:
             return jsonify({'error': 'Formato de fecha inválido. Use YYYY-MM-DD'}), 400
 
-    facturas = Factura.query.filter(
+    en_periodo = and_(
         Factura.fecha_factura >= fecha_inicio_dt,
         Factura.fecha_factura <= fecha_fin_dt,
         Factura.estado != 'anulada'
-    ).order_by(Factura.fecha_factura.desc()).all()
+    )
+
+    facturas = db.session.query(
+        Factura.id,
+        Factura.numero_factura,
+        Factura.ncf,
+        Factura.fecha_factura,
+        Paciente.nombre,
+        Paciente.apellido,
+        Factura.total,
+        Factura.estado
+    ).outerjoin(
+        Paciente, Paciente.id == Factura.paciente_id
+    ).filter(en_periodo).order_by(Factura.fecha_factura.desc())
 
-    total_ventas = sum(float(f.total) for f in facturas)
-    total_itbis = sum(float(f.itbis) for f in facturas)
-    total_descuentos = sum(float(f.descuento) for f in facturas)
+    def fila(f):
+        return {
+            'id': f.id,
+            'numero': f.numero_factura,
+            'ncf': f.ncf,
+            'fecha': f.fecha_factura.isoformat(),
+            'paciente': f"{f.nombre} {f.apellido}" if f.nombre else 'N/A',
+            'total': float(f.total),
+            'estado': f.estado
+        }
+
+    formato = formato_exportacion()
+    if formato:
+        return respuesta_streaming(
+            (fila(f) for f in facturas.yield_per(1000)),
+            ['id', 'numero', 'ncf', 'fecha', 'paciente', 'total', 'estado'],
+            formato, 'ventas'
+        )
+
+    total_ventas, total_itbis, total_descuentos, cantidad_facturas = db.session.query(
+        func.coalesce(func.sum(Factura.total), 0),
+        func.coalesce(func.sum(Factura.itbis), 0),
+        func.coalesce(func.sum(Factura.descuento), 0),
+        func.count(Factura.id)
+    ).filter(en_periodo).one()
 
     # Pagos en el período
-    pagos = Pago.query.filter(
+    total_cobrado = db.session.query(
+        func.coalesce(func.sum(Pago.monto), 0)
+    ).filter(
         Pago.fecha_pago >= fecha_inicio_dt,
         Pago.fecha_pago <= fecha_fin_dt
-    ).all()
-
-    total_cobrado = sum(float(p.monto) for p in pagos)
+    ).scalar()
 
     return jsonify({
         'periodo': {
@@ -195,70 +146,110 @@ def reporte_ventas():
             'fin': fecha_fin_dt.isoformat()
         },
         'resumen': {
-            'total_ventas': total_ventas,
-            'total_itbis': total_itbis,
-            'total_descuentos': total_descuentos,
-            'total_cobrado': total_cobrado,
-            'cantidad_facturas': len(facturas)
+            'total_ventas': float(total_ventas),
+            'total_itbis': float(total_itbis),
+            'total_descuentos': float(total_descuentos),
+            'total_cobrado': float(total_cobrado),
+            'cantidad_facturas': cantidad_facturas
         },
-        'facturas': [{
-            'id': f.id,
-            'numero': f.numero_factura,
-            'ncf': f.ncf,
-            'fecha': f.fecha_factura.isoformat(),
-            'paciente': f"{f.paciente.nombre} {f.paciente.apellido}" if f.paciente else 'N/A',
-            'total': float(f.total),
-            'estado': f.estado
-        } for f in facturas]
+        'facturas': [fila(f) for f in facturas]
     })
 
 
-@bp.route('/cuentas-por-cobrar', methods=['GET'])
-@jwt_required()
-def cuentas_por_cobrar():
-    """Reporte de cuentas por cobrar"""
-    facturas = Factura.query.filter(
-        Factura.estado.in_(['pendiente', 'parcial'])
-    ).order_by(Factura.fecha_factura.asc()).all()
+TRAMOS_ANTIGUEDAD = ['al_dia', '1-30', '31-60', '61-90', '90+']
 
-    resultado = []
-    total_por_cobrar = 0
 
-    for f in facturas:
-        pagado = sum(float(p.monto) for p in f.pagos)
-        saldo = float(f.total) - pagado
-        dias_vencido = 0
+def _dias_vencido(hoy):
+    """Días de atraso de una factura calculados en SQL (0 si no ha vencido)"""
+    return func.coalesce(func.greatest(literal(hoy, db.Date) - Factura.fecha_vencimiento, 0), 0)
 
-        if f.fecha_vencimiento:
-            dias_vencido = (datetime.now().date() - f.fecha_vencimiento).days
-            if dias_vencido < 0:
-                dias_vencido = 0
 
-        total_por_cobrar += saldo
+def _tramo_antiguedad(dias_vencido):
+    return case(
+        (dias_vencido == 0, 'al_dia'),
+        (dias_vencido <= 30, '1-30'),
+        (dias_vencido <= 60, '31-60'),
+        (dias_vencido <= 90, '61-90'),
+        else_='90+'
+    )
 
-        resultado.append({
+
+@bp.route('/cuentas-por-cobrar', methods=['GET'])
+@jwt_required()
+@cached(timeout=300, tags=('reportes',))
+def cuentas_por_cobrar():
+    """Reporte de cuentas por cobrar"""
+    hoy = datetime.now().date()
+    dias_vencido = _dias_vencido(hoy)
+    tramo = _tramo_antiguedad(dias_vencido)
+    pendientes = Factura.estado.in_(['pendiente', 'parcial'])
+
+    facturas = db.session.query(
+        Factura.id,
+        Factura.numero_factura,
+        Paciente.nombre,
+        Paciente.apellido,
+        Paciente.telefono,
+        Factura.fecha_factura,
+        Factura.fecha_vencimiento,
+        Factura.total,
+        Factura.monto_pagado,
+        Factura.saldo,
+        Factura.estado,
+        dias_vencido.label('dias_vencido'),
+        tramo.label('tramo')
+    ).outerjoin(
+        Paciente, Paciente.id == Factura.paciente_id
+    ).filter(pendientes).order_by(Factura.fecha_factura.asc())
+
+    def fila(f):
+        return {
             'factura_id': f.id,
             'numero_factura': f.numero_factura,
-            'paciente': f"{f.paciente.nombre} {f.paciente.apellido}" if f.paciente else 'N/A',
-            'paciente_telefono': f.paciente.telefono if f.paciente else None,
+            'paciente': f"{f.nombre} {f.apellido}" if f.nombre else 'N/A',
+            'paciente_telefono': f.telefono,
             'fecha_factura': f.fecha_factura.isoformat(),
             'fecha_vencimiento': f.fecha_vencimiento.isoformat() if f.fecha_vencimiento else None,
             'total': float(f.total),
-            'pagado': pagado,
-            'saldo': saldo,
-            'dias_vencido': dias_vencido,
-            'estado': 'vencida' if dias_vencido > 0 else f.estado
-        })
+            'pagado': float(f.monto_pagado),
+            'saldo': float(f.saldo),
+            'dias_vencido': f.dias_vencido,
+            'antiguedad': f.tramo,
+            'estado': 'vencida' if f.dias_vencido > 0 else f.estado
+        }
+
+    formato = formato_exportacion()
+    if formato:
+        return respuesta_streaming(
+            (fila(f) for f in facturas.yield_per(1000)),
+            ['factura_id', 'numero_factura', 'paciente', 'paciente_telefono', 'fecha_factura',
+             'fecha_vencimiento', 'total', 'pagado', 'saldo', 'dias_vencido', 'antiguedad', 'estado'],
+            formato, 'cuentas_por_cobrar'
+        )
+
+    cuentas = [fila(f) for f in facturas]
+
+    tramos = db.session.query(
+        tramo.label('tramo'),
+        func.count(Factura.id),
+        func.sum(Factura.saldo)
+    ).filter(pendientes).group_by('tramo').all()
+
+    por_tramo = {t: {'cantidad': 0, 'saldo': 0.0} for t in TRAMOS_ANTIGUEDAD}
+    for nombre_tramo, cantidad, saldo in tramos:
+        por_tramo[nombre_tramo] = {'cantidad': cantidad, 'saldo': float(saldo or 0)}
 
     return jsonify({
-        'total_por_cobrar': total_por_cobrar,
-        'cantidad': len(resultado),
-        'cuentas': resultado
+        'total_por_cobrar': sum(t['saldo'] for t in por_tramo.values()),
+        'cantidad': len(cuentas),
+        'antiguedad': por_tramo,
+        'cuentas': cuentas
     })
 
 
 @bp.route('/estudios-realizados', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',))
 def estudios_realizados():
     """Reporte de estudios realizados"""
     fecha_inicio = request.args.get('fecha_inicio')
@@ -309,6 +300,7 @@ def estudios_realizados():
 
 @bp.route('/contabilidad', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',), stale=600)
 def contabilidad():
     """Reporte de contabilidad por período"""
     from flask_jwt_extended import get_jwt_identity
@@ -342,47 +334,44 @@ def contabilidad():
 
     fecha_fin = hoy
 
-    # Ingresos (pagos recibidos)
-    pagos = Pago.query.filter(
-        func.date(Pago.fecha_pago) >= fecha_inicio,
-        func.date(Pago.fecha_pago) <= fecha_fin
-    ).all()
+    desde = datetime.combine(fecha_inicio, datetime.min.time())
+    hasta = datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time())
 
-    total_ingresos = sum(float(p.monto) for p in pagos)
-
-    # Por método de pago
+    # Ingresos (pagos recibidos), por método de pago
     pagos_por_metodo = db.session.query(
         Pago.metodo_pago,
         func.sum(Pago.monto).label('total'),
         func.count(Pago.id).label('cantidad')
     ).filter(
-        func.date(Pago.fecha_pago) >= fecha_inicio,
-        func.date(Pago.fecha_pago) <= fecha_fin
+        Pago.fecha_pago >= desde,
+        Pago.fecha_pago < hasta
     ).group_by(Pago.metodo_pago).all()
 
+    total_ingresos = sum(float(t) for _, t, _ in pagos_por_metodo)
+    cantidad_pagos = sum(c for _, _, c in pagos_por_metodo)
+
     # Facturado
-    facturas = Factura.query.filter(
-        func.date(Factura.fecha_factura) >= fecha_inicio,
-        func.date(Factura.fecha_factura) <= fecha_fin,
+    total_facturado, cantidad_facturas = db.session.query(
+        func.coalesce(func.sum(Factura.total), 0),
+        func.count(Factura.id)
+    ).filter(
+        Factura.fecha_factura >= desde,
+        Factura.fecha_factura < hasta,
         Factura.estado != 'anulada'
-    ).all()
-
-    total_facturado = sum(float(f.total) for f in facturas)
+    ).one()
 
     # Por cobrar
-    facturas_pendientes = Factura.query.filter(
+    por_cobrar, facturas_pendientes = db.session.query(
+        func.coalesce(func.sum(Factura.saldo), 0),
+        func.count(Factura.id)
+    ).filter(
         Factura.estado.in_(['pendiente', 'parcial'])
-    ).all()
-
-    por_cobrar = 0
-    for f in facturas_pendientes:
-        pagado = sum(float(p.monto) for p in f.pagos)
-        por_cobrar += float(f.total) - pagado
+    ).one()
 
     # Órdenes
     ordenes = Orden.query.filter(
-        func.date(Orden.fecha_orden) >= fecha_inicio,
-        func.date(Orden.fecha_orden) <= fecha_fin
+        Orden.fecha_orden >= desde,
+        Orden.fecha_orden < hasta
     ).count()
 
     return jsonify({
@@ -390,11 +379,11 @@ def contabilidad():
         'fecha_inicio': fecha_inicio.isoformat(),
         'fecha_fin': fecha_fin.isoformat(),
         'ingresos': total_ingresos,
-        'cantidad_pagos': len(pagos),
-        'facturado': total_facturado,
-        'cantidad_facturas': len(facturas),
-        'por_cobrar': por_cobrar,
-        'facturas_pendientes': len(facturas_pendientes),
+        'cantidad_pagos': cantidad_pagos,
+        'facturado': float(total_facturado),
+        'cantidad_facturas': cantidad_facturas,
+        'por_cobrar': float(por_cobrar),
+        'facturas_pendientes': facturas_pendientes,
         'ordenes': ordenes,
         'por_metodo': [
             {'metodo': m, 'total': float(t), 'cantidad': c}
@@ -405,6 +394,7 @@ def contabilidad():
 
 @bp.route('/por-doctor', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',))
 def reporte_por_doctor():
     """Reporte de órdenes/estudios por médico referente"""
     fecha_inicio = request.args.get('fecha_inicio')
@@ -443,6 +433,7 @@ def reporte_por_doctor():
 
 @bp.route('/por-seguro', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',))
 def reporte_por_seguro():
     """Reporte de pacientes/facturación por seguro médico"""
     fecha_inicio = request.args.get('fecha_inicio')
@@ -479,6 +470,7 @@ def reporte_por_seguro():
 
 @bp.route('/estudios-detallado', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',))
 def reporte_estudios_detallado():
     """Reporte detallado de estudios realizados"""
     fecha_inicio = request.args.get('fecha_inicio')
@@ -511,25 +503,37 @@ def reporte_estudios_detallado():
     if categoria_id:
         query = query.filter(Estudio.categoria_id == categoria_id)
     
-    resultado = query.group_by(
+    query = query.group_by(
         Estudio.codigo, Estudio.nombre, CategoriaEstudio.nombre
-    ).order_by(func.count(OrdenDetalle.id).desc()).all()
+    ).order_by(func.count(OrdenDetalle.id).desc())
+
+    def fila(e):
+        return {
+            'codigo': e.codigo,
+            'nombre': e.nombre,
+            'categoria': e.categoria or 'Sin categoría',
+            'cantidad': e.cantidad,
+            'total': float(e.total or 0),
+            'precio_promedio': float(e.precio_promedio or 0)
+        }
+
+    formato = formato_exportacion()
+    if formato:
+        return respuesta_streaming(
+            (fila(e) for e in query.yield_per(1000)),
+            ['codigo', 'nombre', 'categoria', 'cantidad', 'total', 'precio_promedio'],
+            formato, 'estudios_detallado'
+        )
     
     return jsonify({
         'periodo': {'inicio': fecha_inicio, 'fin': fecha_fin},
-        'estudios': [{
-            'codigo': codigo,
-            'nombre': nombre,
-            'categoria': categoria or 'Sin categoría',
-            'cantidad': cantidad,
-            'total': float(total or 0),
-            'precio_promedio': float(precio_promedio or 0)
-        } for codigo, nombre, categoria, cantidad, total, precio_promedio in resultado]
+        'estudios': [fila(e) for e in query]
     })
 
 
 @bp.route('/ingresos-diarios', methods=['GET'])
 @jwt_required()
+@cached(timeout=300, tags=('reportes',))
 def reporte_ingresos_diarios():
     """Reporte de ingresos día por día"""
     dias = request.args.get('dias', 30, type=int)
@@ -538,14 +542,13 @@ def reporte_ingresos_diarios():
     fecha_inicio = datetime.now().date() - timedelta(days=dias)
     
     resultado = db.session.query(
-        func.date(Pago.fecha_pago).label('fecha'),
-        func.sum(Pago.monto).label('total'),
-        func.count(Pago.id).label('cantidad')
+        ResumenDiario.fecha,
+        ResumenDiario.ingresos_total,
+        ResumenDiario.pagos_cantidad
     ).filter(
-        func.date(Pago.fecha_pago) >= fecha_inicio
-    ).group_by(
-        func.date(Pago.fecha_pago)
-    ).order_by(func.date(Pago.fecha_pago)).all()
+        ResumenDiario.fecha >= fecha_inicio,
+        ResumenDiario.pagos_cantidad > 0
+    ).order_by(ResumenDiario.fecha).all()
     
     return jsonify({
         'dias': dias,
@@ -555,3 +558,49 @@ def reporte_ingresos_diarios():
             'cantidad': cantidad
         } for fecha, total, cantidad in resultado]
     })
+
+
+def _periodo_fiscal():
+    """(anio, mes) de ?periodo=AAAAMM; por defecto el mes anterior"""
+    periodo = request.args.get('periodo')
+    if not periodo:
+        anterior = datetime.now().replace(day=1) - timedelta(days=1)
+        return anterior.year, anterior.month
+    if len(periodo) != 6 or not periodo.isdigit() or not 1 <= int(periodo[4:]) <= 12:
+        raise ValueError('Período inválido. Use AAAAMM')
+    return int(periodo[:4]), int(periodo[4:])
+
+
+@bp.route('/dgii/607', methods=['GET'])
+@jwt_required()
+def reporte_607():
+    """Formato 607 de la DGII (?periodo=AAAAMM&format=txt|xlsx)"""
+    try:
+        anio, mes = _periodo_fiscal()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    nombre = f"DGII_F_607_{ReporteFiscalService.rnc_empresa()}_{anio}{mes:02d}"
+
+    if request.args.get('format', 'txt').lower() == 'xlsx':
+        return send_file(
+            ReporteFiscalService.xlsx_607(anio, mes),
+            as_attachment=True,
+            download_name=f'{nombre}.xlsx',
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    return Response(
+        stream_with_context(ReporteFiscalService.txt_607(anio, mes)),
+        content_type='text/plain; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={nombre}.txt'}
+    )
+
+
+@bp.route('/dgii/huecos-ncf', methods=['GET'])
+@jwt_required()
+def reporte_huecos_ncf():
+    """NCF del período sin factura, comparados con las secuencias autorizadas (?periodo=AAAAMM)"""
+    try:
+        anio, mes = _periodo_fiscal()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(ReporteFiscalService.huecos_ncf(anio, mes))
@@ -3,6 +3,8 @@ from flask_jwt_extended import jwt_required
 import psycopg2
 import os
 import json
+from datetime import datetime
+from app.services.valores import ValoresService
 
 bp = Blueprint('resultados', __name__)
 
@@ -40,6 +42,40 @@ def listar_resultados():
         print(f"Error: {e}")
         return jsonify({'error': str(e), 'resultados': []}), 500
 
+@bp.route('/tendencia', methods=['GET'])
+@jwt_required()
+def tendencia():
+    """
+    Evolución de analitos de un paciente:
+    ?paciente_id=12&analito=HGB,GLU&desde=2021-01-01&hasta=2026-12-31&limite=1000
+    Sin analito, lista los analitos que tiene el paciente.
+    """
+    paciente_id = request.args.get('paciente_id', type=int)
+    if not paciente_id:
+        return jsonify({'error': 'paciente_id requerido'}), 400
+    try:
+        desde = datetime.fromisoformat(request.args['desde']) if request.args.get('desde') else None
+        hasta = datetime.fromisoformat(request.args['hasta']) if request.args.get('hasta') else None
+    except ValueError:
+        return jsonify({'error': 'Fechas en formato YYYY-MM-DD'}), 400
+    if hasta and len(request.args['hasta']) == 10:
+        hasta = hasta.replace(hour=23, minute=59, second=59, microsecond=999999)
+    limite = min(max(request.args.get('limite', 1000, type=int), 1), 5000)
+
+    analitos = [a.strip().upper() for a in request.args.get('analito', '').split(',') if a.strip()]
+    if not analitos:
+        return jsonify({'paciente_id': paciente_id, 'analitos': ValoresService.analitos(paciente_id)}), 200
+
+    return jsonify({
+        'paciente_id': paciente_id,
+        'desde': desde.isoformat() if desde else None,
+        'hasta': hasta.isoformat() if hasta else None,
+        'series': {
+            analito: ValoresService.tendencia(paciente_id, analito, desde, hasta, limite)
+            for analito in analitos[:20]
+        }
+    }), 200
+
 @bp.route('/<int:resultado_id>', methods=['GET'])
 @jwt_required()
 def ver_resultado(resultado_id):
@@ -0,0 +1,95 @@
+"""
+Números de accesión: el código de barras del tubo de cada estudio de una orden
+Se asignan al crear la orden (contador diario, ver NumeracionService) y se
+imprimen en la etiqueta. Cuando un equipo devuelve el código de la muestra
+(SPM-2 / OBR-3), el resultado va al orden_detalle de ese tubo con una sola
+consulta IN sobre el índice único, en vez de caer en el último estudio de la orden.
+Las accesiones del día (casi todo lo que llega de los equipos) quedan además en
+un LRU en memoria por proceso; una accesión nunca cambia de detalle, así que
+no hace falta invalidarlo.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import threading
+from flask import current_app
+from sqlalchemy import update
+from app import db
+from app.models import OrdenDetalle
+from app.services.numeracion import NumeracionService
+
+
+class _Recientes:
+    """LRU accesión -> orden_detalle_id, solo con accesiones del día"""
+
+    def __init__(self):
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._dia = None
+
+    def _hoy(self):
+        # Las accesiones empiezan con AAMMDD: al cambiar el día se descarta lo anterior
+        dia = datetime.now().strftime('%y%m%d')
+        if dia != self._dia:
+            self._datos.clear()
+            self._dia = dia
+        return dia
+
+    def buscar(self, codigos):
+        encontrados = {}
+        with self._lock:
+            self._hoy()
+            for codigo in codigos:
+                detalle_id = self._datos.get(codigo)
+                if detalle_id is not None:
+                    self._datos.move_to_end(codigo)
+                    encontrados[codigo] = detalle_id
+        return encontrados
+
+    def guardar(self, encontrados, maximo):
+        with self._lock:
+            dia = self._hoy()
+            for codigo, detalle_id in encontrados.items():
+                if codigo.startswith(dia):
+                    self._datos[codigo] = detalle_id
+                    self._datos.move_to_end(codigo)
+            while len(self._datos) > maximo:
+                self._datos.popitem(last=False)
+
+
+_recientes = _Recientes()
+
+
+class AccesionService:
+
+    @staticmethod
+    def asignar(detalle):
+        """Accesión del detalle; los creados antes de las accesiones la reciben aquí"""
+        if detalle.accesion:
+            return detalle.accesion
+        # UPDATE condicional: si otro request la asignó primero, gana la suya
+        # (el número reservado aquí se pierde, como un tubo sin usar)
+        asignada = db.session.execute(
+            update(OrdenDetalle).where(
+                OrdenDetalle.id == detalle.id, OrdenDetalle.accesion.is_(None)
+            ).values(accesion=NumeracionService.numeros_accesion()[0]).returning(OrdenDetalle.accesion)
+        ).scalar()
+        db.session.commit()
+        if asignada is None:
+            db.session.refresh(detalle)
+        return detalle.accesion
+
+    @staticmethod
+    def resolver(codigos):
+        """{código: orden_detalle_id} de los códigos que son accesiones conocidas"""
+        codigos = {c.strip() for c in codigos if c and c.strip()}
+        if not codigos:
+            return {}
+        encontrados = _recientes.buscar(codigos)
+        faltantes = codigos - encontrados.keys()
+        if faltantes:
+            nuevos = dict(db.session.query(OrdenDetalle.accesion, OrdenDetalle.id).filter(
+                OrdenDetalle.accesion.in_(faltantes)
+            ).all())
+            _recientes.guardar(nuevos, current_app.config['ACCESIONES_CACHE'])
+            encontrados.update(nuevos)
+        return encontrados
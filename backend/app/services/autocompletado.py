@@ -0,0 +1,257 @@
+"""
+Índice de prefijos en memoria para el autocompletado de recepción
+Cada worker guarda, por tipo (pacientes, estudios), una lista ordenada de
+claves normalizadas y busca con bisect, sin consultar la base de datos.
+Se mantiene al día con:
+- los cambios confirmados en este proceso (eventos del ORM)
+- un delta periódico por updated_at para los cambios hechos en otros workers
+- una recarga completa cada hora (cubre lo que el delta no ve)
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models import Paciente, Estudio
+from app.utils.busqueda import normalizar, solo_digitos, terminos
+
+RECARGA_COMPLETA = 3600
+# Filas que se revisan como máximo por búsqueda cuando el término tiene varias palabras
+ESCANEO_MAXIMO = 2000
+FILAS_POR_LOTE = 5000
+
+
+class IndicePrefijos:
+    """Lista ordenada de (clave, id) con los datos a mostrar de cada entidad"""
+
+    def __init__(self, pares=(), entidades=None):
+        pares = sorted(pares)
+        self._claves = [clave for clave, _ in pares]
+        self._ids = [id_ for _, id_ in pares]
+        self._entidades = entidades or {}  # id -> (claves, datos)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entidades)
+
+    def poner(self, id_, claves, datos):
+        with self._lock:
+            self._quitar(id_)
+            for clave in claves:
+                posicion = bisect_right(self._claves, clave)
+                self._claves.insert(posicion, clave)
+                self._ids.insert(posicion, id_)
+            self._entidades[id_] = (tuple(claves), datos)
+
+    def quitar(self, id_):
+        with self._lock:
+            self._quitar(id_)
+
+    def _quitar(self, id_):
+        entidad = self._entidades.pop(id_, None)
+        if entidad is None:
+            return
+        for clave in entidad[0]:
+            posicion = bisect_left(self._claves, clave)
+            while posicion < len(self._claves) and self._claves[posicion] == clave:
+                if self._ids[posicion] == id_:
+                    del self._claves[posicion]
+                    del self._ids[posicion]
+                    break
+                posicion += 1
+
+    def buscar(self, palabras, limite):
+        """Entidades con una clave que empieza por cada palabra (primero las coincidencias exactas)"""
+        principal = max(palabras, key=len)
+        resto = [p for p in palabras if p is not principal]
+        resultados = []
+        vistos = set()
+        with self._lock:
+            posicion = bisect_left(self._claves, principal)
+            fin = min(len(self._claves), posicion + ESCANEO_MAXIMO)
+            while posicion < fin and self._claves[posicion].startswith(principal):
+                id_ = self._ids[posicion]
+                posicion += 1
+                if id_ in vistos:
+                    continue
+                vistos.add(id_)
+                claves, datos = self._entidades[id_]
+                if all(any(c.startswith(p) for c in claves) for p in resto):
+                    resultados.append(datos)
+                    if len(resultados) >= limite:
+                        break
+        return resultados
+
+
+def _claves_paciente(nombre, apellido, cedula):
+    claves = set(normalizar(f'{nombre} {apellido}').split())
+    if cedula:
+        claves.add(solo_digitos(cedula))
+    return sorted(c for c in claves if c)
+
+
+def _claves_estudio(codigo, nombre):
+    claves = set(normalizar(nombre).split())
+    claves.add(normalizar(codigo))
+    return sorted(c for c in claves if c)
+
+
+def _entrada_paciente(id_, nombre, apellido, cedula, estado):
+    if estado == 'inactivo':
+        return None
+    datos = {'id': id_, 'nombre': f'{nombre} {apellido}', 'cedula': cedula}
+    return _claves_paciente(nombre, apellido, cedula), datos
+
+
+def _entrada_estudio(id_, codigo, nombre, precio, activo):
+    if activo is False:
+        return None
+    datos = {'id': id_, 'codigo': codigo, 'nombre': nombre, 'precio': float(precio) if precio is not None else None}
+    return _claves_estudio(codigo, nombre), datos
+
+
+# tipo -> (modelo, columnas, función que arma (claves, datos) desde una fila)
+FUENTES = {
+    'pacientes': (Paciente, ('id', 'nombre', 'apellido', 'cedula', 'estado'), _entrada_paciente),
+    'estudios': (Estudio, ('id', 'codigo', 'nombre', 'precio', 'activo'), _entrada_estudio),
+}
+
+
+class AutocompletadoService:
+
+    _indices = {}
+    _marca = None
+    _hilo = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def listo():
+        return bool(AutocompletadoService._indices)
+
+    @staticmethod
+    def iniciar(app):
+        """Arrancar (una vez por proceso) el hilo que carga y mantiene el índice"""
+        if AutocompletadoService._hilo is not None:
+            return
+        with AutocompletadoService._lock:
+            if AutocompletadoService._hilo is None:
+                hilo = threading.Thread(target=AutocompletadoService._mantener, args=(app,), daemon=True)
+                hilo.start()
+                AutocompletadoService._hilo = hilo
+
+    @staticmethod
+    def buscar(texto, tipos, limite=10):
+        palabras = terminos(texto)
+        if not palabras:
+            return {tipo: [] for tipo in tipos}
+        return {
+            tipo: AutocompletadoService._indices[tipo].buscar(palabras, limite)
+            for tipo in tipos
+        }
+
+    @staticmethod
+    def _filas(tipo, desde=None):
+        modelo, columnas, _ = FUENTES[tipo]
+        query = db.session.query(*[getattr(modelo, c) for c in columnas])
+        if desde is not None:
+            query = query.filter(modelo.updated_at >= desde)
+        return query.yield_per(FILAS_POR_LOTE)
+
+    @staticmethod
+    def recargar():
+        """Construir los índices completos y reemplazar los actuales"""
+        marca = datetime.utcnow()
+        indices = {}
+        for tipo, (_, _, armar) in FUENTES.items():
+            pares, entidades = [], {}
+            for fila in AutocompletadoService._filas(tipo):
+                entrada = armar(*fila)
+                if entrada is None:
+                    continue
+                claves, datos = entrada
+                entidades[fila[0]] = (tuple(claves), datos)
+                pares.extend((clave, fila[0]) for clave in claves)
+            indices[tipo] = IndicePrefijos(pares, entidades)
+        db.session.remove()
+        AutocompletadoService._indices = indices
+        AutocompletadoService._marca = marca
+
+    @staticmethod
+    def sincronizar():
+        """Aplicar las filas modificadas desde la última sincronización (también en otros workers)"""
+        # Margen para transacciones que confirmaron después de leer la marca
+        desde = AutocompletadoService._marca - timedelta(seconds=5)
+        marca = datetime.utcnow()
+        for tipo, (_, _, armar) in FUENTES.items():
+            for fila in AutocompletadoService._filas(tipo, desde):
+                AutocompletadoService._aplicar(tipo, fila[0], armar(*fila))
+        db.session.remove()
+        AutocompletadoService._marca = marca
+
+    @staticmethod
+    def _aplicar(tipo, id_, entrada):
+        indice = AutocompletadoService._indices.get(tipo)
+        if indice is None:
+            return
+        if entrada is None:
+            indice.quitar(id_)
+        else:
+            indice.poner(id_, *entrada)
+
+    @staticmethod
+    def _mantener(app):
+        with app.app_context():
+            intervalo = app.config.get('AUTOCOMPLETADO_INTERVALO', 30)
+            ultima_recarga = 0
+            while True:
+                try:
+                    if time.time() - ultima_recarga >= RECARGA_COMPLETA:
+                        AutocompletadoService.recargar()
+                        ultima_recarga = time.time()
+                        app.logger.info(
+                            'Índice de autocompletado cargado: ' + ', '.join(
+                                f'{tipo}={len(i)}' for tipo, i in AutocompletadoService._indices.items()
+                            )
+                        )
+                    else:
+                        AutocompletadoService.sincronizar()
+                except Exception as e:
+                    db.session.remove()
+                    app.logger.error(f'Error actualizando el índice de autocompletado: {e}')
+                time.sleep(intervalo)
+
+
+# =====================
+# Cambios confirmados en este proceso
+# =====================
+# Los valores se toman en el flush (después del commit los objetos están expirados)
+# y se aplican al índice solo si la transacción se confirma.
+
+def _registrar_cambio(tipo):
+    modelo, columnas, armar = FUENTES[tipo]
+
+    def registrar(mapper, connection, objeto):
+        if not AutocompletadoService.listo():
+            return
+        fila = [getattr(objeto, c) for c in columnas]
+        object_session(objeto).info.setdefault('autocompletado', []).append((tipo, fila[0], armar(*fila)))
+
+    event.listen(modelo, 'after_insert', registrar)
+    event.listen(modelo, 'after_update', registrar)
+
+
+for _tipo in FUENTES:
+    _registrar_cambio(_tipo)
+
+
+@event.listens_for(Session, 'after_commit')
+def _aplicar_cambios(session):
+    for tipo, id_, entrada in session.info.pop('autocompletado', ()):
+        AutocompletadoService._aplicar(tipo, id_, entrada)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_cambios(session):
+    session.info.pop('autocompletado', None)
@@ -0,0 +1,272 @@
+"""
+Detección de pacientes duplicados
+Cada paciente tiene claves de bloqueo (código fonético de nombre/apellido,
+fecha de nacimiento, teléfonos, cédula, email) en paciente_claves. Solo se
+comparan pacientes que comparten alguna clave, así que:
+- al crear un paciente se consultan sus claves por índice (sin recorrer la tabla)
+- el proceso nocturno recorre los bloques una vez, O(n), en lugar de todos los pares
+"""
+from difflib import SequenceMatcher
+from itertools import combinations
+import re
+from sqlalchemy import event, func, text
+from sqlalchemy.dialects.postgresql import insert
+from app import db
+from app.models import Paciente, PacienteClave, PacienteDuplicado
+from app.utils.busqueda import normalizar, solo_digitos
+
+# Desde este puntaje se avisa al crear el paciente
+UMBRAL_AVISO = 0.6
+# Desde este puntaje el par queda registrado para revisión
+UMBRAL_DUPLICADO = 0.7
+# Candidatos que se evalúan como máximo al crear un paciente
+MAX_CANDIDATOS = 50
+# Bloques más grandes que esto (nombres muy comunes sin otro dato) no se comparan completos
+MAX_BLOQUE = 200
+PACIENTES_POR_LOTE = 5000
+
+CAMPOS_CLAVE = ('nombre', 'apellido', 'fecha_nacimiento', 'cedula', 'telefono', 'celular', 'email')
+
+# Reglas en orden; '1' = sonido ch/sh, '2' = g suave de gue/gui
+_REGLAS_FONETICAS = [
+    (r'ch|sh', '1'), (r'ph', 'f'), (r'th', 't'), (r'll', 'y'),
+    (r'qu(?=[ei])', 'k'), (r'gu(?=[ei])', '2'), (r'g(?=[ei])', 'j'), (r'c(?=[ei])', 's'),
+    (r'h', ''), (r'[cq]', 'k'), (r'z', 's'), (r'[vw]', 'b'), (r'x', 'ks'), (r'2', 'g'),
+    (r'y(?![aeiou])', 'i'),
+]
+
+
+def codigo_fonetico(palabra):
+    """
+    Código fonético para nombres en español: unifica las letras que suenan igual
+    (b/v, c/s/z, g/j, ll/y, h muda...), quita las vocales salvo la inicial y las
+    letras repetidas. Gonzalez/Gonsales -> gnsls, Yiménez/Jiménez/Giménez -> jmns
+    """
+    p = re.sub(r'[^a-z]', '', normalizar(palabra))
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        p = re.sub(patron, reemplazo, p)
+    if p.startswith('y') and len(p) > 1 and p[1] in 'aeiou':
+        p = 'j' + p[1:]
+    if not p:
+        return ''
+    codigo = p[0] + re.sub(r'[aeiou]', '', p[1:])
+    return re.sub(r'(.)\1+', r'\1', codigo)[:8]
+
+
+def _primera(texto):
+    palabras = normalizar(texto).split()
+    return palabras[0] if palabras else ''
+
+
+def _telefonos(paciente):
+    # Los últimos 10 dígitos (809-555-1234, +1 809 555 1234 y 8095551234 son el mismo)
+    numeros = (solo_digitos(paciente.telefono)[-10:], solo_digitos(paciente.celular)[-10:])
+    return {n for n in numeros if len(n) >= 7}
+
+
+def claves_paciente(paciente):
+    """Claves de bloqueo de un paciente (objeto o fila con los CAMPOS_CLAVE)"""
+    claves = set()
+    nombre = codigo_fonetico(_primera(paciente.nombre))
+    apellido = codigo_fonetico(_primera(paciente.apellido))
+    if nombre and apellido:
+        claves.add(f'n:{nombre}|{apellido}')
+    if paciente.fecha_nacimiento:
+        fecha = paciente.fecha_nacimiento.isoformat()
+        # Una clave por cada parte del nombre: tolera un error en la otra
+        if nombre:
+            claves.add(f'd:{nombre}|{fecha}')
+        if apellido:
+            claves.add(f'd:{apellido}|{fecha}')
+    for telefono in _telefonos(paciente):
+        claves.add(f't:{telefono}')
+    if solo_digitos(paciente.cedula):
+        claves.add(f'c:{solo_digitos(paciente.cedula)}')
+    if paciente.email:
+        claves.add(f'e:{paciente.email.strip().lower()[:78]}')
+    return claves
+
+
+def puntuar(a, b):
+    """Probabilidad (0-1) de que dos pacientes sean la misma persona y los motivos"""
+    cedula_a, cedula_b = solo_digitos(a.cedula), solo_digitos(b.cedula)
+    if cedula_a and cedula_b and cedula_a == cedula_b:
+        return 1.0, ['cedula']
+    # Dos cédulas distintas: solo puede ser un error de digitación
+    tope = 0.65 if cedula_a and cedula_b else 1.0
+
+    motivos = []
+    nombre_a = normalizar(f'{a.nombre} {a.apellido}')
+    nombre_b = normalizar(f'{b.nombre} {b.apellido}')
+    similitud = SequenceMatcher(None, nombre_a, nombre_b).ratio()
+    puntaje = 0.45 * similitud
+    if similitud >= 0.85:
+        motivos.append('nombre')
+
+    if (codigo_fonetico(_primera(a.nombre)) == codigo_fonetico(_primera(b.nombre))
+            and codigo_fonetico(_primera(a.apellido)) == codigo_fonetico(_primera(b.apellido))):
+        puntaje += 0.1
+        motivos.append('fonetica')
+
+    if a.fecha_nacimiento and b.fecha_nacimiento:
+        if a.fecha_nacimiento == b.fecha_nacimiento:
+            puntaje += 0.3
+            motivos.append('fecha_nacimiento')
+        else:
+            puntaje -= 0.2
+
+    if _telefonos(a) & _telefonos(b):
+        puntaje += 0.25
+        motivos.append('telefono')
+
+    if a.email and b.email and a.email.strip().lower() == b.email.strip().lower():
+        puntaje += 0.2
+        motivos.append('email')
+
+    return round(max(0.0, min(puntaje, tope)), 3), motivos
+
+
+class DuplicadosService:
+
+    @staticmethod
+    def buscar_candidatos(paciente):
+        """
+        Posibles duplicados de un paciente (nuevo o existente) ordenados por puntaje.
+        Solo lee las filas de paciente_claves de sus claves (búsqueda por índice).
+        """
+        claves = claves_paciente(paciente)
+        if not claves:
+            return []
+
+        ids = db.session.query(PacienteClave.paciente_id).filter(
+            PacienteClave.clave.in_(claves)
+        )
+        if paciente.id:
+            ids = ids.filter(PacienteClave.paciente_id != paciente.id)
+        # Primero los que comparten más claves
+        ids = ids.group_by(PacienteClave.paciente_id).order_by(
+            func.count().desc()
+        ).limit(MAX_CANDIDATOS)
+
+        candidatos = []
+        for otro in Paciente.query.filter(Paciente.id.in_(ids.scalar_subquery())).all():
+            puntaje, motivos = puntuar(paciente, otro)
+            if puntaje >= UMBRAL_AVISO:
+                candidatos.append((otro, puntaje, motivos))
+        candidatos.sort(key=lambda c: c[1], reverse=True)
+        return candidatos
+
+    @staticmethod
+    def registrar_pares(pares):
+        """Guardar pares (id_a, id_b, puntaje, motivos) sin repetir los ya registrados (sin commit)"""
+        filas = [{
+            'paciente_id': min(a, b),
+            'duplicado_id': max(a, b),
+            'puntaje': puntaje,
+            'motivos': ','.join(motivos),
+            'estado': 'pendiente',
+        } for a, b, puntaje, motivos in pares if a != b]
+        if not filas:
+            return 0
+        stmt = insert(PacienteDuplicado).values(filas).on_conflict_do_nothing(
+            index_elements=['paciente_id', 'duplicado_id']
+        )
+        return db.session.execute(stmt).rowcount
+
+    @staticmethod
+    def reindexar():
+        """Recalcular paciente_claves de todos los pacientes, por lotes de id"""
+        columnas = [Paciente.id] + [getattr(Paciente, c) for c in CAMPOS_CLAVE]
+        ultimo_id = 0
+        total = 0
+        while True:
+            filas = db.session.query(*columnas).filter(
+                Paciente.id > ultimo_id
+            ).order_by(Paciente.id).limit(PACIENTES_POR_LOTE).all()
+            if not filas:
+                break
+            ids = [f.id for f in filas]
+            db.session.query(PacienteClave).filter(
+                PacienteClave.paciente_id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.session.execute(PacienteClave.__table__.insert(), [
+                {'clave': clave, 'paciente_id': f.id}
+                for f in filas for clave in claves_paciente(f)
+            ])
+            db.session.commit()
+            ultimo_id = ids[-1]
+            total += len(ids)
+        return total
+
+    @staticmethod
+    def detectar():
+        """
+        Recorrer los bloques de paciente_claves y registrar los pares parecidos.
+        Devuelve (bloques, pares_evaluados, duplicados_nuevos).
+        """
+        columnas = [Paciente.id] + [getattr(Paciente, c) for c in CAMPOS_CLAVE]
+        bloques_total = evaluados = nuevos = 0
+        lote, ids_lote = [], set()
+
+        def procesar():
+            nonlocal evaluados, nuevos
+            pacientes = {
+                f.id: f for f in db.session.query(*columnas).filter(Paciente.id.in_(ids_lote)).all()
+            }
+            vistos = set()
+            pares = []
+            for ids in lote:
+                for a, b in combinations(ids, 2):
+                    if (a, b) in vistos or a not in pacientes or b not in pacientes:
+                        continue
+                    vistos.add((a, b))
+                    puntaje, motivos = puntuar(pacientes[a], pacientes[b])
+                    if puntaje >= UMBRAL_DUPLICADO:
+                        pares.append((a, b, puntaje, motivos))
+            evaluados += len(vistos)
+            nuevos += DuplicadosService.registrar_pares(pares)
+            db.session.commit()
+
+        # Conexión aparte para el cursor del servidor: los commits de cada lote no lo cierran
+        with db.engine.connect() as conexion:
+            bloques = conexion.execution_options(stream_results=True, yield_per=1000).execute(text("""
+                SELECT clave, array_agg(paciente_id ORDER BY paciente_id) AS ids
+                FROM paciente_claves
+                GROUP BY clave
+                HAVING COUNT(*) BETWEEN 2 AND :max_bloque
+            """), {'max_bloque': MAX_BLOQUE})
+            for _, ids in bloques:
+                bloques_total += 1
+                lote.append(ids)
+                ids_lote.update(ids)
+                if len(ids_lote) >= PACIENTES_POR_LOTE:
+                    procesar()
+                    lote, ids_lote = [], set()
+            if lote:
+                procesar()
+
+        return bloques_total, evaluados, nuevos
+
+
+# =====================
+# Mantener paciente_claves al guardar pacientes
+# =====================
+
+def _guardar_claves(connection, paciente):
+    tabla = PacienteClave.__table__
+    connection.execute(tabla.delete().where(tabla.c.paciente_id == paciente.id))
+    claves = claves_paciente(paciente)
+    if claves:
+        connection.execute(tabla.insert(), [{'clave': c, 'paciente_id': paciente.id} for c in claves])
+
+
+@event.listens_for(Paciente, 'after_insert')
+def _claves_al_crear(mapper, connection, paciente):
+    _guardar_claves(connection, paciente)
+
+
+@event.listens_for(Paciente, 'after_update')
+def _claves_al_actualizar(mapper, connection, paciente):
+    estado = db.inspect(paciente)
+    if any(estado.attrs[c].history.has_changes() for c in CAMPOS_CLAVE):
+        _guardar_claves(connection, paciente)
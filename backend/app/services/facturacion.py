@@ -1,36 +1,22 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
 from app import db
-from app.models import Factura, FacturaDetalle, Pago, Orden, OrdenDetalle, NCFSecuencia
-from sqlalchemy import func
+from app.models import Factura, FacturaDetalle, Pago, Orden, OrdenDetalle
+from app.services.resumenes import ResumenService
+from app.services.numeracion import NumeracionService
+from app.services.ncf import NCFService
+from app.cache import invalidate
+from sqlalchemy import text
 
 class FacturacionService:
     
     @staticmethod
     def obtener_siguiente_ncf(tipo_comprobante='B02'):
-        try:
-            secuencia = NCFSecuencia.query.filter(
-                NCFSecuencia.tipo_comprobante == tipo_comprobante,
-                NCFSecuencia.activo == True,
-                NCFSecuencia.secuencia_actual < NCFSecuencia.secuencia_fin,
-                NCFSecuencia.fecha_vencimiento > datetime.now().date()
-            ).first()
-            if not secuencia:
-                return None
-            ncf = f"{secuencia.tipo_comprobante}-{secuencia.serie}-{str(secuencia.secuencia_actual).zfill(8)}"
-            secuencia.secuencia_actual += 1
-            db.session.commit()
-            return ncf
-        except:
-            return None
+        return NCFService.siguiente(tipo_comprobante)
     
     @staticmethod
     def generar_numero_factura():
-        anio = datetime.now().year
-        contador = db.session.query(func.count(Factura.id)).filter(
-            func.extract('year', Factura.fecha_factura) == anio
-        ).scalar() or 0
-        return f"FAC-{anio}-{str(contador + 1).zfill(6)}"
+        return NumeracionService.numeros_factura()[0]
     
     @staticmethod
     def calcular_itbis(subtotal):
@@ -38,7 +24,8 @@ class FacturacionService:
     
     @staticmethod
     def crear_factura_desde_orden(orden_id, datos_factura):
-        orden = Orden.query.get(orden_id)
+        # Bloquear la orden para no facturarla dos veces (p. ej. junto con un lote)
+        orden = Orden.query.filter_by(id=orden_id).with_for_update().first()
         if not orden:
             raise ValueError('Orden no encontrada')
         if orden.estado == 'facturada':
@@ -62,15 +49,12 @@ class FacturacionService:
         factura.fecha_factura = datetime.now()
         factura.fecha_vencimiento = datetime.now().date() + timedelta(days=30)
         
-        ncf = FacturacionService.obtener_siguiente_ncf(datos_factura.get('tipo_comprobante', 'B02'))
-        if ncf:
-            factura.ncf = ncf
-            factura.tipo_comprobante = datos_factura.get('tipo_comprobante', 'B02')
-        
         factura.subtotal = subtotal
         factura.descuento = descuento_global
         factura.itbis = itbis
         factura.total = total
+        factura.monto_pagado = Decimal('0')
+        factura.saldo = total
         factura.estado = 'pendiente'
         factura.forma_pago = datos_factura.get('forma_pago', 'efectivo')
         factura.usuario_emision_id = datos_factura.get('usuario_id')
@@ -91,19 +75,33 @@ class FacturacionService:
             db.session.add(detalle_factura)
         
         orden.estado = 'facturada'
-        db.session.commit()
+        
+        # El NCF se toma al final: si la factura no se guarda vuelve al bloque del proceso
+        ncf = FacturacionService.obtener_siguiente_ncf(datos_factura.get('tipo_comprobante', 'B02'))
+        if ncf:
+            factura.ncf = ncf
+            factura.tipo_comprobante = datos_factura.get('tipo_comprobante', 'B02')
+        try:
+            ResumenService.registrar_factura(factura, detalles_orden)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if ncf:
+                NCFService.devolver(ncf)
+            raise
+        invalidate('reportes')
         return factura
     
     @staticmethod
     def registrar_pago(factura_id, datos_pago):
-        factura = Factura.query.get(factura_id)
+        # Bloquear la fila para que dos cajeros no cobren el mismo saldo a la vez
+        factura = Factura.query.filter_by(id=factura_id).with_for_update().first()
         if not factura:
             raise ValueError('Factura no encontrada')
         if factura.estado == 'anulada':
             raise ValueError('No se puede pagar factura anulada')
         
-        pagos_previos = db.session.query(func.sum(Pago.monto)).filter(Pago.factura_id == factura_id).scalar() or Decimal('0')
-        saldo = Decimal(str(factura.total)) - Decimal(str(pagos_previos))
+        saldo = Decimal(str(factura.saldo))
         monto = Decimal(str(datos_pago['monto']))
         
         if monto > saldo:
@@ -117,8 +115,32 @@ class FacturacionService:
         pago.banco = datos_pago.get('banco', '')
         pago.usuario_recibe_id = datos_pago.get('usuario_id')
         db.session.add(pago)
+        db.session.flush()
         
         nuevo_saldo = saldo - monto
+        factura.monto_pagado = Decimal(str(factura.monto_pagado)) + monto
+        factura.saldo = nuevo_saldo
         factura.estado = 'pagada' if nuevo_saldo == 0 else 'parcial'
+        ResumenService.registrar_pago(pago, factura, factura_saldada=nuevo_saldo == 0)
         db.session.commit()
+        invalidate('reportes')
         return pago
+    
+    @staticmethod
+    def recalcular_saldos():
+        """Recalcular monto_pagado y saldo de todas las facturas desde la tabla de pagos"""
+        resultado = db.session.execute(text("""
+            UPDATE facturas f
+            SET monto_pagado = COALESCE(p.pagado, 0),
+                saldo = f.total - COALESCE(p.pagado, 0)
+            FROM facturas f2
+            LEFT JOIN (
+                SELECT factura_id, SUM(monto) AS pagado
+                FROM pagos
+                GROUP BY factura_id
+            ) p ON p.factura_id = f2.id
+            WHERE f2.id = f.id
+        """))
+        db.session.commit()
+        invalidate('reportes')
+        return resultado.rowcount
@@ -0,0 +1,237 @@
+"""
+Facturación por lotes (cierre de período con las ARS)
+Factura todas las órdenes pendientes que cumplen un filtro (seguro, rango de
+fechas) en tramos de ORDENES_POR_TRAMO: por cada tramo se reservan juntos los
+números de factura y los NCF, y facturas, detalles, órdenes y resúmenes se
+escriben con inserciones en bloque en una sola transacción.
+Cada tramo confirmado guarda el último id de orden procesado, así un lote
+interrumpido (cliente desconectado, worker reiniciado) se reanuda donde quedó.
+El avance se entrega como eventos (dicts) para enviarlos al cliente como NDJSON.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+from collections import defaultdict
+import json
+from sqlalchemy import insert, update, func
+from app import db
+from app.cache import invalidate
+from app.models import LoteFacturacion, Orden, OrdenDetalle, Paciente, Factura, FacturaDetalle, Estudio
+from app.services.facturacion import FacturacionService
+from app.services.numeracion import NumeracionService
+from app.services.ncf import NCFService
+from app.services.resumenes import ResumenService
+
+ORDENES_POR_TRAMO = 200
+# Un lote en proceso sin avance en este tiempo se considera abandonado y se puede reanudar
+LOTE_INACTIVO = timedelta(minutes=5)
+MAX_ERRORES_GUARDADOS = 100
+
+
+class FacturacionLoteService:
+
+    @staticmethod
+    def crear(datos, usuario_id):
+        """Registrar un lote a partir del filtro; no factura todavía (ValueError si el filtro no alcanza)"""
+        # Sin filtro se facturarían todas las órdenes pendientes de la base
+        if not datos.get('seguro_medico') and not (datos.get('desde') and datos.get('hasta')):
+            raise ValueError('seguro_medico o rango desde/hasta requerido')
+        lote = LoteFacturacion()
+        lote.seguro_medico = datos.get('seguro_medico') or None
+        lote.fecha_desde = datetime.fromisoformat(datos['desde']).date() if datos.get('desde') else None
+        lote.fecha_hasta = datetime.fromisoformat(datos['hasta']).date() if datos.get('hasta') else None
+        lote.opciones = json.dumps({
+            'tipo_comprobante': datos.get('tipo_comprobante', 'B01'),
+            'incluir_itbis': bool(datos.get('incluir_itbis', False)),
+            'forma_pago': datos.get('forma_pago', 'credito')
+        })
+        lote.usuario_id = usuario_id
+        lote.estado = 'pendiente'
+        db.session.add(lote)
+        db.session.commit()
+        return lote
+
+    @staticmethod
+    def _ordenes(lote):
+        """Órdenes del filtro que aún no tienen factura, en orden de id"""
+        query = db.session.query(Orden.id, Orden.paciente_id).join(
+            Paciente, Paciente.id == Orden.paciente_id
+        ).outerjoin(
+            Factura, Factura.orden_id == Orden.id
+        ).filter(
+            Orden.estado.notin_(['facturada', 'cancelada']),
+            Factura.id.is_(None),
+            Orden.id > lote.ultima_orden_id
+        )
+        if lote.seguro_medico:
+            query = query.filter(Paciente.seguro_medico == lote.seguro_medico)
+        if lote.fecha_desde:
+            query = query.filter(Orden.fecha_orden >= lote.fecha_desde)
+        if lote.fecha_hasta:
+            query = query.filter(Orden.fecha_orden < lote.fecha_hasta + timedelta(days=1))
+        return query
+
+    @staticmethod
+    def _tomar(lote_id):
+        """Marcar el lote en proceso si nadie lo está procesando (True si se obtuvo)"""
+        tomado = db.session.execute(update(LoteFacturacion).where(
+            LoteFacturacion.id == lote_id,
+            LoteFacturacion.estado != 'completado',
+            db.or_(
+                LoteFacturacion.estado != 'en_proceso',
+                LoteFacturacion.updated_at < datetime.utcnow() - LOTE_INACTIVO
+            )
+        ).values(estado='en_proceso', mensaje=None, updated_at=datetime.utcnow())).rowcount
+        db.session.commit()
+        return bool(tomado)
+
+    @staticmethod
+    def _facturar_tramo(lote, ordenes, opciones):
+        """
+        Facturar un tramo de órdenes (sin commit). Si no alcanzan los NCF se
+        facturan las que tienen NCF y el resto se devuelve en sin_ncf.
+        Devuelve (facturas, monto, errores, sin_ncf).
+        """
+        ids = [o.id for o in ordenes]
+        detalles = defaultdict(list)
+        for fila in db.session.query(
+            OrdenDetalle.id, OrdenDetalle.orden_id, OrdenDetalle.estudio_id, OrdenDetalle.precio,
+            OrdenDetalle.descuento, OrdenDetalle.precio_final, Estudio.nombre
+        ).outerjoin(Estudio, Estudio.id == OrdenDetalle.estudio_id).filter(
+            OrdenDetalle.orden_id.in_(ids)
+        ).order_by(OrdenDetalle.id):
+            detalles[fila.orden_id].append(fila)
+
+        errores = [{'orden_id': o.id, 'error': 'La orden no tiene estudios'} for o in ordenes if not detalles[o.id]]
+        facturables = [o for o in ordenes if detalles[o.id]]
+        if not facturables:
+            return 0, Decimal('0'), errores, []
+
+        tipo = opciones['tipo_comprobante']
+        ncfs = NCFService.siguientes(tipo, len(facturables))
+        sin_ncf = facturables[len(ncfs):]
+        facturables = facturables[:len(ncfs)]
+        if sin_ncf:
+            # Las órdenes desde la primera sin NCF se retoman al reanudar el lote
+            errores = [e for e in errores if e['orden_id'] < sin_ncf[0].id]
+        if not facturables:
+            return 0, Decimal('0'), errores, sin_ncf
+
+        try:
+            numeros = NumeracionService.numeros_factura(len(facturables))
+            ahora = datetime.now()
+            filas = []
+            for orden, numero, ncf in zip(facturables, numeros, ncfs):
+                subtotal = sum(Decimal(str(d.precio_final)) for d in detalles[orden.id])
+                itbis = FacturacionService.calcular_itbis(subtotal) if opciones['incluir_itbis'] else Decimal('0')
+                total = subtotal + itbis
+                filas.append({
+                    'numero_factura': numero,
+                    'ncf': ncf,
+                    'tipo_comprobante': tipo,
+                    'orden_id': orden.id,
+                    'paciente_id': orden.paciente_id,
+                    'fecha_factura': ahora,
+                    'fecha_vencimiento': ahora.date() + timedelta(days=30),
+                    'subtotal': subtotal,
+                    'descuento': Decimal('0'),
+                    'itbis': itbis,
+                    'total': total,
+                    'monto_pagado': Decimal('0'),
+                    'saldo': total,
+                    'estado': 'pendiente',
+                    'forma_pago': opciones['forma_pago'],
+                    'usuario_emision_id': lote.usuario_id,
+                    'lote_id': lote.id
+                })
+
+            factura_ids = db.session.scalars(
+                insert(Factura).returning(Factura.id, sort_by_parameter_order=True), filas
+            ).all()
+            db.session.execute(insert(FacturaDetalle), [{
+                'factura_id': factura_id,
+                'orden_detalle_id': d.id,
+                'descripcion': d.nombre or 'Estudio',
+                'cantidad': 1,
+                'precio_unitario': d.precio,
+                'descuento': d.descuento,
+                'itbis': Decimal('0'),
+                'total': Decimal(str(d.precio_final))
+            } for factura_id, orden in zip(factura_ids, facturables) for d in detalles[orden.id]])
+            db.session.execute(update(Orden).where(
+                Orden.id.in_([o.id for o in facturables])
+            ).values(estado='facturada'), execution_options={'synchronize_session': False})
+            ResumenService.registrar_facturas([
+                (ahora.date(), fila['total'], [(d.estudio_id, d.precio_final) for d in detalles[fila['orden_id']]])
+                for fila in filas
+            ])
+        except Exception:
+            for ncf in reversed(ncfs):
+                NCFService.devolver(ncf)
+            raise
+        return len(filas), sum(f['total'] for f in filas), errores, sin_ncf
+
+    @staticmethod
+    def procesar(lote_id):
+        """
+        Facturar (o seguir facturando) el lote. Generador de eventos de avance:
+        inicio, progreso (uno por tramo) y fin.
+        """
+        if not FacturacionLoteService._tomar(lote_id):
+            lote = LoteFacturacion.query.get(lote_id)
+            yield {'evento': 'fin', 'lote': lote.to_dict() if lote else None,
+                   'error': 'Lote no encontrado' if not lote else f'El lote está {lote.estado}'}
+            return
+
+        lote = LoteFacturacion.query.get(lote_id)
+        opciones = json.loads(lote.opciones)
+        if not lote.total_ordenes:
+            lote.total_ordenes = FacturacionLoteService._ordenes(lote).order_by(None).with_entities(
+                func.count(Orden.id)
+            ).scalar()
+            db.session.commit()
+        yield {'evento': 'inicio', 'lote': lote.to_dict()}
+
+        try:
+            faltan_ncf = False
+            while not faltan_ncf:
+                ordenes = FacturacionLoteService._ordenes(lote).order_by(Orden.id).limit(
+                    ORDENES_POR_TRAMO
+                ).with_for_update(of=Orden).all()
+                if not ordenes:
+                    break
+                creadas, monto, errores, sin_ncf = FacturacionLoteService._facturar_tramo(lote, ordenes, opciones)
+                hasta = sin_ncf[0].id - 1 if sin_ncf else ordenes[-1].id
+                lote.procesadas += sum(1 for o in ordenes if o.id <= hasta)
+                lote.facturas_creadas += creadas
+                lote.monto_total = Decimal(str(lote.monto_total or 0)) + monto
+                lote.ultima_orden_id = hasta
+                if errores:
+                    guardados = json.loads(lote.errores) if lote.errores else []
+                    lote.errores = json.dumps((guardados + errores)[:MAX_ERRORES_GUARDADOS])
+                lote.updated_at = datetime.utcnow()
+                db.session.commit()
+                yield {'evento': 'progreso', 'procesadas': lote.procesadas, 'total': lote.total_ordenes,
+                       'facturas_creadas': lote.facturas_creadas, 'errores': errores, 'sin_ncf': len(sin_ncf)}
+                faltan_ncf = bool(sin_ncf)
+            if faltan_ncf:
+                # Lo facturado queda; se reanuda cuando haya una secuencia NCF nueva
+                lote.estado = 'interrumpido'
+                lote.mensaje = (f"No hay NCF {opciones['tipo_comprobante']} suficientes: faltan al menos "
+                                f"{len(sin_ncf)}. Cargue una secuencia y reanude el lote.")
+            else:
+                lote.estado = 'completado'
+            db.session.commit()
+        except GeneratorExit:
+            # Cliente desconectado: lo confirmado queda, el resto se reanuda después
+            db.session.rollback()
+            lote.estado = 'interrumpido'
+            db.session.commit()
+            raise
+        except Exception as e:
+            db.session.rollback()
+            lote.estado = 'error'
+            lote.mensaje = str(e)
+            db.session.commit()
+        finally:
+            invalidate('reportes')
+        yield {'evento': 'fin', 'lote': lote.to_dict()}
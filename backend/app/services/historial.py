@@ -0,0 +1,123 @@
+"""
+Línea de tiempo del paciente (historial para el portal médico)
+Órdenes, estudios, resultados y facturas salen de un número fijo de consultas
+por conjunto y se arman en memoria, sin importar cuántos años de historial
+tenga el paciente. Se pagina por órdenes, de la más reciente a la más antigua.
+"""
+from collections import defaultdict
+from sqlalchemy import func, select, tuple_
+from app import db
+from app.models import Paciente, Orden, OrdenDetalle, Estudio, Resultado, Factura
+from app.models.serializacion import FACTURA_LISTADO
+
+
+class HistorialService:
+
+    @staticmethod
+    def totales(paciente_id):
+        """
+        Cantidad de órdenes, facturas y resultados del paciente (una consulta).
+        Resultados = estudios disponibles que tienen al menos un Resultado, como la lista plana.
+        """
+        ordenes = select(func.count(Orden.id)).where(Orden.paciente_id == paciente_id).scalar_subquery()
+        facturas = select(func.count(Factura.id)).where(Factura.paciente_id == paciente_id).scalar_subquery()
+        resultados = select(func.count(OrdenDetalle.id)).join(
+            Orden, Orden.id == OrdenDetalle.orden_id
+        ).where(
+            Orden.paciente_id == paciente_id,
+            OrdenDetalle.resultado_disponible == True,
+            select(Resultado.id).where(Resultado.orden_detalle_id == OrdenDetalle.id).exists()
+        ).scalar_subquery()
+        fila = db.session.execute(select(ordenes, facturas, resultados)).one()
+        return {'total_ordenes': fila[0], 'total_facturas': fila[1], 'total_resultados': fila[2]}
+
+    @staticmethod
+    def linea_de_tiempo(paciente_id, limite=50, despues_de=None):
+        """
+        Una página del historial: `limite` órdenes anteriores al cursor `despues_de`
+        (fecha_orden, id), con sus estudios y resultados, y las facturas del mismo período.
+        Devuelve (datos, cursor_siguiente o None).
+        """
+        query = Orden.query.filter(Orden.paciente_id == paciente_id)
+        if despues_de:
+            query = query.filter(tuple_(Orden.fecha_orden, Orden.id) < tuple_(*despues_de))
+        ordenes = query.order_by(Orden.fecha_orden.desc(), Orden.id.desc()).limit(limite + 1).all()
+
+        hay_mas = len(ordenes) > limite
+        ordenes = ordenes[:limite]
+        siguiente = (ordenes[-1].fecha_orden, ordenes[-1].id) if hay_mas else None
+
+        # Estudios de todas las órdenes de la página con su resultado (si hay) en una consulta
+        detalles = defaultdict(list)
+        resultados = []
+        if ordenes:
+            filas = db.session.query(
+                OrdenDetalle, Estudio.codigo, Estudio.nombre, Resultado
+            ).join(
+                Estudio, Estudio.id == OrdenDetalle.estudio_id
+            ).outerjoin(
+                Resultado, Resultado.orden_detalle_id == OrdenDetalle.id
+            ).filter(
+                OrdenDetalle.orden_id.in_([o.id for o in ordenes])
+            ).order_by(OrdenDetalle.id, Resultado.id).all()
+
+            por_detalle = {}
+            for detalle, codigo, nombre, resultado in filas:
+                item = por_detalle.get(detalle.id)
+                if item is None:
+                    item = por_detalle[detalle.id] = {
+                        'id': detalle.id,
+                        'accesion': detalle.accesion,
+                        'codigo': codigo,
+                        'estudio': nombre,
+                        'estado': detalle.estado,
+                        'precio_final': float(detalle.precio_final),
+                        'resultado_disponible': detalle.resultado_disponible,
+                        'fecha_resultado': detalle.fecha_resultado.isoformat() if detalle.fecha_resultado else None,
+                        'resultados': []
+                    }
+                    detalles[detalle.orden_id].append(item)
+                if resultado is not None:
+                    item['resultados'].append({
+                        'id': resultado.id,
+                        'tipo': resultado.tipo_archivo,
+                        'fecha': resultado.fecha_importacion.isoformat() if resultado.fecha_importacion else None,
+                        'estado_validacion': resultado.estado_validacion
+                    })
+                    # Lista plana: el primer resultado de cada estudio ya disponible
+                    if detalle.resultado_disponible and len(item['resultados']) == 1:
+                        resultados.append({
+                            'fecha': item['resultados'][0]['fecha'],
+                            'estudio': nombre,
+                            'tipo': resultado.tipo_archivo,
+                            'id': resultado.id
+                        })
+
+        # Facturas emitidas en el mismo tramo de tiempo que las órdenes de la página
+        facturas = FACTURA_LISTADO.preparar(Factura.query).filter(Factura.paciente_id == paciente_id)
+        if despues_de:
+            facturas = facturas.filter(Factura.fecha_factura < despues_de[0])
+        if hay_mas:
+            facturas = facturas.filter(Factura.fecha_factura >= ordenes[-1].fecha_orden)
+        facturas = facturas.order_by(Factura.fecha_factura.desc()).all()
+
+        # Todas las órdenes son del mismo paciente: se serializa una vez (mismo formato que Orden.to_dict)
+        paciente = db.session.get(Paciente, paciente_id)
+        datos_paciente = paciente.to_dict() if paciente else None
+
+        datos = {
+            'ordenes': [{
+                'id': o.id,
+                'numero_orden': o.numero_orden,
+                'paciente': datos_paciente,
+                'fecha_orden': o.fecha_orden.isoformat() if o.fecha_orden else None,
+                'estado': o.estado,
+                'prioridad': o.prioridad,
+                'medico_referente': o.medico_referente,
+                'total_estudios': len(detalles[o.id]),
+                'detalles': detalles[o.id]
+            } for o in ordenes],
+            'facturas': FACTURA_LISTADO.serializar(facturas),
+            'resultados': resultados
+        }
+        return datos, siguiente
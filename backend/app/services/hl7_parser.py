@@ -0,0 +1,188 @@
+"""
+Lector liviano de mensajes HL7 v2 (sin dependencias)
+Para la ingesta de resultados solo se necesitan unos pocos campos (MSH, PID,
+ORC/OBR, OBX): en vez de armar el árbol completo de hl7apy, el mensaje se
+separa en segmentos y cada segmento se divide en campos recién cuando se
+consulta; componentes, repeticiones y secuencias de escape se procesan solo
+para el valor pedido.
+- Separadores según MSH-1/MSH-2 (no se asume |^~\\&).
+- Segmentos separados por \\r, \\n o \\r\\n (los equipos usan los tres).
+"""
+from datetime import datetime
+from functools import lru_cache
+import re
+
+SEPARADORES_POR_DEFECTO = '^~\\&'
+
+# Secuencias de formato (\\H\\, \\N\\, \\.sp\\, ...) que no tienen equivalente en texto
+_SALTO_DE_LINEA = '.br'
+
+
+@lru_cache(maxsize=8)
+def _patron_escape(escape):
+    e = re.escape(escape)
+    return re.compile(f'{e}([^{e}]*){e}')
+
+
+def decodificar(valor, separadores):
+    """Reemplazar las secuencias de escape (\\F\\, \\S\\, \\T\\, \\R\\, \\E\\, \\Xhh\\) por su texto"""
+    campo, componente, repeticion, escape, subcomponente = separadores
+    if escape not in valor:
+        return valor
+    reemplazos = {'F': campo, 'S': componente, 'T': subcomponente, 'R': repeticion, 'E': escape,
+                  _SALTO_DE_LINEA: '\n'}
+
+    def reemplazar(coincidencia):
+        codigo = coincidencia.group(1)
+        if codigo in reemplazos:
+            return reemplazos[codigo]
+        if codigo[:1] == 'X':
+            try:
+                datos = bytes.fromhex(codigo[1:])
+            except ValueError:
+                return ''
+            try:
+                return datos.decode('utf-8')
+            except UnicodeDecodeError:
+                return datos.decode('latin-1')
+        return ''
+
+    return _patron_escape(escape).sub(reemplazar, valor)
+
+
+class SegmentoHL7:
+    """Un segmento; los campos se separan en el primer acceso"""
+    __slots__ = ('tipo', 'texto', 'mensaje', '_campos')
+
+    def __init__(self, texto, mensaje):
+        self.tipo = texto[:3]
+        self.texto = texto
+        self.mensaje = mensaje
+        self._campos = None
+
+    def er7(self, numero):
+        """Texto del campo tal como viene en el mensaje ('' si no existe)"""
+        if self._campos is None:
+            self._campos = self.texto.split(self.mensaje.separadores[0])
+        if self.tipo == 'MSH':
+            # MSH-1 es el propio separador: MSH-n está en la posición n-1
+            if numero == 1:
+                return self.mensaje.separadores[0]
+            numero -= 1
+        return self._campos[numero] if numero < len(self._campos) else ''
+
+    def valor(self, numero, componente=1, subcomponente=1, repeticion=1):
+        """Valor decodificado de un campo/componente/subcomponente (numeración HL7, desde 1)"""
+        separadores = self.mensaje.separadores
+        texto = self.er7(numero)
+        if not texto:
+            return ''
+        if separadores[2] in texto:
+            repeticiones = texto.split(separadores[2])
+            texto = repeticiones[repeticion - 1] if repeticion <= len(repeticiones) else ''
+        elif repeticion > 1:
+            return ''
+        for separador, posicion in ((separadores[1], componente), (separadores[4], subcomponente)):
+            if separador in texto:
+                partes = texto.split(separador)
+                texto = partes[posicion - 1] if posicion <= len(partes) else ''
+            elif posicion > 1:
+                return ''
+        return decodificar(texto, separadores)
+
+
+class MensajeHL7:
+
+    __slots__ = ('texto', 'separadores', '_crudos', '_por_tipo')
+
+    def __init__(self, texto):
+        if isinstance(texto, bytes):
+            try:
+                texto = texto.decode('utf-8')
+            except UnicodeDecodeError:
+                texto = texto.decode('latin-1')
+        # Restos del marco MLLP y espacios alrededor
+        texto = texto.strip('\x0b\x1c\r\n \t')
+        if not texto.startswith('MSH') or len(texto) < 4:
+            raise ValueError('El mensaje no empieza con MSH')
+        self.texto = texto
+        campo = texto[3]
+        fin = texto.find(campo, 4)
+        codificacion = texto[4:fin] if fin >= 0 else texto[4:8]
+        codificacion = (codificacion + SEPARADORES_POR_DEFECTO[len(codificacion):])[:4]
+        # (campo, componente, repetición, escape, subcomponente)
+        self.separadores = (campo,) + tuple(codificacion)
+        self._crudos = None
+        self._por_tipo = None
+
+    def _indice(self):
+        if self._por_tipo is None:
+            texto = self.texto
+            if '\n' in texto:
+                texto = texto.replace('\r\n', '\r').replace('\n', '\r')
+            self._crudos = [s for s in texto.split('\r') if s]
+            self._por_tipo = {}
+            for posicion, segmento in enumerate(self._crudos):
+                self._por_tipo.setdefault(segmento[:3], []).append(posicion)
+        return self._por_tipo
+
+    def segmentos(self, tipo=None):
+        """Segmentos de un tipo (o todos) en el orden del mensaje"""
+        indice = self._indice()
+        if tipo is None:
+            return [SegmentoHL7(s, self) for s in self._crudos]
+        return [SegmentoHL7(self._crudos[p], self) for p in indice.get(tipo, ())]
+
+    def segmento(self, tipo):
+        """Primer segmento del tipo, o None"""
+        posiciones = self._indice().get(tipo)
+        return SegmentoHL7(self._crudos[posiciones[0]], self) if posiciones else None
+
+    def valor(self, tipo, numero, componente=1, subcomponente=1, repeticion=1):
+        """Valor decodificado en el primer segmento del tipo ('' si no está)"""
+        segmento = self.segmento(tipo)
+        return segmento.valor(numero, componente, subcomponente, repeticion) if segmento else ''
+
+    def er7(self, tipo, numero):
+        segmento = self.segmento(tipo)
+        return segmento.er7(numero) if segmento else ''
+
+
+def fecha_hl7(valor):
+    """Fecha de un campo TS/DTM (AAAA[MM[DD[HH[MM[SS[.S]]]]]][+/-ZZZZ]) sin zona, o None"""
+    digitos = re.match(r'\d+', valor or '')
+    if not digitos or len(digitos.group()) < 8:
+        return None
+    texto = digitos.group()[:14]
+    try:
+        return datetime.strptime(texto, '%Y%m%d%H%M%S'[:len(texto) - 2])
+    except ValueError:
+        return None
+
+
+def parsear(texto):
+    """
+    Datos del paciente (PID) y resultados (OBX), con las mismas claves que
+    HL7Service.parse_hl7_file: los campos completos en su texto ER7 y el
+    nombre del estudio (OBX-3.2) decodificado.
+    """
+    mensaje = MensajeHL7(texto)
+    pid = mensaje.segmento('PID')
+    return {
+        'patient': {
+            'patient_id': (pid.er7(3) or None) if pid else None,
+            'name': (pid.er7(5) or None) if pid else None,
+            'dob': (pid.er7(7) or None) if pid else None,
+            'sex': (pid.er7(8) or None) if pid else None
+        },
+        'results': [{
+            'test_id': obx.er7(3) or None,
+            'test_name': obx.valor(3, 2) or None,
+            'value': obx.er7(5) or None,
+            'units': obx.er7(6) or None,
+            'reference_range': obx.er7(7) or None,
+            'status': obx.er7(11) or None
+        } for obx in mensaje.segmentos('OBX')],
+        'message_type': mensaje.er7('MSH', 9) or None,
+        'timestamp': datetime.now().isoformat()
+    }
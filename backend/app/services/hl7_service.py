@@ -1,7 +1,6 @@
-from hl7apy.parser import parse_message
 from hl7apy.core import Message
 from datetime import datetime
-import os
+from app.services.hl7_parser import parsear
 
 class HL7Service:
     
@@ -9,38 +8,8 @@ class HL7Service:
     def parse_hl7_file(filepath):
         """Parsear archivo HL7 y extraer datos del paciente y resultados"""
         try:
-            with open(filepath, 'r') as f:
-                hl7_content = f.read()
-            
-            message = parse_message(hl7_content)
-            
-            # Extraer datos del paciente (PID segment)
-            pid = message.pid
-            patient_data = {
-                'patient_id': str(pid.pid_3) if pid.pid_3 else None,
-                'name': str(pid.pid_5) if pid.pid_5 else None,
-                'dob': str(pid.pid_7) if pid.pid_7 else None,
-                'sex': str(pid.pid_8) if pid.pid_8 else None
-            }
-            
-            # Extraer resultados (OBX segments)
-            results = []
-            for obx in message.obx:
-                results.append({
-                    'test_id': str(obx.obx_3) if obx.obx_3 else None,
-                    'test_name': str(obx.obx_3.obx_3_2) if obx.obx_3.obx_3_2 else None,
-                    'value': str(obx.obx_5) if obx.obx_5 else None,
-                    'units': str(obx.obx_6) if obx.obx_6 else None,
-                    'reference_range': str(obx.obx_7) if obx.obx_7 else None,
-                    'status': str(obx.obx_11) if obx.obx_11 else None
-                })
-            
-            return {
-                'patient': patient_data,
-                'results': results,
-                'message_type': str(message.msh.msh_9) if message.msh.msh_9 else None,
-                'timestamp': datetime.now().isoformat()
-            }
+            with open(filepath, 'rb') as f:
+                return parsear(f.read())
         except Exception as e:
             raise Exception(f"Error parsing HL7: {str(e)}")
     
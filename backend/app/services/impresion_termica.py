@@ -202,16 +202,16 @@ class ImpresionTermica:
         return buffer
     
     @staticmethod
-    def generar_etiqueta_muestra(paciente, orden, estudio_nombre):
-        """Etiqueta para tubo de muestra 50x25mm"""
+    def generar_etiqueta_muestra(paciente, orden, estudio_nombre, accesion):
+        """Etiqueta para tubo de muestra 50x25mm; el código de barras es la accesión del estudio"""
         ancho = 50 * MM
         alto = 25 * MM
         
         buffer = BytesIO()
         c = canvas.Canvas(buffer, pagesize=(ancho, alto))
         
-        # Código de barras
-        codigo = paciente.codigo_paciente or f"P{paciente.id:06d}"
+        # Código de barras: el equipo lo lee del tubo y lo devuelve con el resultado
+        codigo = accesion
         barcode = code128.Code128(codigo, barHeight=7*MM, barWidth=0.25*MM)
         barcode.drawOn(c, 2*MM, alto-10*MM)
         
@@ -220,7 +220,7 @@ class ImpresionTermica:
         c.drawString(2*MM, alto-13*MM, f"{paciente.nombre} {paciente.apellido}"[:25])
         
         c.setFont("Helvetica", 6)
-        c.drawString(2*MM, alto-16*MM, f"Cod: {codigo}")
+        c.drawString(2*MM, alto-16*MM, f"Acc: {codigo}")
         c.drawString(2*MM, alto-19*MM, f"Ord: {orden.numero_orden}")
         c.drawString(2*MM, alto-22*MM, estudio_nombre[:25])
         
@@ -0,0 +1,440 @@
+"""
+Ingesta de resultados de los equipos con escritura diferida
+Recibir un resultado ya no abre una conexión ni hace commit: el registro se
+agrega (con fsync) a un diario local del proceso y se responde enseguida.
+Un hilo de fondo rota el diario cada INGESTA_INTERVALO segundos (o al llegar a
+INGESTA_LOTE registros) y guarda los archivos cerrados en resultados con un
+INSERT de varias filas por lote, en una transacción, con el pool de conexiones.
+- Cada registro lleva un id_ingesta único: volver a guardar un archivo
+  (reintento, recuperación) no duplica resultados (ON CONFLICT DO NOTHING).
+- Recuperación: cada proceso tiene bloqueado (flock) su archivo abierto; un
+  archivo sin bloqueo es de un proceso que ya lo cerró o que murió, y cualquier
+  proceso lo guarda y lo borra. También: flask recuperar-ingesta.
+- El resultado va al estudio cuya accesión (código del tubo) trae el registro en
+  'muestras'; si no trae ninguna conocida, al último estudio de la orden.
+- Los registros cuya muestra/orden no existe (o con datos que la base no
+  acepta) van a rechazados.jsonl en el mismo directorio y a ingesta_rechazos.
+"""
+from datetime import datetime
+import atexit
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from flask import current_app
+from app import db
+from app.models import Orden, OrdenDetalle, ResultadoValor, IngestaRechazo
+from app.services.accesiones import AccesionService
+from app.services.hl7_parser import fecha_hl7
+from app.services.valores import ValoresService
+
+logger = logging.getLogger(__name__)
+
+# datos_hl7 y datos_dicom existen en la tabla pero el modelo Resultado no los declara
+_resultados = sa.Table(
+    'resultados', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('id_ingesta', sa.String(64)),
+    sa.Column('orden_detalle_id', sa.Integer), sa.Column('tipo_archivo', sa.String),
+    sa.Column('nombre_archivo', sa.String), sa.Column('ruta_archivo', sa.String),
+    sa.Column('tamano_bytes', sa.BigInteger), sa.Column('hash_archivo', sa.String),
+    sa.Column('datos_hl7', sa.Text), sa.Column('datos_dicom', sa.Text),
+    sa.Column('estado_validacion', sa.String), sa.Column('fecha_importacion', sa.DateTime),
+    sa.Column('created_at', sa.DateTime)
+)
+
+
+# Largo de las columnas de resultados: un valor más largo haría fallar todo el lote
+_LARGOS = {'id_ingesta': 64, 'tipo_archivo': 10, 'nombre_archivo': 255, 'ruta_archivo': 500, 'hash_archivo': 64}
+
+
+def _recortar(registro):
+    for campo, largo in _LARGOS.items():
+        valor = registro.get(campo)
+        if isinstance(valor, str) and len(valor) > largo:
+            registro[campo] = valor[:largo]
+    return registro
+
+
+def _fecha(texto, defecto):
+    try:
+        return datetime.fromisoformat(texto) if texto else defecto
+    except (TypeError, ValueError):
+        return defecto
+
+
+def _motivo(error):
+    return str(getattr(error, 'orig', None) or error).strip().splitlines()[0][:500]
+
+
+def nuevo_id(clave=None):
+    """id_ingesta: derivado de la clave del emisor (un reintento da el mismo id) o aleatorio"""
+    if clave:
+        return hashlib.sha256(clave.encode('utf-8')).hexdigest()[:32]
+    return uuid.uuid4().hex
+
+
+def registro_hl7(mensaje, texto, orden=None):
+    """Registro de ingesta de un mensaje HL7 leído con mllp.leer_mensaje"""
+    clave = None
+    fecha = fecha_hl7(mensaje['fecha_muestra'])
+    if mensaje['control_id']:
+        # El equipo reenvía el mismo MSH-7/MSH-10 si no recibió el ACK
+        clave = '|'.join(['hl7', mensaje['aplicacion'], mensaje['instalacion'],
+                          mensaje['fecha'], mensaje['control_id']])
+    return _recortar({
+        'id_ingesta': nuevo_id(clave),
+        'orden': str(orden or mensaje['orden']),
+        'tipo_archivo': 'hl7',
+        'nombre_archivo': f"resultado_hl7_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{mensaje['control_id']}.hl7",
+        'datos_hl7': texto,
+        'muestras': mensaje['muestras'],
+        'fecha_muestra': fecha.isoformat() if fecha else None,
+        'valores': mensaje['valores']
+    })
+
+
+def _detalles(referencias):
+    """referencia de orden (número o id) -> último orden_detalle de la orden"""
+    numeros = {r for r in referencias if r}
+    if not numeros:
+        return {}
+    ids = {int(r) for r in numeros if r.isdigit()}
+    filas = db.session.query(Orden.id, Orden.numero_orden, func.max(OrdenDetalle.id)).join(
+        OrdenDetalle, OrdenDetalle.orden_id == Orden.id
+    ).filter(
+        db.or_(Orden.numero_orden.in_(numeros), Orden.id.in_(ids))
+    ).group_by(Orden.id, Orden.numero_orden).all()
+    detalles = {}
+    for orden_id, numero_orden, detalle_id in filas:
+        detalles[numero_orden] = detalle_id
+        detalles[str(orden_id)] = detalle_id
+    return detalles
+
+
+def _fsync_directorio(directorio):
+    descriptor = os.open(directorio, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class _Diario:
+    """Diario del proceso: un archivo abierto (bloqueado) al que se agregan registros"""
+
+    def __init__(self, app, directorio, lote, intervalo, sincronizar):
+        self.app = app
+        self.directorio = directorio
+        self.lote = lote
+        self.intervalo = intervalo
+        self.sincronizar = sincronizar
+        self.lock = threading.Lock()
+        self.aviso = threading.Event()
+        self.secuencia = 0
+        self._abrir()
+        threading.Thread(target=self._vaciar_periodicamente, daemon=True, name='ingesta').start()
+        atexit.register(self.cerrar)
+
+    def _abrir(self):
+        self.secuencia += 1
+        nombre = f'{os.getpid()}-{int(time.time() * 1000)}-{self.secuencia}'
+        # Se crea con un nombre que recuperar() no lista y se renombra ya bloqueado:
+        # si no, otro proceso podría tomarlo vacío y borrarlo antes del flock
+        temporal = os.path.join(self.directorio, f'.abriendo-{nombre}')
+        self.descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o640)
+        fcntl.flock(self.descriptor, fcntl.LOCK_EX)
+        os.rename(temporal, os.path.join(self.directorio, f'diario-{nombre}.jsonl'))
+        if self.sincronizar:
+            _fsync_directorio(self.directorio)
+        self.pendientes = 0
+
+    def agregar(self, registro):
+        linea = (json.dumps(registro, default=str) + '\n').encode('utf-8')
+        with self.lock:
+            # Una sola escritura con O_APPEND: la línea queda entera o no queda
+            os.write(self.descriptor, linea)
+            if self.sincronizar:
+                os.fdatasync(self.descriptor)
+            self.pendientes += 1
+            lleno = self.pendientes >= self.lote
+        if lleno:
+            self.aviso.set()
+
+    def rotar(self):
+        """Cerrar el archivo actual (queda listo para guardar) y abrir otro"""
+        with self.lock:
+            if not self.pendientes:
+                return
+            os.close(self.descriptor)  # libera el flock
+            self._abrir()
+
+    def _vaciar_periodicamente(self):
+        while True:
+            self.aviso.wait(self.intervalo)
+            self.aviso.clear()
+            try:
+                self.rotar()
+                with self.app.app_context():
+                    IngestaService.recuperar()
+            except Exception:
+                # Base de datos caída: los archivos quedan y se reintenta en el próximo ciclo
+                logger.exception('No se pudo guardar el diario de ingesta')
+
+    def cerrar(self):
+        try:
+            self.rotar()
+            with self.app.app_context():
+                IngestaService.recuperar()
+        except Exception:
+            logger.exception('Diario de ingesta pendiente al salir (se recupera después)')
+
+
+_estado = {'pid': None, 'diario': None}
+_lock = threading.Lock()
+
+
+def _directorio():
+    directorio = os.path.abspath(current_app.config['INGESTA_DIR'])
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _diario():
+    # Se crea al primer uso en cada worker (después del fork de gunicorn)
+    with _lock:
+        if _estado['pid'] != os.getpid():
+            config = current_app.config
+            _estado['diario'] = _Diario(
+                current_app._get_current_object(), _directorio(),
+                config['INGESTA_LOTE'], config['INGESTA_INTERVALO'], config['INGESTA_FSYNC']
+            )
+            _estado['pid'] = os.getpid()
+        return _estado['diario']
+
+
+def _leer_archivo(ruta):
+    registros = []
+    with open(ruta, 'rb') as archivo:
+        for numero, linea in enumerate(archivo, 1):
+            try:
+                registros.append(json.loads(linea))
+            except ValueError:
+                # Última línea cortada por una caída durante la escritura
+                logger.warning('Línea %s ilegible en %s', numero, ruta)
+    return registros
+
+
+class IngestaService:
+
+    @staticmethod
+    def recibir(registro):
+        """Agregar un registro al diario; devuelve su id_ingesta"""
+        registro.setdefault('id_ingesta', nuevo_id())
+        registro.setdefault('recibido', datetime.now().isoformat())
+        _diario().agregar(_recortar(registro))
+        return registro['id_ingesta']
+
+    @staticmethod
+    def guardar(registros):
+        """
+        Insertar registros en resultados (una transacción, un INSERT de varias
+        filas). Si el lote falla por un dato inválido, se guarda registro por
+        registro (SAVEPOINT) y solo se rechazan los que fallan. Devuelve
+        {id_ingesta: (estado, dato)}: ('guardado', resultado_id), ('duplicado', None)
+        o ('rechazado', motivo).
+        """
+        accesiones = AccesionService.resolver(
+            [str(m) for r in registros for m in r.get('muestras') or () if m]
+        )
+
+        def por_muestra(registro):
+            for muestra in registro.get('muestras') or ():
+                detalle_id = accesiones.get(str(muestra).strip())
+                if detalle_id:
+                    return detalle_id
+            return None
+
+        detalles = _detalles([str(r.get('orden') or '') for r in registros if not por_muestra(r)])
+        ahora = datetime.now()
+        respuestas, filas, por_resultado = {}, [], {}
+        for registro in registros:
+            detalle_id = por_muestra(registro) or detalles.get(str(registro.get('orden') or ''))
+            if not detalle_id:
+                referencia = registro.get('orden') or ', '.join(registro.get('muestras') or ()) or '(sin orden)'
+                respuestas[registro['id_ingesta']] = ('rechazado', f'Orden o muestra no encontrada: {referencia}')
+                continue
+            _recortar(registro)
+            valores = registro.get('valores')
+            importado = _fecha(registro.get('recibido'), ahora)
+            por_resultado[registro['id_ingesta']] = (valores, _fecha(registro.get('fecha_muestra'), importado))
+            filas.append({
+                'id_ingesta': registro['id_ingesta'],
+                'orden_detalle_id': detalle_id,
+                'tipo_archivo': registro['tipo_archivo'],
+                'nombre_archivo': registro.get('nombre_archivo'),
+                'ruta_archivo': registro.get('ruta_archivo'),
+                'tamano_bytes': registro.get('tamano_bytes'),
+                'hash_archivo': registro.get('hash_archivo'),
+                'datos_hl7': registro.get('datos_hl7'),
+                'datos_dicom': json.dumps(valores) if valores is not None else None,
+                'estado_validacion': 'pendiente',
+                'fecha_importacion': importado,
+                'created_at': ahora
+            })
+
+        if filas:
+            try:
+                with db.session.begin_nested():
+                    insertados = IngestaService._insertar(filas, por_resultado)
+            except (DataError, IntegrityError):
+                # Un registro inválido no debe frenar a los demás (ni al resto del diario)
+                logger.warning('Lote de %s resultados con datos inválidos; se guarda de a uno', len(filas))
+                insertados = []
+                for fila in filas:
+                    try:
+                        with db.session.begin_nested():
+                            insertados += IngestaService._insertar([fila], por_resultado)
+                    except (DataError, IntegrityError) as e:
+                        respuestas[fila['id_ingesta']] = ('rechazado', f'Error al guardar: {_motivo(e)}')
+            db.session.commit()
+            for resultado_id, id_ingesta in insertados:
+                respuestas[id_ingesta] = ('guardado', resultado_id)
+            for fila in filas:
+                respuestas.setdefault(fila['id_ingesta'], ('duplicado', None))
+        return respuestas
+
+    @staticmethod
+    def _insertar(filas, por_resultado):
+        detalle_por_id = {fila['id_ingesta']: fila['orden_detalle_id'] for fila in filas}
+        insertados = db.session.execute(
+            pg_insert(_resultados).on_conflict_do_nothing(index_elements=['id_ingesta']).returning(
+                _resultados.c.id, _resultados.c.id_ingesta
+            ), filas
+        ).all()
+        # Los valores por analito van en la misma transacción; los duplicados ya los tienen
+        ValoresService.agregar([
+            (resultado_id, detalle_por_id[id_ingesta], *por_resultado[id_ingesta])
+            for resultado_id, id_ingesta in insertados
+        ])
+        return insertados
+
+    @staticmethod
+    def recuperar():
+        """Guardar y borrar los archivos de diario que ningún proceso tiene abiertos"""
+        directorio = _directorio()
+        lote = current_app.config['INGESTA_LOTE']
+        guardados = rechazados = 0
+        for ruta in sorted(glob.glob(os.path.join(directorio, 'diario-*.jsonl'))):
+            try:
+                descriptor = os.open(ruta, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # abierto por un proceso vivo (o ya lo está guardando otro)
+                if os.fstat(descriptor).st_nlink == 0:
+                    continue  # otro proceso lo guardó y lo borró mientras tanto
+
+                registros = [r for r in _leer_archivo(ruta) if isinstance(r, dict) and r.get('id_ingesta')]
+                for inicio in range(0, len(registros), lote):
+                    tramo = registros[inicio:inicio + lote]
+                    respuestas = IngestaService.guardar(tramo)
+                    fallidos = [(r, respuestas[r['id_ingesta']][1]) for r in tramo
+                                if respuestas[r['id_ingesta']][0] == 'rechazado']
+                    if fallidos:
+                        IngestaService._rechazar(directorio, fallidos)
+                    guardados += len(tramo) - len(fallidos)
+                    rechazados += len(fallidos)
+                os.unlink(ruta)
+            except Exception:
+                # Base de datos caída u otro error: el archivo queda para el próximo ciclo
+                # y se sigue con los demás
+                db.session.rollback()
+                logger.exception('No se pudo guardar el diario %s', ruta)
+            finally:
+                os.close(descriptor)
+        return guardados, rechazados
+
+    @staticmethod
+    def _rechazar(directorio, fallidos):
+        # En la base para que estado() lo informe; el registro completo, en el archivo
+        db.session.execute(
+            pg_insert(IngestaRechazo.__table__).on_conflict_do_nothing(index_elements=['id_ingesta']),
+            [{'id_ingesta': r['id_ingesta'], 'motivo': motivo[:500], 'fecha': datetime.now()} for r, motivo in fallidos]
+        )
+        db.session.commit()
+        with open(os.path.join(directorio, 'rechazados.jsonl'), 'a', encoding='utf-8') as archivo:
+            for registro, motivo in fallidos:
+                logger.warning('Resultado %s rechazado: %s', registro['id_ingesta'], motivo)
+                archivo.write(json.dumps({'motivo': motivo, 'fecha': datetime.now().isoformat(),
+                                          'registro': registro}, default=str) + '\n')
+
+    @staticmethod
+    def reconstruir_valores(lote=1000):
+        """
+        Llenar resultado_valores con los resultados guardados antes de que
+        existiera (o sin valores): decodifica datos_dicom o, si no, datos_hl7.
+        Recorre resultados por id en lotes; devuelve (resultados, valores).
+        """
+        from app.services.mllp import leer_mensaje
+
+        ultimo = procesados = total = 0
+        while True:
+            filas = db.session.execute(
+                sa.select(
+                    _resultados.c.id, _resultados.c.orden_detalle_id, _resultados.c.datos_dicom,
+                    _resultados.c.datos_hl7, _resultados.c.fecha_importacion
+                ).where(
+                    _resultados.c.id > ultimo,
+                    _resultados.c.orden_detalle_id.isnot(None),
+                    ~sa.exists().where(ResultadoValor.resultado_id == _resultados.c.id)
+                ).order_by(_resultados.c.id).limit(lote)
+            ).all()
+            if not filas:
+                return procesados, total
+            pendientes = []
+            for resultado_id, detalle_id, datos_dicom, datos_hl7, fecha in filas:
+                valores, fecha_muestra = datos_dicom, None
+                if isinstance(valores, str):
+                    try:
+                        valores = json.loads(valores)
+                    except ValueError:
+                        valores = None
+                if datos_hl7:
+                    try:
+                        mensaje = leer_mensaje(datos_hl7)
+                    except ValueError:
+                        mensaje = None
+                    if mensaje:
+                        valores = valores or mensaje['valores']
+                        fecha_muestra = fecha_hl7(mensaje['fecha_muestra'])
+                if valores:
+                    pendientes.append((resultado_id, detalle_id, valores, fecha_muestra or fecha or datetime.now()))
+            total += ValoresService.agregar(pendientes)
+            db.session.commit()
+            procesados += len(pendientes)
+            ultimo = filas[-1][0]
+
+    @staticmethod
+    def estado(id_ingesta):
+        resultado_id = db.session.execute(
+            sa.select(_resultados.c.id).where(_resultados.c.id_ingesta == id_ingesta)
+        ).scalar()
+        if resultado_id:
+            return {'id_ingesta': id_ingesta, 'estado': 'guardado', 'resultado_id': resultado_id}
+        rechazo = db.session.get(IngestaRechazo, id_ingesta)
+        if rechazo:
+            return {'id_ingesta': id_ingesta, 'estado': 'rechazado', 'motivo': rechazo.motivo}
+        return {'id_ingesta': id_ingesta, 'estado': 'pendiente'}
@@ -4,16 +4,26 @@ Recibe resultados vía HL7, DICOM o API REST desde las máquinas
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-import psycopg2
 import os
-import json
 from datetime import datetime
 import hashlib
+from app.services.ingesta import IngestaService, nuevo_id, registro_hl7
+from app.services.mllp import leer_mensaje
 
 maquinas_bp = Blueprint('maquinas', __name__)
 
-def get_db_connection():
-    return psycopg2.connect(os.getenv('DATABASE_URL'))
+def _id_ingesta(data):
+    """Si el equipo manda un id propio del envío, un reintento no duplica el resultado"""
+    return nuevo_id(f"envio|{data['id_mensaje']}") if data.get('id_mensaje') else nuevo_id()
+
+
+def _aceptado(id_ingesta, **extra):
+    return jsonify({
+        'success': True,
+        'id_ingesta': id_ingesta,
+        'message': 'Resultado recibido; se guardará en unos segundos',
+        **extra
+    }), 202
 
 @maquinas_bp.route('/recibir-hl7', methods=['POST'])
 def recibir_resultado_hl7():
@@ -33,65 +43,26 @@ def recibir_resultado_hl7():
         
         # Extraer información del mensaje HL7
         # Formato típico: MSH|^~\&|LAB|HOSPITAL|...
-        lineas = mensaje_hl7.split('\n')
+        try:
+            mensaje = leer_mensaje(mensaje_hl7)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         paciente_id = data.get('paciente_id')
         orden_id = data.get('orden_id')
         
-        if not paciente_id or not orden_id:
-            return jsonify({'error': 'paciente_id y orden_id son requeridos'}), 400
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Buscar orden_detalle_id
-        cur.execute("""
-            SELECT id FROM orden_detalles 
-            WHERE orden_id = %s 
-            ORDER BY id DESC LIMIT 1
-        """, (orden_id,))
-        
-        row = cur.fetchone()
-        if not row:
-            return jsonify({'error': 'Orden no encontrada'}), 404
-        
-        orden_detalle_id = row[0]
+        # Con la accesión del tubo en SPM-2 / OBR-3 no hace falta orden_id
+        if not paciente_id or not (orden_id or mensaje['muestras']):
+            return jsonify({'error': 'paciente_id y orden_id (o la accesión en el mensaje) son requeridos'}), 400
         
-        # Crear resultado
-        valores_json = data.get('valores', {})
+        # Valores de los OBX si el equipo no los envió aparte
+        registro = registro_hl7(mensaje, mensaje_hl7, orden_id)
+        if data.get('valores'):
+            registro['valores'] = data['valores']
+        if data.get('id_mensaje'):
+            registro['id_ingesta'] = _id_ingesta(data)
         
-        cur.execute("""
-            INSERT INTO resultados (
-                orden_detalle_id,
-                tipo_archivo,
-                nombre_archivo,
-                datos_hl7,
-                datos_dicom,
-                estado_validacion,
-                fecha_importacion,
-                created_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW())
-            RETURNING id
-        """, (
-            orden_detalle_id,
-            'hl7',
-            f'resultado_hl7_{datetime.now().strftime("%Y%m%d_%H%M%S")}.hl7',
-            mensaje_hl7,
-            json.dumps(valores_json),
-            'pendiente'
-        ))
-        
-        resultado_id = cur.fetchone()[0]
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'resultado_id': resultado_id,
-            'message': 'Resultado recibido y almacenado correctamente'
-        }), 201
+        return _aceptado(IngestaService.recibir(registro))
         
     except Exception as e:
         print(f"Error: {e}")
@@ -111,73 +82,37 @@ def recibir_resultado_dicom():
         archivo = request.files['archivo']
         paciente_id = request.form.get('paciente_id')
         orden_id = request.form.get('orden_id')
+        accesion = request.form.get('accesion')
         
-        if not paciente_id or not orden_id:
-            return jsonify({'error': 'paciente_id y orden_id son requeridos'}), 400
+        if not paciente_id or not (orden_id or accesion):
+            return jsonify({'error': 'paciente_id y orden_id (o accesion) son requeridos'}), 400
         
         # Guardar archivo
         upload_dir = '/home/opc/centro-diagnostico/uploads/dicom'
         os.makedirs(upload_dir, exist_ok=True)
         
-        filename = f'dicom_{orden_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.dcm'
+        filename = f'dicom_{orden_id or accesion}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.dcm'
         filepath = os.path.join(upload_dir, filename)
         archivo.save(filepath)
         
-        # Calcular hash
+        # Calcular hash por bloques (sin cargar la imagen completa en memoria)
+        file_hash = hashlib.md5()
         with open(filepath, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        
-        # Guardar en BD
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT id FROM orden_detalles 
-            WHERE orden_id = %s 
-            ORDER BY id DESC LIMIT 1
-        """, (orden_id,))
-        
-        row = cur.fetchone()
-        if not row:
-            return jsonify({'error': 'Orden no encontrada'}), 404
-        
-        orden_detalle_id = row[0]
-        
-        cur.execute("""
-            INSERT INTO resultados (
-                orden_detalle_id,
-                tipo_archivo,
-                nombre_archivo,
-                ruta_archivo,
-                tamano_bytes,
-                hash_archivo,
-                estado_validacion,
-                fecha_importacion,
-                created_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
-            RETURNING id
-        """, (
-            orden_detalle_id,
-            'dicom',
-            filename,
-            filepath,
-            os.path.getsize(filepath),
-            file_hash,
-            'pendiente'
-        ))
-        
-        resultado_id = cur.fetchone()[0]
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'resultado_id': resultado_id,
-            'filename': filename,
-            'message': 'Imagen DICOM recibida correctamente'
-        }), 201
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(bloque)
+        
+        id_ingesta = IngestaService.recibir({
+            'id_ingesta': _id_ingesta(request.form),
+            'orden': str(orden_id or ''),
+            'muestras': [accesion] if accesion else [],
+            'tipo_archivo': 'dicom',
+            'nombre_archivo': filename,
+            'ruta_archivo': filepath,
+            'tamano_bytes': os.path.getsize(filepath),
+            'hash_archivo': file_hash.hexdigest()
+        })
+        
+        return _aceptado(id_ingesta, filename=filename)
         
     except Exception as e:
         print(f"Error: {e}")
@@ -193,7 +128,10 @@ def recibir_resultado_json():
     {
         "paciente_id": 123,
         "orden_id": 456,
+        "accesion": "opcional: código del tubo (en vez de orden_id o además)",
         "tipo_estudio": "hemograma",
+        "fecha_muestra": "opcional, ISO: 2026-10-18T07:30",
+        "id_mensaje": "opcional, para que un reintento no duplique el resultado",
         "valores": {
             "hemoglobina": {"valor": 14.5, "unidad": "g/dL", "referencia": "12-16"},
             "leucocitos": {"valor": 7500, "unidad": "cel/µL", "referencia": "4000-11000"}
@@ -205,58 +143,27 @@ def recibir_resultado_json():
         
         paciente_id = data.get('paciente_id')
         orden_id = data.get('orden_id')
+        accesion = data.get('accesion')
         valores = data.get('valores', {})
         
-        if not paciente_id or not orden_id:
-            return jsonify({'error': 'paciente_id y orden_id son requeridos'}), 400
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Buscar orden_detalle
-        cur.execute("""
-            SELECT id FROM orden_detalles 
-            WHERE orden_id = %s 
-            ORDER BY id DESC LIMIT 1
-        """, (orden_id,))
-        
-        row = cur.fetchone()
-        if not row:
-            return jsonify({'error': 'Orden no encontrada'}), 404
-        
-        orden_detalle_id = row[0]
-        
-        # Insertar resultado
-        cur.execute("""
-            INSERT INTO resultados (
-                orden_detalle_id,
-                tipo_archivo,
-                nombre_archivo,
-                datos_dicom,
-                estado_validacion,
-                fecha_importacion,
-                created_at
-            ) VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-            RETURNING id
-        """, (
-            orden_detalle_id,
-            'json',
-            f'resultado_{data.get("tipo_estudio", "analisis")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json',
-            json.dumps(valores),
-            'pendiente'
-        ))
-        
-        resultado_id = cur.fetchone()[0]
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'resultado_id': resultado_id,
-            'message': 'Resultado recibido correctamente'
-        }), 201
+        if not paciente_id or not (orden_id or accesion):
+            return jsonify({'error': 'paciente_id y orden_id (o accesion) son requeridos'}), 400
+        
+        # Fecha de toma de la muestra para la evolución de los valores (por defecto, la de recepción)
+        try:
+            fecha_muestra = datetime.fromisoformat(data['fecha_muestra']) if data.get('fecha_muestra') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'fecha_muestra en formato ISO (YYYY-MM-DDTHH:MM)'}), 400
+        
+        return _aceptado(IngestaService.recibir({
+            'id_ingesta': _id_ingesta(data),
+            'orden': str(orden_id or ''),
+            'muestras': [str(accesion)] if accesion else [],
+            'tipo_archivo': 'json',
+            'fecha_muestra': fecha_muestra.isoformat() if fecha_muestra else None,
+            'nombre_archivo': f'resultado_{data.get("tipo_estudio", "analisis")}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json',
+            'valores': valores
+        }))
         
     except Exception as e:
         print(f"Error: {e}")
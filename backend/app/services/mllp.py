@@ -0,0 +1,297 @@
+"""
+Servidor MLLP (HL7 v2 sobre TCP) para los equipos de laboratorio
+Los analizadores mantienen una conexión abierta y envían cada mensaje como
+<VT> mensaje <FS><CR>; por cada uno se responde un ACK con MSA (AA aceptado,
+AE error de aplicación, AR rechazado).
+Los mensajes de todas las conexiones pasan a una etapa de persistencia que
+los guarda por lotes con IngestaService.guardar (una transacción y un INSERT
+de varias filas por lote); el ACK se envía después del commit, así un AA
+siempre es un resultado guardado, y un mensaje reenviado (mismo MSH-7/MSH-10)
+no se guarda dos veces.
+Se ejecuta como proceso aparte: flask servidor-mllp
+"""
+import asyncio
+import logging
+import signal
+import socket
+import time
+from datetime import datetime
+from app.services.hl7_parser import MensajeHL7
+from app.services.ingesta import IngestaService, registro_hl7
+
+INICIO = b'\x0b'
+FIN = b'\x1c\r'
+MAX_MENSAJE = 1024 * 1024
+# Tipos que se guardan como resultados; el resto se rechaza con AR
+TIPOS_RESULTADO = ('ORU', 'OUL')
+
+logger = logging.getLogger(__name__)
+
+# =====================
+# HL7
+# =====================
+
+def _componente(valor, separador, posicion=0):
+    partes = valor.split(separador)
+    return partes[posicion] if posicion < len(partes) else ''
+
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except ValueError:
+        return valor
+
+
+def leer_mensaje(texto):
+    """
+    Datos que el servidor necesita de un mensaje: cabecera MSH, referencia de
+    la orden (ORC-2 / OBR-2 / OBR-3), códigos de muestra (SPM-2, OBR-3, OBR-2)
+    para buscar la accesión y valores OBX en el formato de recibir-json.
+    """
+    mensaje = MensajeHL7(texto)
+    msh = mensaje.segmento('MSH')
+    orden = mensaje.valor('ORC', 2) or mensaje.valor('OBR', 2) or mensaje.valor('OBR', 3)
+
+    muestras = []
+    for spm in mensaje.segmentos('SPM'):
+        muestras += [spm.valor(2, 1), spm.valor(2, 2)]  # id de la muestra del solicitante / del laboratorio
+    for obr in mensaje.segmentos('OBR'):
+        muestras += [obr.valor(3), obr.valor(2)]
+    muestras = list(dict.fromkeys(m.strip() for m in muestras if m and m.strip()))
+
+    valores = {}
+    for obx in mensaje.segmentos('OBX'):
+        codigo = obx.valor(3) or obx.valor(3, 2)
+        if not codigo:
+            continue
+        valores[codigo] = {
+            'valor': _numero(obx.valor(5)),
+            'unidad': obx.valor(6),
+            'referencia': obx.valor(7),
+            'nombre': obx.valor(3, 2),
+            'bandera': obx.valor(8),
+            'estado': obx.valor(11)
+        }
+
+    # Los campos de MSH que se devuelven en el ACK se copian tal cual (ER7)
+    return {
+        'separadores': ''.join(mensaje.separadores),
+        'aplicacion': msh.er7(3), 'instalacion': msh.er7(4),
+        'destino': msh.er7(5), 'instalacion_destino': msh.er7(6),
+        'fecha': msh.er7(7), 'tipo': msh.er7(9), 'control_id': msh.er7(10), 'procesamiento': msh.er7(11) or 'P',
+        'version': msh.er7(12) or '2.5',
+        'orden': orden.strip(),
+        'muestras': muestras,
+        # Toma de la muestra: OBR-7, o SPM-17 en los OUL
+        'fecha_muestra': mensaje.valor('OBR', 7) or mensaje.valor('SPM', 17),
+        'valores': valores
+    }
+
+
+def _escapar(texto, separadores):
+    campo, componente, repeticion, escape, subcomponente = (separadores + '^~\\&')[:5]
+    texto = texto.replace(escape, f'{escape}E{escape}')
+    for caracter, codigo in ((campo, 'F'), (componente, 'S'), (repeticion, 'R'), (subcomponente, 'T')):
+        texto = texto.replace(caracter, f'{escape}{codigo}{escape}')
+    return texto.replace('\r', ' ').replace('\n', ' ')
+
+
+def construir_ack(mensaje, codigo, texto=''):
+    """ACK con MSA; mensaje es el dict de leer_mensaje (o None si no se pudo leer)"""
+    mensaje = mensaje or {}
+    separadores = mensaje.get('separadores') or '|^~\\&'
+    campo, componente = separadores[0], separadores[1]
+    evento = _componente(mensaje.get('tipo', ''), componente, 1)
+    msh = campo.join([
+        'MSH', separadores[1:],
+        mensaje.get('destino') or 'CENTRO_DIAGNOSTICO', mensaje.get('instalacion_destino') or 'LAB',
+        mensaje.get('aplicacion', ''), mensaje.get('instalacion', ''),
+        datetime.now().strftime('%Y%m%d%H%M%S'), '',
+        componente.join(['ACK', evento, 'ACK']) if evento else 'ACK',
+        f"ACK{int(time.time() * 1000)}", mensaje.get('procesamiento', 'P'), mensaje.get('version', '2.5')
+    ])
+    msa = campo.join(['MSA', codigo, mensaje.get('control_id', ''), _escapar(texto, separadores)])
+    return f'{msh}\r{msa}\r'
+
+
+def _decodificar(datos):
+    try:
+        return datos.decode('utf-8')
+    except UnicodeDecodeError:
+        return datos.decode('latin-1')
+
+
+# =====================
+# Persistencia por lotes
+# =====================
+
+class Persistencia:
+    """
+    Junta los mensajes que llegan de todas las conexiones y los guarda por
+    lotes en un hilo (la base de datos es bloqueante). Cada mensaje recibe un
+    futuro que se resuelve con (codigo_ack, texto) después del commit.
+    """
+
+    def __init__(self, app, tamano_lote=100, espera=0.05):
+        self.app = app
+        self.tamano_lote = tamano_lote
+        self.espera = espera
+        # Acotada: si la base de datos se atrasa, las conexiones dejan de leer
+        self.cola = asyncio.Queue(maxsize=tamano_lote * 10)
+        self.en_curso = 0
+
+    async def enviar(self, mensaje, texto):
+        futuro = asyncio.get_running_loop().create_future()
+        await self.cola.put((mensaje, texto, futuro))
+        return futuro
+
+    async def ejecutar(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self.cola.get()]
+            self.en_curso = 1
+            if self.espera and self.cola.qsize() < self.tamano_lote - 1:
+                await asyncio.sleep(self.espera)
+            while len(lote) < self.tamano_lote and not self.cola.empty():
+                lote.append(self.cola.get_nowait())
+
+            self.en_curso = len(lote)
+            try:
+                respuestas = await loop.run_in_executor(None, self._guardar, [(m, t) for m, t, _ in lote])
+            except Exception as e:
+                logger.exception('Error guardando lote de %s mensajes HL7', len(lote))
+                respuestas = [('AE', f'Error al guardar: {e}')] * len(lote)
+            for (_, _, futuro), respuesta in zip(lote, respuestas):
+                if not futuro.done():
+                    futuro.set_result(respuesta)
+            self.en_curso = 0
+
+    async def vaciar(self):
+        """Esperar a que todo lo encolado quede guardado"""
+        while not self.cola.empty() or self.en_curso:
+            await asyncio.sleep(0.05)
+
+    def _guardar(self, lote):
+        with self.app.app_context():
+            registros = [registro_hl7(mensaje, texto) for mensaje, texto in lote]
+            estados = IngestaService.guardar(registros)
+        respuestas = []
+        for registro in registros:
+            estado, dato = estados[registro['id_ingesta']]
+            if estado == 'guardado':
+                respuestas.append(('AA', f'Resultado {dato}'))
+            elif estado == 'duplicado':
+                respuestas.append(('AA', 'Resultado ya recibido'))
+            else:
+                respuestas.append(('AE', dato))
+        return respuestas
+
+
+# =====================
+# Servidor
+# =====================
+
+class ServidorMLLP:
+
+    def __init__(self, app, host='0.0.0.0', puerto=2575, tamano_lote=100, espera=0.05, inactividad=0):
+        self.app = app
+        self.host = host
+        self.puerto = puerto
+        self.inactividad = inactividad or None
+        self.persistencia = Persistencia(app, tamano_lote, espera)
+        self.conexiones = {}  # peer -> datos de la conexión
+
+    async def _leer(self, reader):
+        """Siguiente mensaje (bytes sin el marco) o None si el equipo cerró"""
+        while True:
+            try:
+                marco = await asyncio.wait_for(reader.readuntil(FIN), self.inactividad)
+            except asyncio.IncompleteReadError:
+                return None
+            inicio = marco.rfind(INICIO)
+            if inicio >= 0:
+                return marco[inicio + 1:-len(FIN)]
+            # Bytes fuera de un marco (ruido de línea): se descartan
+
+    async def _responder(self, writer, pendientes):
+        """Envía los ACK en el orden en que llegaron los mensajes"""
+        while True:
+            respuesta = await pendientes.get()
+            if respuesta is None:
+                return
+            mensaje, futuro = respuesta
+            codigo, texto = await futuro if isinstance(futuro, asyncio.Future) else futuro
+            writer.write(INICIO + construir_ack(mensaje, codigo, texto).encode('utf-8') + FIN)
+            await writer.drain()
+
+    async def _atender(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Detectar equipos apagados sin cerrar la conexión
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        conexion = self.conexiones[peer] = {'equipo': None, 'mensajes': 0, 'desde': datetime.now(), 'writer': writer}
+        logger.info('Equipo conectado: %s', peer)
+
+        # Lectura y respuesta separadas: un equipo que envía varios mensajes
+        # sin esperar el ACK los tiene en el mismo lote
+        pendientes = asyncio.Queue()
+        respondedor = asyncio.create_task(self._responder(writer, pendientes))
+        try:
+            while True:
+                datos = await self._leer(reader)
+                if datos is None:
+                    break
+                texto = _decodificar(datos)
+                try:
+                    mensaje = leer_mensaje(texto)
+                except ValueError as e:
+                    await pendientes.put((None, ('AR', str(e))))
+                    continue
+                conexion['equipo'] = mensaje['aplicacion'] or conexion['equipo']
+                conexion['mensajes'] += 1
+                if _componente(mensaje['tipo'], mensaje['separadores'][1]) not in TIPOS_RESULTADO:
+                    await pendientes.put((mensaje, ('AR', f"Tipo de mensaje no soportado: {mensaje['tipo']}")))
+                    continue
+                await pendientes.put((mensaje, await self.persistencia.enviar(mensaje, texto)))
+        except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError) as e:
+            logger.warning('Conexión %s cerrada: %s', peer, e)
+        finally:
+            await pendientes.put(None)
+            try:
+                await respondedor
+            except ConnectionError:
+                pass
+            del self.conexiones[peer]
+            writer.close()
+            logger.info('Equipo desconectado: %s (%s, %s mensajes)', peer, conexion['equipo'], conexion['mensajes'])
+
+    async def servir(self):
+        servidor = await asyncio.start_server(self._atender, self.host, self.puerto, limit=MAX_MENSAJE)
+        guardado = asyncio.create_task(self.persistencia.ejecutar())
+        detener = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(senal, detener.set)
+
+        logger.info('Servidor MLLP escuchando en %s:%s', self.host, self.puerto)
+        await detener.wait()
+        servidor.close()
+        # No leer más mensajes; guardar y confirmar lo ya recibido antes de cerrar
+        for conexion in self.conexiones.values():
+            conexion['writer'].transport.pause_reading()
+        await asyncio.sleep(0.1)
+        await self.persistencia.vaciar()
+        await asyncio.sleep(0.1)
+        for conexion in list(self.conexiones.values()):
+            conexion['writer'].close()
+        for _ in range(50):
+            if not self.conexiones:
+                break
+            await asyncio.sleep(0.1)
+        await servidor.wait_closed()
+        guardado.cancel()
+
+    def ejecutar(self):
+        asyncio.run(self.servir())
@@ -0,0 +1,278 @@
+"""
+Asignación de NCF por bloques
+Cada proceso reserva un tramo corto de una secuencia (NCF_BLOQUE números) con
+SELECT ... FOR UPDATE SKIP LOCKED en su propia conexión y lo entrega desde
+memoria, así la facturación concurrente no se serializa sobre la fila de la
+secuencia y dos procesos nunca reciben el mismo número.
+- Si una serie está bloqueada por otro proceso, agotada o vencida se pasa a la
+  siguiente serie activa del mismo tipo.
+- Los números de un bloque que no llegan a una factura (reinicio del proceso,
+  factura que falla) se registran en ncf_huecos para el reporte a la DGII.
+"""
+from collections import deque
+from datetime import datetime, timedelta, date
+import atexit
+import os
+import socket
+import threading
+import time
+from flask import current_app
+from sqlalchemy import func, select, update, insert
+from app import db
+from app.models import NCFSecuencia, NCFBloque, NCFHueco, Factura
+
+REINTENTOS = 20
+ESPERA_REINTENTO = 0.05
+# Un bloque más viejo que esto se descarta antes de usarlo; los bloques sin
+# liberar más viejos que ABANDONO_HORAS se consideran de un proceso caído
+BLOQUE_MAX_HORAS = 12
+ABANDONO_HORAS = 24
+# Espera antes de revisar un bloque liberado (facturas que aún no confirman)
+GRACIA_MINUTOS = 10
+
+
+def formatear_ncf(tipo, serie, numero):
+    return f"{tipo}-{serie}-{str(numero).zfill(8)}"
+
+
+def ncf_dgii(ncf):
+    """NCF como lo recibe la DGII: tipo + secuencia de 8 dígitos (B02-001-00000001 -> B0200000001)"""
+    partes = ncf.split('-') if ncf else []
+    if len(partes) != 3:
+        return ncf
+    return f"{partes[0]}{partes[2][-8:].zfill(8)}"
+
+
+class _Bloque:
+    __slots__ = ('id', 'secuencia_id', 'tipo', 'serie', 'inicio', 'fin', 'reservado_en', 'pendientes')
+
+    def __init__(self, id_, secuencia_id, tipo, serie, inicio, fin):
+        self.id = id_
+        self.secuencia_id = secuencia_id
+        self.tipo = tipo
+        self.serie = serie
+        self.inicio = inicio
+        self.fin = fin
+        self.reservado_en = datetime.utcnow()
+        self.pendientes = deque(range(inicio, fin + 1))
+
+    def vencido(self):
+        return datetime.utcnow() - self.reservado_en > timedelta(hours=BLOQUE_MAX_HORAS)
+
+
+# Bloques en uso por este proceso: tipo -> _Bloque
+_bloques = {}
+_estado = {'pid': None, 'engine': None}
+_lock = threading.Lock()
+
+
+def _bloques_del_proceso():
+    """Tras un fork el hijo no debe usar los bloques del padre"""
+    if _estado['pid'] != os.getpid():
+        _bloques.clear()
+        _estado['pid'] = os.getpid()
+        atexit.register(NCFService.liberar)
+    return _bloques
+
+
+class NCFService:
+
+    @staticmethod
+    def _reservar(tipo, tamano):
+        """Reservar un bloque de la primera serie disponible (None si no queda ninguna)"""
+        hoy = date.today()
+        disponibles = select(NCFSecuencia.id, NCFSecuencia.serie, NCFSecuencia.secuencia_actual,
+                             NCFSecuencia.secuencia_fin).where(
+            NCFSecuencia.tipo_comprobante == tipo,
+            NCFSecuencia.activo == True,
+            NCFSecuencia.secuencia_actual <= NCFSecuencia.secuencia_fin,
+            NCFSecuencia.fecha_vencimiento > hoy
+        ).order_by(NCFSecuencia.fecha_vencimiento, NCFSecuencia.id)
+
+        engine = db.engine
+        _estado['engine'] = engine
+        for _ in range(REINTENTOS):
+            with engine.begin() as conexion:
+                fila = conexion.execute(disponibles.with_for_update(skip_locked=True).limit(1)).first()
+                if fila is None:
+                    # Todas bloqueadas por otros procesos (reintentar) o ninguna disponible
+                    if conexion.execute(disponibles.limit(1)).first() is None:
+                        return None
+                else:
+                    inicio = fila.secuencia_actual
+                    fin = min(fila.secuencia_fin, inicio + tamano - 1)
+                    conexion.execute(update(NCFSecuencia).where(NCFSecuencia.id == fila.id).values(
+                        secuencia_actual=fin + 1
+                    ))
+                    bloque_id = conexion.execute(insert(NCFBloque).values(
+                        secuencia_id=fila.id, tipo_comprobante=tipo, serie=fila.serie,
+                        inicio=inicio, fin=fin, proceso=f"{socket.gethostname()}:{os.getpid()}",
+                        reservado_en=datetime.utcnow(), revisado=False
+                    ).returning(NCFBloque.id)).scalar()
+                    return _Bloque(bloque_id, fila.id, tipo, fila.serie, inicio, fin)
+            time.sleep(ESPERA_REINTENTO)
+        raise RuntimeError(f'No se pudo reservar NCF {tipo}: secuencias ocupadas')
+
+    @staticmethod
+    def _cerrar(conexion, bloque):
+        """
+        Marcar el bloque como liberado. Si es el último tramo reservado de su
+        serie, los números sin usar del final se devuelven a la secuencia.
+        """
+        pendientes = set(bloque.pendientes)
+        primero_libre = bloque.fin + 1
+        while primero_libre - 1 >= bloque.inicio and primero_libre - 1 in pendientes:
+            primero_libre -= 1
+        fin = bloque.fin
+        if primero_libre <= bloque.fin:
+            devueltos = conexion.execute(update(NCFSecuencia).where(
+                NCFSecuencia.id == bloque.secuencia_id,
+                NCFSecuencia.secuencia_actual == bloque.fin + 1
+            ).values(secuencia_actual=primero_libre)).rowcount
+            if devueltos:
+                fin = primero_libre - 1
+        conexion.execute(update(NCFBloque).where(NCFBloque.id == bloque.id).values(
+            fin=fin, liberado_en=datetime.utcnow()
+        ))
+
+    @staticmethod
+    def siguiente(tipo='B02'):
+        """Siguiente NCF del tipo; None si no quedan secuencias vigentes"""
+        ncfs = NCFService.siguientes(tipo, 1)
+        return ncfs[0] if ncfs else None
+
+    @staticmethod
+    def siguientes(tipo, cantidad):
+        """`cantidad` NCF del tipo en orden (menos si se agotan las secuencias vigentes)"""
+        tamano = current_app.config.get('NCF_BLOQUE', 20)
+        ncfs = []
+        with _lock:
+            bloques = _bloques_del_proceso()
+            while len(ncfs) < cantidad:
+                bloque = bloques.get(tipo)
+                if bloque is not None and (not bloque.pendientes or bloque.vencido()):
+                    with db.engine.begin() as conexion:
+                        NCFService._cerrar(conexion, bloque)
+                    del bloques[tipo]
+                    bloque = None
+                if bloque is None:
+                    # Para pedidos grandes (facturación por lotes) un solo bloque del tamaño necesario
+                    bloque = NCFService._reservar(tipo, max(tamano, cantidad - len(ncfs)))
+                    if bloque is None:
+                        break
+                    bloques[tipo] = bloque
+                while bloque.pendientes and len(ncfs) < cantidad:
+                    ncfs.append(formatear_ncf(tipo, bloque.serie, bloque.pendientes.popleft()))
+        return ncfs
+
+    @staticmethod
+    def devolver(ncf):
+        """
+        Devolver un NCF cuya factura no se guardó; será el próximo en entregarse.
+        Para devolver varios, hacerlo del último al primero.
+        """
+        tipo, serie, numero = ncf.rsplit('-', 2)
+        with _lock:
+            bloque = _bloques_del_proceso().get(tipo)
+            numero = int(numero)
+            if bloque is not None and bloque.serie == serie and bloque.inicio <= numero <= bloque.fin \
+                    and numero not in bloque.pendientes:
+                bloque.pendientes.appendleft(numero)
+
+    @staticmethod
+    def liberar():
+        """Cerrar los bloques de este proceso (al terminar el worker)"""
+        with _lock:
+            if _estado['pid'] != os.getpid() or not _bloques or _estado['engine'] is None:
+                return
+            try:
+                with _estado['engine'].begin() as conexion:
+                    for bloque in _bloques.values():
+                        NCFService._cerrar(conexion, bloque)
+            finally:
+                _bloques.clear()
+
+    @staticmethod
+    def registrar_huecos(gracia_minutos=GRACIA_MINUTOS):
+        """
+        Revisar los bloques liberados (o abandonados) y registrar como huecos
+        los números que no aparecen en ninguna factura. Devuelve cuántos se registraron.
+        """
+        ahora = datetime.utcnow()
+        bloques = NCFBloque.query.filter(
+            NCFBloque.revisado == False,
+            db.or_(
+                NCFBloque.liberado_en < ahora - timedelta(minutes=gracia_minutos),
+                db.and_(NCFBloque.liberado_en.is_(None),
+                        NCFBloque.reservado_en < ahora - timedelta(hours=ABANDONO_HORAS))
+            )
+        ).order_by(NCFBloque.id).all()
+
+        total = 0
+        for bloque in bloques:
+            numeros = {
+                formatear_ncf(bloque.tipo_comprobante, bloque.serie, n): n
+                for n in range(bloque.inicio, bloque.fin + 1)
+            }
+            usados = {ncf for (ncf,) in db.session.query(Factura.ncf).filter(Factura.ncf.in_(list(numeros)))} \
+                if numeros else set()
+            registrados = {ncf for (ncf,) in db.session.query(NCFHueco.ncf).filter(NCFHueco.ncf.in_(list(numeros)))} \
+                if numeros else set()
+            for ncf in numeros:
+                if ncf not in usados and ncf not in registrados:
+                    db.session.add(NCFHueco(
+                        ncf=ncf, tipo_comprobante=bloque.tipo_comprobante, secuencia_id=bloque.secuencia_id,
+                        bloque_id=bloque.id, motivo='no_emitido' if bloque.liberado_en else 'proceso_abandonado'
+                    ))
+                    total += 1
+            bloque.revisado = True
+            if bloque.liberado_en is None:
+                bloque.liberado_en = ahora
+        db.session.commit()
+        return total
+
+    @staticmethod
+    def pronostico(dias=30):
+        """
+        Por tipo de comprobante: NCF disponibles en las series vigentes, consumo
+        diario de los últimos `dias` días y fecha estimada de agotamiento.
+        """
+        hoy = date.today()
+        series = db.session.query(
+            NCFSecuencia.tipo_comprobante,
+            func.sum(NCFSecuencia.secuencia_fin - NCFSecuencia.secuencia_actual + 1),
+            func.min(NCFSecuencia.fecha_vencimiento),
+            func.count(NCFSecuencia.id)
+        ).filter(
+            NCFSecuencia.activo == True,
+            NCFSecuencia.secuencia_actual <= NCFSecuencia.secuencia_fin,
+            NCFSecuencia.fecha_vencimiento > hoy
+        ).group_by(NCFSecuencia.tipo_comprobante).all()
+
+        desde = datetime.now() - timedelta(days=dias)
+        consumo = dict(db.session.query(Factura.tipo_comprobante, func.count(Factura.id)).filter(
+            Factura.ncf.isnot(None),
+            Factura.fecha_factura >= desde
+        ).group_by(Factura.tipo_comprobante).all())
+
+        # Tipos que se siguen facturando pero ya no tienen serie vigente
+        vigentes = {fila[0] for fila in series}
+        series = list(series) + [(tipo, 0, None, 0) for tipo in consumo if tipo and tipo not in vigentes]
+
+        resultado = []
+        for tipo, disponibles, vencimiento, cantidad_series in series:
+            por_dia = consumo.get(tipo, 0) / dias
+            dias_restantes = int(disponibles / por_dia) if por_dia else None
+            agotamiento = hoy + timedelta(days=dias_restantes) if dias_restantes is not None else None
+            limite = min((d for d in (agotamiento, vencimiento) if d is not None), default=None)
+            resultado.append({
+                'tipo_comprobante': tipo,
+                'series_vigentes': cantidad_series,
+                'disponibles': int(disponibles),
+                'consumo_diario': round(por_dia, 2),
+                'dias_restantes': dias_restantes,
+                'fecha_agotamiento': agotamiento.isoformat() if agotamiento else None,
+                'proximo_vencimiento': vencimiento.isoformat() if vencimiento else None,
+                'alerta': not disponibles or (limite is not None and (limite - hoy).days < 30)
+            })
+        return resultado
@@ -0,0 +1,54 @@
+"""
+Numeración de facturas, órdenes y muestras
+Cada serie lleva un contador por período en la tabla numeradores. Reservar
+números es un solo INSERT ... ON CONFLICT DO UPDATE ... RETURNING: O(1), sin
+contar filas, y la fila queda bloqueada solo durante esa sentencia porque se
+ejecuta en su propia conexión (se confirma enseguida, fuera de la transacción
+de la factura). Si la transacción de la factura falla, el número se pierde:
+puede haber saltos, nunca repetidos.
+"""
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+
+_RESERVAR = text("""
+    INSERT INTO numeradores (serie, periodo, valor)
+    VALUES (:serie, :periodo, :cantidad)
+    ON CONFLICT (serie, periodo) DO UPDATE SET valor = numeradores.valor + EXCLUDED.valor
+    RETURNING valor
+""")
+
+
+class NumeracionService:
+
+    @staticmethod
+    def reservar(serie, periodo, cantidad=1):
+        """Reservar `cantidad` números consecutivos; devuelve el primero"""
+        if cantidad < 1:
+            raise ValueError('cantidad debe ser mayor que cero')
+        with db.engine.begin() as conexion:
+            ultimo = conexion.execute(
+                _RESERVAR, {'serie': serie, 'periodo': periodo, 'cantidad': cantidad}
+            ).scalar()
+        return ultimo - cantidad + 1
+
+    @staticmethod
+    def numeros_factura(cantidad=1):
+        """FAC-YYYY-000001, contador anual"""
+        anio = datetime.now().strftime('%Y')
+        primero = NumeracionService.reservar('factura', anio, cantidad)
+        return [f"FAC-{anio}-{str(n).zfill(6)}" for n in range(primero, primero + cantidad)]
+
+    @staticmethod
+    def numeros_orden(cantidad=1):
+        """ORD-YYMM-00001, contador mensual"""
+        periodo = datetime.now().strftime('%y%m')
+        primero = NumeracionService.reservar('orden', periodo, cantidad)
+        return [f"ORD-{periodo}-{str(n).zfill(5)}" for n in range(primero, primero + cantidad)]
+
+    @staticmethod
+    def numeros_accesion(cantidad=1):
+        """AAMMDD00001 (solo dígitos, para el código de barras), contador diario"""
+        periodo = datetime.now().strftime('%y%m%d')
+        primero = NumeracionService.reservar('accesion', periodo, cantidad)
+        return [f"{periodo}{str(n).zfill(5)}" for n in range(primero, primero + cantidad)]
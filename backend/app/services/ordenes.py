@@ -0,0 +1,133 @@
+"""
+Creación de órdenes (una o por lotes)
+Los estudios se leen con una sola consulta IN de los que piden las órdenes
+(precio y estado al momento, nunca de un cache por worker), los pacientes con
+otra consulta IN y las órdenes y sus detalles se insertan en bloque dentro de
+una transacción. Cada detalle recibe su número de accesión (código del tubo)
+al crearse.
+"""
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert
+from app import db
+from app.models import Orden, OrdenDetalle, Paciente, Estudio
+from app.services.numeracion import NumeracionService
+
+MAX_ORDENES_LOTE = 1000
+
+
+def _estudio_id(est):
+    try:
+        return int(est.get('estudio_id'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class OrdenService:
+
+    @staticmethod
+    def catalogo(ids):
+        """{estudio_id: {'precio': Decimal, 'nombre', 'codigo'}} de los estudios activos entre `ids`"""
+        if not ids:
+            return {}
+        filas = db.session.query(Estudio.id, Estudio.precio, Estudio.nombre, Estudio.codigo).filter(
+            Estudio.id.in_(ids),
+            Estudio.activo == True
+        ).all()
+        return {f.id: {'precio': Decimal(f.precio), 'nombre': f.nombre, 'codigo': f.codigo} for f in filas}
+
+    @staticmethod
+    def validar(items):
+        """
+        Revisar todas las órdenes antes de insertar.
+        Devuelve (validas, errores); cada válida trae sus detalles ya calculados.
+        """
+        items = [item if isinstance(item, dict) else {} for item in items]
+        catalogo = OrdenService.catalogo({
+            _estudio_id(est) for item in items for est in (item.get('estudios') or [])
+        } - {None})
+        ids_pacientes = {item.get('paciente_id') for item in items if isinstance(item.get('paciente_id'), int)}
+        existentes = {
+            pid for (pid,) in db.session.query(Paciente.id).filter(Paciente.id.in_(ids_pacientes))
+        } if ids_pacientes else set()
+
+        validas, errores = [], []
+        for indice, item in enumerate(items):
+            error = None
+            detalles = []
+            if not item.get('paciente_id') or not item.get('estudios'):
+                error = 'paciente_id y estudios requeridos'
+            elif item['paciente_id'] not in existentes:
+                error = f"Paciente {item['paciente_id']} no encontrado"
+            else:
+                for est in item['estudios']:
+                    estudio_id = _estudio_id(est)
+                    estudio = catalogo.get(estudio_id)
+                    if estudio is None:
+                        error = f"Estudio {est.get('estudio_id') if isinstance(est, dict) else est} no encontrado"
+                        break
+                    try:
+                        descuento = Decimal(str(est.get('descuento', 0) or 0))
+                    except InvalidOperation:
+                        error = 'Descuento inválido'
+                        break
+                    if descuento < 0 or descuento > estudio['precio']:
+                        error = f"Descuento inválido para {estudio['codigo']}"
+                        break
+                    detalles.append({
+                        'estudio_id': estudio_id,
+                        'precio': estudio['precio'],
+                        'descuento': descuento,
+                        'precio_final': estudio['precio'] - descuento,
+                        'estado': 'pendiente'
+                    })
+            if error:
+                errores.append({'indice': indice, 'paciente_id': item.get('paciente_id'), 'error': error})
+            else:
+                validas.append((indice, item, detalles))
+        return validas, errores
+
+    @staticmethod
+    def crear_ordenes(items, usuario_id, todo_o_nada=False):
+        """
+        Crear varias órdenes en una transacción.
+        Con todo_o_nada=True no se crea ninguna si alguna tiene errores.
+        Devuelve (creadas, errores).
+        """
+        validas, errores = OrdenService.validar(items)
+        if not validas or (errores and todo_o_nada):
+            return [], errores
+
+        numeros = NumeracionService.numeros_orden(len(validas))
+        todos = [detalle for _, _, detalles in validas for detalle in detalles]
+        for detalle, accesion in zip(todos, NumeracionService.numeros_accesion(len(todos))):
+            detalle['accesion'] = accesion
+        ids = db.session.scalars(
+            insert(Orden).returning(Orden.id, sort_by_parameter_order=True),
+            [{
+                'numero_orden': numero,
+                'paciente_id': item['paciente_id'],
+                'medico_referente': item.get('medico_referente', ''),
+                'prioridad': item.get('prioridad', 'normal'),
+                'observaciones': item.get('observaciones'),
+                'usuario_registro_id': usuario_id,
+                'estado': 'pendiente'
+            } for numero, (_, item, _) in zip(numeros, validas)]
+        ).all()
+
+        db.session.execute(insert(OrdenDetalle), [
+            dict(detalle, orden_id=orden_id)
+            for orden_id, (_, _, detalles) in zip(ids, validas)
+            for detalle in detalles
+        ])
+        db.session.commit()
+
+        creadas = [{
+            'indice': indice,
+            'id': orden_id,
+            'numero_orden': numero,
+            'paciente_id': item['paciente_id'],
+            'total_estudios': len(detalles),
+            'accesiones': [d['accesion'] for d in detalles],
+            'total': float(sum(d['precio_final'] for d in detalles))
+        } for orden_id, numero, (indice, item, detalles) in zip(ids, numeros, validas)]
+        return creadas, errores
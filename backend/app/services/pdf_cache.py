@@ -0,0 +1,144 @@
+"""
+Cache en disco de los PDF generados (facturas, recibos, tickets, etiquetas)
+La clave es un hash del tipo de documento y de todo lo que cambia su
+contenido (id, updated_at, pagos...): si el documento no cambió, volver a
+descargarlo es enviar el archivo, sin pasar otra vez por ReportLab.
+- Escritura atómica: se genera en un archivo temporal del mismo directorio y
+  se renombra, así dos descargas simultáneas nunca ven un PDF a medio escribir.
+- Tamaño acotado (PDF_CACHE_MAX_BYTES): se borran los menos usados.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models import Pago, OrdenDetalle
+
+# Subir cuando cambie el diseño de algún documento para no servir PDFs viejos
+VERSION_PLANTILLAS = 1
+# Revisar el tamaño del directorio como máximo una vez por este intervalo
+INTERVALO_PODA = 60
+
+_estado = {'ultima_poda': 0}
+_lock = threading.Lock()
+
+
+def directorio_cache():
+    directorio = current_app.config.get('PDF_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pdf_cache')
+    # Ruta absoluta: send_file resuelve las relativas desde el paquete de la app
+    directorio = os.path.abspath(directorio)
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _podar(directorio, maximo):
+    """Borrar los PDF menos usados hasta quedar en el 90% del máximo"""
+    archivos = []
+    total = 0
+    for raiz, _, nombres in os.walk(directorio):
+        for nombre in nombres:
+            if nombre.endswith('.tmp'):
+                continue  # temporales de una generación en curso
+            ruta = os.path.join(raiz, nombre)
+            try:
+                info = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, ruta))
+            total += info.st_size
+    if total <= maximo:
+        return 0
+    borrados = 0
+    for _, tamano, ruta in sorted(archivos):
+        if total <= maximo * 0.9:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamano
+            borrados += 1
+        except FileNotFoundError:
+            pass
+    return borrados
+
+
+class PDFCache:
+
+    @staticmethod
+    def clave(tipo, *partes):
+        datos = '|'.join([tipo, str(VERSION_PLANTILLAS)] + [str(p) for p in partes])
+        return hashlib.sha256(datos.encode()).hexdigest()
+
+    @staticmethod
+    def obtener(tipo, partes, generar, extension='pdf'):
+        """
+        Ruta del PDF en cache; si no existe se genera con generar(ruta_temporal),
+        que debe escribir el PDF en esa ruta.
+        """
+        clave = PDFCache.clave(tipo, *partes)
+        directorio = directorio_cache()
+        subdirectorio = os.path.join(directorio, clave[:2])
+        ruta = os.path.join(subdirectorio, f'{clave}.{extension}')
+
+        if os.path.exists(ruta):
+            try:
+                os.utime(ruta)  # marca de uso para la poda
+                return ruta
+            except FileNotFoundError:
+                pass  # borrado por la poda entre medio: se genera de nuevo
+
+        os.makedirs(subdirectorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=subdirectorio, suffix='.tmp')
+        os.close(descriptor)
+        try:
+            generar(temporal)
+            os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+        PDFCache._podar_si_toca(directorio)
+        return ruta
+
+    @staticmethod
+    def obtener_buffer(tipo, partes, generar_buffer, extension='pdf'):
+        """Igual que obtener() para generadores que devuelven un BytesIO"""
+        def generar(ruta):
+            with open(ruta, 'wb') as archivo:
+                shutil.copyfileobj(generar_buffer(), archivo)
+        return PDFCache.obtener(tipo, partes, generar, extension)
+
+    @staticmethod
+    def _podar_si_toca(directorio):
+        ahora = time.monotonic()
+        with _lock:
+            if ahora - _estado['ultima_poda'] < INTERVALO_PODA:
+                return
+            _estado['ultima_poda'] = ahora
+        _podar(directorio, current_app.config.get('PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+    # =====================
+    # Versión de cada documento
+    # =====================
+
+    @staticmethod
+    def version_factura(factura):
+        """Todo lo que se imprime en la factura: cabecera, detalles y pagos"""
+        pagos = db.session.query(
+            func.count(Pago.id), func.max(Pago.id), func.coalesce(func.sum(Pago.monto), 0)
+        ).filter(Pago.factura_id == factura.id).one()
+        return (factura.id, factura.updated_at, factura.estado, factura.ncf, factura.total,
+                factura.saldo, factura.paciente.updated_at if factura.paciente else None) + tuple(pagos)
+
+    @staticmethod
+    def version_orden(orden):
+        detalles = db.session.query(
+            func.count(OrdenDetalle.id), func.max(OrdenDetalle.id),
+            func.coalesce(func.sum(OrdenDetalle.precio_final), 0)
+        ).filter(OrdenDetalle.orden_id == orden.id).one()
+        return (orden.id, orden.updated_at, orden.estado,
+                orden.paciente.updated_at if orden.paciente else None) + tuple(detalles)
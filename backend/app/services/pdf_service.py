@@ -5,8 +5,26 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from datetime import datetime
+from functools import lru_cache
 import os
 
+
+@lru_cache(maxsize=1)
+def _estilos():
+    """Hoja de estilos de la factura (se arma una vez por proceso)"""
+    styles = getSampleStyleSheet()
+    return {
+        'titulo': ParagraphStyle('CustomTitle', parent=styles['Heading1'],
+                                 fontSize=20, textColor=colors.HexColor('#2c3e50'),
+                                 spaceAfter=10, alignment=TA_CENTER),
+        'subtitulo': ParagraphStyle('Subtitle', parent=styles['Normal'],
+                                    fontSize=10, textColor=colors.grey,
+                                    alignment=TA_CENTER, spaceAfter=20),
+        'factura': ParagraphStyle('FactTitle', fontSize=14, alignment=TA_CENTER, spaceAfter=15),
+        'pie': ParagraphStyle('Footer', fontSize=8, textColor=colors.grey, alignment=TA_CENTER),
+    }
+
+
 class PDFService:
     
     @staticmethod
@@ -19,25 +37,15 @@ class PDFService:
                                     leftMargin=0.5*inch, rightMargin=0.5*inch,
                                     topMargin=0.5*inch, bottomMargin=0.5*inch)
             elements = []
-            styles = getSampleStyleSheet()
-            
-            # Estilos personalizados
-            title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], 
-                                         fontSize=20, textColor=colors.HexColor('#2c3e50'), 
-                                         spaceAfter=10, alignment=TA_CENTER)
-            
-            subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'],
-                                            fontSize=10, textColor=colors.grey,
-                                            alignment=TA_CENTER, spaceAfter=20)
+            estilos = _estilos()
             
             # Header
-            elements.append(Paragraph("MI ESPERANZA CENTRO DIAGNOSTICO", title_style))
-            elements.append(Paragraph("RNC: 000-00000-0 | Tel: 809-000-0000", subtitle_style))
+            elements.append(Paragraph("MI ESPERANZA CENTRO DIAGNOSTICO", estilos['titulo']))
+            elements.append(Paragraph("RNC: 000-00000-0 | Tel: 809-000-0000", estilos['subtitulo']))
             elements.append(Spacer(1, 0.2*inch))
             
             # Título factura
-            elements.append(Paragraph(f"<b>FACTURA {factura.numero_factura}</b>", 
-                                      ParagraphStyle('FactTitle', fontSize=14, alignment=TA_CENTER, spaceAfter=15)))
+            elements.append(Paragraph(f"<b>FACTURA {factura.numero_factura}</b>", estilos['factura']))
             
             # Info factura y paciente
             paciente = factura.paciente
@@ -105,9 +113,8 @@ class PDFService:
             elements.append(Spacer(1, 0.5*inch))
             
             # Footer
-            footer_style = ParagraphStyle('Footer', fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
-            elements.append(Paragraph("Gracias por su preferencia", footer_style))
-            elements.append(Paragraph(f"Documento generado el {datetime.now().strftime('%d/%m/%Y %H:%M')}", footer_style))
+            elements.append(Paragraph("Gracias por su preferencia", estilos['pie']))
+            elements.append(Paragraph(f"Documento generado el {datetime.now().strftime('%d/%m/%Y %H:%M')}", estilos['pie']))
             
             doc.build(elements)
             return output_path
@@ -0,0 +1,347 @@
+"""
+Generación de PDFs, etiquetas y QR fuera del request
+ReportLab y qrcode usan CPU: en vez de generarlos dentro de un worker sync de
+gunicorn, los trabajos se encolan y los ejecuta un pool acotado de procesos
+(RENDER_PROCESOS). El cliente recibe un id, consulta el estado (con espera
+larga opcional) y descarga el archivo cuando está listo.
+Carriles de prioridad: un trabajo de 'mostrador' (recibo, ticket) pasa delante
+de los 'normal' y 'lote' en cola, y los de 'lote' nunca ocupan todos los procesos
+(por eso el pool tiene al menos 2, aunque RENDER_PROCESOS sea 1).
+El estado de cada trabajo es un JSON en disco, así cualquier worker de la
+máquina puede responder la consulta; el archivo generado queda en PDFCache.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from multiprocessing import get_context
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from flask import current_app
+from app.services.pdf_cache import PDFCache
+
+PRIORIDADES = {'mostrador': 0, 'normal': 1, 'lote': 2}
+MAX_EN_COLA = 500
+# Los estados de trabajos terminados se borran pasado este tiempo
+VIDA_TRABAJO = 3600
+ESPERA_MAXIMA = 25
+
+
+# =====================
+# Documentos que se pueden generar
+# =====================
+
+def _factura(parametros):
+    from app.models import Factura
+    from app.services.pdf_service import PDFService
+    factura = Factura.query.get(parametros['factura_id'])
+    if not factura:
+        raise LookupError('Factura no encontrada')
+    ruta = PDFCache.obtener('factura', PDFCache.version_factura(factura),
+                            lambda r: PDFService.generar_factura_pdf(factura, r))
+    return ruta, f'factura_{factura.numero_factura}.pdf'
+
+
+def _factura_80mm(parametros):
+    from app.models import Factura
+    from app.services.impresion_service import ImpresionService
+    factura = Factura.query.get(parametros['factura_id'])
+    if not factura:
+        raise LookupError('Factura no encontrada')
+    ruta = PDFCache.obtener_buffer('factura_80mm', PDFCache.version_factura(factura),
+                                   lambda: ImpresionService.generar_factura_80mm(factura))
+    return ruta, f'factura_{factura.numero_factura}_80mm.pdf'
+
+
+def _recibo_pago(parametros):
+    from app.models import Pago
+    from app.services.impresion_termica import ImpresionTermica
+    pago = Pago.query.get(parametros['pago_id'])
+    if not pago or not pago.factura:
+        raise LookupError('Pago no encontrado')
+    factura = pago.factura
+    ruta = PDFCache.obtener_buffer(
+        'recibo_pago', (pago.id, pago.monto, pago.fecha_pago) + PDFCache.version_factura(factura),
+        lambda: ImpresionTermica.generar_recibo_pago(factura, pago)
+    )
+    return ruta, f'recibo_{pago.id}.pdf'
+
+
+def _ticket_orden(parametros):
+    from app.models import Orden
+    from app.services.impresion_termica import ImpresionTermica
+    orden = Orden.query.get(parametros['orden_id'])
+    if not orden:
+        raise LookupError('Orden no encontrada')
+    ruta = PDFCache.obtener_buffer('ticket_orden', PDFCache.version_orden(orden),
+                                   lambda: ImpresionTermica.generar_ticket_orden(orden))
+    return ruta, f'ticket_{orden.numero_orden}.pdf'
+
+
+def _etiqueta(parametros):
+    from app.models import OrdenDetalle
+    from app.services.accesiones import AccesionService
+    from app.services.impresion_termica import ImpresionTermica
+    detalle = OrdenDetalle.query.get(parametros['detalle_id'])
+    if not detalle or detalle.orden_id != parametros['orden_id']:
+        raise LookupError('Estudio de la orden no encontrado')
+    accesion = AccesionService.asignar(detalle)
+    orden = detalle.orden
+    paciente = orden.paciente
+    estudio_nombre = detalle.estudio.nombre if detalle.estudio else 'Estudio'
+    # La etiqueta lleva la fecha de impresión: una versión por día
+    ruta = PDFCache.obtener_buffer(
+        'etiqueta', (detalle.id, accesion, orden.numero_orden, estudio_nombre, paciente.id, paciente.updated_at,
+                     date.today()),
+        lambda: ImpresionTermica.generar_etiqueta_muestra(paciente, orden, estudio_nombre, accesion)
+    )
+    return ruta, f'etiqueta_{paciente.id}_{detalle.id}.pdf'
+
+
+def _qr_factura(parametros):
+    from app.services.qr_service import QRService
+    import base64
+    from io import BytesIO
+    factura_id, codigo = parametros['factura_id'], parametros['codigo']
+    # El QR se genera solo si no está en el cache
+    ruta = PDFCache.obtener_buffer(
+        'qr_factura', (factura_id, codigo),
+        lambda: BytesIO(base64.b64decode(QRService.generar_qr_factura(factura_id, codigo)['qr_base64'])),
+        extension='png'
+    )
+    return ruta, f"qr_factura_{parametros['factura_id']}.png"
+
+
+# tipo -> (función, parámetros requeridos)
+DOCUMENTOS = {
+    'factura': (_factura, ('factura_id',)),
+    'factura_80mm': (_factura_80mm, ('factura_id',)),
+    'recibo_pago': (_recibo_pago, ('pago_id',)),
+    'ticket_orden': (_ticket_orden, ('orden_id',)),
+    'etiqueta': (_etiqueta, ('orden_id', 'detalle_id')),
+    'qr_factura': (_qr_factura, ('factura_id', 'codigo')),
+}
+
+
+def generar_documento(tipo, parametros):
+    """Generar en este proceso (con contexto de app). Devuelve (ruta, nombre de descarga)"""
+    funcion, _ = DOCUMENTOS[tipo]
+    return funcion(parametros)
+
+
+# =====================
+# Procesos del pool
+# =====================
+
+_app_proceso = None
+
+
+def _iniciar_proceso():
+    """Cada proceso del pool arma su propia app (y su propio pool de conexiones)"""
+    global _app_proceso
+    from run import application
+    _app_proceso = application
+
+
+def _generar_en_proceso(tipo, parametros):
+    with _app_proceso.app_context():
+        return generar_documento(tipo, parametros)
+
+
+# =====================
+# Estado de los trabajos (JSON en disco)
+# =====================
+
+def _ruta_trabajo(directorio, trabajo_id):
+    return os.path.join(directorio, f'{trabajo_id}.json')
+
+
+def _guardar(directorio, trabajo):
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as archivo:
+        json.dump(trabajo, archivo)
+    os.replace(temporal, _ruta_trabajo(directorio, trabajo['id']))
+
+
+def _limpiar(directorio):
+    limite = time.time() - VIDA_TRABAJO
+    for entrada in os.scandir(directorio):
+        try:
+            if entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+        except FileNotFoundError:
+            pass
+
+
+class _Despachador:
+    """Cola con prioridad delante de un ProcessPoolExecutor (uno por worker de gunicorn)"""
+
+    def __init__(self, procesos, directorio):
+        # Siempre queda un proceso libre para mostrador, también con RENDER_PROCESOS=1
+        self.procesos = max(2, procesos)
+        self.max_lote = self.procesos - 1
+        self.directorio = directorio
+        self.pool = self._crear_pool()
+        self.cola = []
+        self.secuencia = itertools.count()
+        self.activos = 0
+        self.activos_lote = 0
+        self.eventos = {}  # id -> Event, para la espera larga en este worker
+        self.condicion = threading.Condition()
+        self.ultima_limpieza = 0
+        threading.Thread(target=self._despachar, daemon=True, name='render').start()
+
+    def _crear_pool(self):
+        # spawn: los procesos no heredan conexiones ni hilos del worker
+        return ProcessPoolExecutor(max_workers=self.procesos, mp_context=get_context('spawn'),
+                                   initializer=_iniciar_proceso)
+
+    def encolar(self, trabajo):
+        with self.condicion:
+            if len(self.cola) >= MAX_EN_COLA:
+                raise OverflowError('Cola de impresión llena')
+            self.eventos[trabajo['id']] = threading.Event()
+            heapq.heappush(self.cola, (PRIORIDADES[trabajo['prioridad']], next(self.secuencia), trabajo))
+            self.condicion.notify()
+        if time.monotonic() - self.ultima_limpieza > 60:
+            self.ultima_limpieza = time.monotonic()
+            _limpiar(self.directorio)
+
+    def _siguiente(self):
+        """Trabajo de mayor prioridad que puede arrancar ahora (None si hay que esperar)"""
+        if not self.cola or self.activos >= self.procesos:
+            return None
+        prioridad = self.cola[0][0]
+        # Si el primero es de lote, todos los que esperan son de lote
+        if prioridad == PRIORIDADES['lote'] and self.activos_lote >= self.max_lote:
+            return None
+        return heapq.heappop(self.cola)[2]
+
+    def _despachar(self):
+        while True:
+            with self.condicion:
+                trabajo = self._siguiente()
+                while trabajo is None:
+                    self.condicion.wait()
+                    trabajo = self._siguiente()
+                self.activos += 1
+                if trabajo['prioridad'] == 'lote':
+                    self.activos_lote += 1
+            trabajo['estado'] = 'procesando'
+            trabajo['iniciado'] = time.time()
+            _guardar(self.directorio, trabajo)
+            try:
+                futuro = self.pool.submit(_generar_en_proceso, trabajo['tipo'], trabajo['parametros'])
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. sin memoria): se reemplaza el pool completo
+                self.pool = self._crear_pool()
+                futuro = self.pool.submit(_generar_en_proceso, trabajo['tipo'], trabajo['parametros'])
+            futuro.add_done_callback(lambda f, t=trabajo: self._terminado(t, f))
+
+    def _terminado(self, trabajo, futuro):
+        try:
+            trabajo['ruta'], trabajo['nombre'] = futuro.result()
+            trabajo['estado'] = 'listo'
+        except Exception as e:
+            trabajo['estado'] = 'error'
+            trabajo['error'] = str(e)
+            # La factura, orden o pago no existe (404 en vez de 500)
+            trabajo['no_encontrado'] = isinstance(e, LookupError)
+        trabajo['terminado'] = time.time()
+        _guardar(self.directorio, trabajo)
+        with self.condicion:
+            self.activos -= 1
+            if trabajo['prioridad'] == 'lote':
+                self.activos_lote -= 1
+            evento = self.eventos.pop(trabajo['id'], None)
+            self.condicion.notify()
+        if evento:
+            evento.set()
+
+
+_estado = {'pid': None, 'despachador': None}
+_lock = threading.Lock()
+
+
+def _directorio_trabajos():
+    directorio = os.path.abspath(current_app.config['RENDER_TRABAJOS_DIR'])
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _despachador():
+    # Se crea al primer uso en cada worker (después del fork de gunicorn)
+    with _lock:
+        if _estado['pid'] != os.getpid():
+            _estado['despachador'] = _Despachador(current_app.config.get('RENDER_PROCESOS', 2),
+                                                  _directorio_trabajos())
+            _estado['pid'] = os.getpid()
+        return _estado['despachador']
+
+
+class RenderService:
+
+    @staticmethod
+    def encolar(tipo, parametros, prioridad='normal', usuario_id=None):
+        """Encolar un documento; devuelve el estado inicial del trabajo"""
+        if tipo not in DOCUMENTOS:
+            raise ValueError(f'Tipo de documento desconocido: {tipo}')
+        if prioridad not in PRIORIDADES:
+            raise ValueError(f'Prioridad inválida: {prioridad}')
+        faltantes = [p for p in DOCUMENTOS[tipo][1] if parametros.get(p) in (None, '')]
+        if faltantes:
+            raise ValueError(f"Parámetros requeridos: {', '.join(faltantes)}")
+
+        try:
+            # Los *_id llegan del JSON como número o texto
+            parametros = {p: int(parametros[p]) if p.endswith('_id') else parametros[p]
+                          for p in DOCUMENTOS[tipo][1]}
+        except (TypeError, ValueError):
+            raise ValueError('Los parámetros *_id deben ser enteros')
+
+        trabajo = {
+            'id': uuid.uuid4().hex,
+            'tipo': tipo,
+            'parametros': parametros,
+            'prioridad': prioridad,
+            'estado': 'en_cola',
+            'usuario_id': usuario_id,
+            'creado': time.time()
+        }
+        despachador = _despachador()
+        _guardar(despachador.directorio, trabajo)
+        inicial = dict(trabajo)  # el despachador modifica el dict desde su hilo
+        despachador.encolar(trabajo)
+        return inicial
+
+    @staticmethod
+    def estado(trabajo_id, esperar=0):
+        """
+        Estado del trabajo (None si no existe). Con esperar > 0 se espera hasta
+        ese número de segundos a que termine.
+        """
+        if not trabajo_id.isalnum():
+            return None
+        directorio = _directorio_trabajos()
+        limite = time.monotonic() + min(max(esperar, 0), ESPERA_MAXIMA)
+        despachador = _estado['despachador'] if _estado['pid'] == os.getpid() else None
+        while True:
+            try:
+                with open(_ruta_trabajo(directorio, trabajo_id)) as archivo:
+                    trabajo = json.load(archivo)
+            except FileNotFoundError:
+                return None
+            restante = limite - time.monotonic()
+            if trabajo['estado'] in ('listo', 'error') or restante <= 0:
+                return trabajo
+            # Encolado en este worker: esperar el aviso; si no, consultar el archivo
+            evento = despachador.eventos.get(trabajo_id) if despachador else None
+            if evento:
+                evento.wait(restante)
+            else:
+                time.sleep(min(0.2, restante))
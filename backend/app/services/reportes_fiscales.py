@@ -0,0 +1,233 @@
+"""
+Reportes fiscales para la DGII
+Formato 607 (ventas de bienes y servicios) en el TXT oficial delimitado por
+barras y en XLSX. Las facturas del mes se leen con un cursor del lado del
+servidor (yield_per) y se escriben a medida que llegan, así la memoria no
+depende de cuántas facturas tenga el mes.
+También cruza los NCF emitidos en el mes con ncf_secuencias para encontrar
+huecos que no estén justificados en ncf_huecos.
+"""
+from datetime import datetime
+from decimal import Decimal
+import tempfile
+from sqlalchemy import func, case, text
+from app import db
+from app.models import Factura, Paciente, Pago, Configuracion
+from app.services.ncf import ncf_dgii
+from app.utils.busqueda import solo_digitos
+
+FILAS_POR_BLOQUE = 500
+# Huecos que se listan como máximo (el total se informa siempre)
+MAX_HUECOS_LISTADOS = 1000
+
+# Columnas del formato 607 (norma 07-2018)
+COLUMNAS_607 = [
+    'RNC/Cédula o Pasaporte', 'Tipo Identificación', 'Número Comprobante Fiscal',
+    'Número Comprobante Fiscal Modificado', 'Tipo de Ingreso', 'Fecha Comprobante',
+    'Fecha de Retención', 'Monto Facturado', 'ITBIS Facturado', 'ITBIS Retenido por Terceros',
+    'ITBIS Percibido', 'Retención Renta por Terceros', 'ISR Percibido',
+    'Impuesto Selectivo al Consumo', 'Otros Impuestos/Tasas', 'Monto Propina Legal',
+    'Efectivo', 'Cheque/ Transferencia/ Depósito', 'Tarjeta Débito/Crédito', 'Venta a Crédito',
+    'Bonos o Certificados de Regalo', 'Permuta', 'Otras Formas de Ventas'
+]
+
+# metodo_pago -> columna de forma de venta; lo no pagado va a "Venta a Crédito"
+FORMAS_DE_VENTA = {
+    'efectivo': 'efectivo',
+    'cheque': 'banco',
+    'transferencia': 'banco',
+    'tarjeta': 'tarjeta',
+    'mixto': 'otras'
+}
+
+# NCF emitidos en el período, separados en tipo, serie y número
+_CTE_USADOS = r"""
+    WITH usados AS (
+        SELECT split_part(ncf, '-', 1) AS tipo, split_part(ncf, '-', 2) AS serie,
+               split_part(ncf, '-', 3)::bigint AS numero
+        FROM facturas
+        WHERE fecha_factura >= :desde AND fecha_factura < :hasta
+          AND ncf ~ '^[A-Z][0-9]{2}-[0-9A-Z]{1,3}-[0-9]+$'
+    )
+"""
+
+# Primer y último número emitido en el período por cada secuencia autorizada
+_CTE_RANGOS = _CTE_USADOS + """
+    , rangos AS (
+        SELECT s.id, s.tipo_comprobante, s.serie,
+               MIN(u.numero) AS primero, MAX(u.numero) AS ultimo, COUNT(*) AS emitidos
+        FROM ncf_secuencias s
+        JOIN usados u ON u.tipo = s.tipo_comprobante AND u.serie = s.serie
+                     AND u.numero BETWEEN s.secuencia_inicio AND s.secuencia_fin
+        GROUP BY s.id, s.tipo_comprobante, s.serie
+    )
+"""
+
+
+def periodo_mes(anio, mes):
+    """(inicio, inicio del mes siguiente)"""
+    desde = datetime(anio, mes, 1)
+    hasta = datetime(anio + (mes == 12), mes % 12 + 1, 1)
+    return desde, hasta
+
+
+def _monto(valor):
+    return f"{Decimal(str(valor or 0)):.2f}"
+
+
+def _identificacion(cedula, pasaporte):
+    """(número, tipo): 1 = RNC, 2 = cédula, 3 = pasaporte"""
+    digitos = solo_digitos(cedula or '')
+    if len(digitos) == 9:
+        return digitos, '1'
+    if len(digitos) == 11:
+        return digitos, '2'
+    if pasaporte:
+        return pasaporte.strip(), '3'
+    return '', ''
+
+
+class ReporteFiscalService:
+
+    @staticmethod
+    def rnc_empresa():
+        valor = db.session.query(Configuracion.valor).filter(Configuracion.clave == 'empresa_rnc').scalar()
+        return solo_digitos(valor or '')
+
+    @staticmethod
+    def _query_607(desde, hasta):
+        pagado = {
+            forma: func.coalesce(func.sum(case(
+                (Pago.metodo_pago.in_([m for m, f in FORMAS_DE_VENTA.items() if f == forma]), Pago.monto),
+                else_=0
+            )), 0).label(forma)
+            for forma in ('efectivo', 'banco', 'tarjeta', 'otras')
+        }
+        pagos = db.session.query(Pago.factura_id, *pagado.values()).group_by(Pago.factura_id).subquery()
+
+        return db.session.query(
+            Factura.ncf, Factura.fecha_factura, Factura.subtotal, Factura.descuento, Factura.itbis,
+            Factura.otros_impuestos, Factura.total, Paciente.cedula, Paciente.pasaporte,
+            pagos.c.efectivo, pagos.c.banco, pagos.c.tarjeta, pagos.c.otras
+        ).outerjoin(
+            Paciente, Paciente.id == Factura.paciente_id
+        ).outerjoin(
+            pagos, pagos.c.factura_id == Factura.id
+        ).filter(
+            Factura.fecha_factura >= desde,
+            Factura.fecha_factura < hasta,
+            Factura.ncf.isnot(None),
+            Factura.estado != 'anulada'
+        ).order_by(Factura.fecha_factura, Factura.id)
+
+    @staticmethod
+    def contar_607(anio, mes):
+        desde, hasta = periodo_mes(anio, mes)
+        return ReporteFiscalService._query_607(desde, hasta).order_by(None).with_entities(
+            func.count(Factura.id)
+        ).scalar()
+
+    @staticmethod
+    def filas_607(anio, mes):
+        """Registros del 607 (listas de 23 valores) leídos por tandas del cursor"""
+        desde, hasta = periodo_mes(anio, mes)
+        for f in ReporteFiscalService._query_607(desde, hasta).yield_per(1000):
+            numero, tipo = _identificacion(f.cedula, f.pasaporte)
+            efectivo, banco, tarjeta, otras = (Decimal(str(v or 0)) for v in (f.efectivo, f.banco, f.tarjeta, f.otras))
+            total = Decimal(str(f.total))
+            credito = max(total - efectivo - banco - tarjeta - otras, Decimal('0'))
+            yield [
+                numero, tipo, ncf_dgii(f.ncf), '', '01', f.fecha_factura.strftime('%Y%m%d'), '',
+                _monto(Decimal(str(f.subtotal)) - Decimal(str(f.descuento or 0))), _monto(f.itbis),
+                '', '', '', '', '', _monto(f.otros_impuestos), '',
+                _monto(efectivo), _monto(banco), _monto(tarjeta), _monto(credito), '', '', _monto(otras)
+            ]
+
+    @staticmethod
+    def txt_607(anio, mes):
+        """Archivo TXT oficial por bloques: encabezado 607|RNC|AAAAMM|cantidad y un registro por línea"""
+        yield f"607|{ReporteFiscalService.rnc_empresa()}|{anio}{mes:02d}|{ReporteFiscalService.contar_607(anio, mes)}\r\n"
+        bloque = []
+        for fila in ReporteFiscalService.filas_607(anio, mes):
+            bloque.append('|'.join(fila))
+            if len(bloque) >= FILAS_POR_BLOQUE:
+                yield '\r\n'.join(bloque) + '\r\n'
+                bloque = []
+        if bloque:
+            yield '\r\n'.join(bloque) + '\r\n'
+
+    @staticmethod
+    def xlsx_607(anio, mes):
+        """
+        Libro XLSX en un archivo temporal (openpyxl en modo write_only escribe
+        cada fila al disco). Devuelve el archivo abierto, posicionado al inicio.
+        """
+        from openpyxl import Workbook
+
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet('607')
+        hoja.append(['RNC o Cédula', ReporteFiscalService.rnc_empresa()])
+        hoja.append(['Período', f"{anio}{mes:02d}"])
+        hoja.append(['Cantidad Registros', ReporteFiscalService.contar_607(anio, mes)])
+        hoja.append([])
+        hoja.append(COLUMNAS_607)
+        for fila in ReporteFiscalService.filas_607(anio, mes):
+            # Montos como números para que la hoja se pueda sumar
+            hoja.append(fila[:7] + [float(v) if v else None for v in fila[7:]])
+
+        archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        libro.save(archivo)
+        archivo.seek(0)
+        return archivo
+
+    @staticmethod
+    def huecos_ncf(anio, mes):
+        """
+        NCF sin factura ni hueco registrado entre el primero y el último emitidos
+        en el mes de cada serie, y NCF emitidos fuera de toda secuencia autorizada.
+        """
+        desde, hasta = periodo_mes(anio, mes)
+        parametros = {'desde': desde, 'hasta': hasta}
+
+        series = [dict(fila._mapping) for fila in db.session.execute(text(_CTE_RANGOS + """
+            SELECT id AS secuencia_id, tipo_comprobante, serie, primero, ultimo, emitidos FROM rangos
+            ORDER BY tipo_comprobante, serie
+        """), parametros)]
+
+        sin_explicar, total_sin_explicar, registrados = [], 0, 0
+        for ncf, registrado in db.session.execute(text(_CTE_RANGOS + """
+            , faltantes AS (
+                SELECT r.tipo_comprobante || '-' || r.serie || '-' || LPAD(g.numero::text, 8, '0') AS ncf
+                FROM rangos r
+                CROSS JOIN LATERAL generate_series(r.primero, r.ultimo) AS g(numero)
+            )
+            SELECT f.ncf, h.ncf IS NOT NULL AS registrado
+            FROM faltantes f
+            LEFT JOIN ncf_huecos h ON h.ncf = f.ncf
+            WHERE NOT EXISTS (SELECT 1 FROM facturas x WHERE x.ncf = f.ncf)
+            ORDER BY f.ncf
+        """).execution_options(yield_per=1000), parametros):
+            if registrado:
+                registrados += 1
+                continue
+            total_sin_explicar += 1
+            if len(sin_explicar) < MAX_HUECOS_LISTADOS:
+                sin_explicar.append(ncf)
+
+        fuera_de_secuencia = db.session.execute(text(_CTE_USADOS + """
+            SELECT COUNT(*) FROM usados u
+            WHERE NOT EXISTS (
+                SELECT 1 FROM ncf_secuencias s
+                WHERE s.tipo_comprobante = u.tipo AND s.serie = u.serie
+                  AND u.numero BETWEEN s.secuencia_inicio AND s.secuencia_fin
+            )
+        """), parametros).scalar()
+
+        return {
+            'periodo': f"{anio}{mes:02d}",
+            'series': series,
+            'huecos_registrados': registrados,
+            'huecos_sin_explicar': total_sin_explicar,
+            'ncf_sin_explicar': sin_explicar,
+            'ncf_fuera_de_secuencia': fuera_de_secuencia
+        }
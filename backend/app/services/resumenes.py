@@ -0,0 +1,226 @@
+"""
+Tablas de resumen (rollups) para el dashboard
+Se mantienen al día de forma incremental desde FacturacionService y
+se pueden reconstruir completas con `flask reconstruir-resumenes`
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+from collections import defaultdict
+from app import db
+from app.models import ResumenDiario, ResumenMetodoPago, ResumenEstudio, Estudio
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+
+
+class ResumenService:
+
+    @staticmethod
+    def _acumular(modelo, filas, claves):
+        """UPSERT que suma los valores recibidos a la fila existente"""
+        if not filas:
+            return
+        stmt = insert(modelo).values(filas)
+        columnas = [c for c in filas[0].keys() if c not in claves]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=claves,
+            set_={c: getattr(modelo, c) + getattr(stmt.excluded, c) for c in columnas}
+        )
+        db.session.execute(stmt)
+
+    @staticmethod
+    def registrar_factura(factura, detalles_orden):
+        """Sumar una factura recién creada (sin commit, va en la misma transacción)"""
+        ResumenService.registrar_facturas([(
+            factura.fecha_factura.date(),
+            factura.total,
+            [(d.estudio_id, d.precio_final) for d in detalles_orden]
+        )])
+
+    @staticmethod
+    def registrar_facturas(facturas):
+        """
+        Sumar varias facturas con un UPSERT por tabla (sin commit).
+        facturas: [(fecha, total, [(estudio_id, precio_final), ...]), ...]
+        """
+        por_dia = defaultdict(lambda: [0, Decimal('0')])
+        por_estudio = defaultdict(lambda: [0, Decimal('0')])
+        for fecha, total, detalles in facturas:
+            por_dia[fecha][0] += 1
+            por_dia[fecha][1] += Decimal(str(total))
+            for estudio_id, precio_final in detalles:
+                por_estudio[(fecha, estudio_id)][0] += 1
+                por_estudio[(fecha, estudio_id)][1] += Decimal(str(precio_final))
+
+        ResumenService._acumular(ResumenDiario, [{
+            'fecha': fecha,
+            'facturas_cantidad': cantidad,
+            'facturas_pagadas': 0,
+            'facturado_total': total,
+            'pagos_cantidad': 0,
+            'ingresos_total': Decimal('0'),
+        } for fecha, (cantidad, total) in por_dia.items()], ['fecha'])
+
+        ResumenService._acumular(ResumenEstudio, [{
+            'fecha': fecha,
+            'estudio_id': estudio_id,
+            'cantidad': cantidad,
+            'total': total,
+        } for (fecha, estudio_id), (cantidad, total) in por_estudio.items()], ['fecha', 'estudio_id'])
+
+    @staticmethod
+    def registrar_pago(pago, factura, factura_saldada=False):
+        """Sumar un pago recién registrado (el pago debe estar en flush)"""
+        fecha = pago.fecha_pago.date()
+        monto = Decimal(str(pago.monto))
+
+        ResumenService._acumular(ResumenDiario, [{
+            'fecha': fecha,
+            'facturas_cantidad': 0,
+            'facturas_pagadas': 0,
+            'facturado_total': Decimal('0'),
+            'pagos_cantidad': 1,
+            'ingresos_total': monto,
+        }], ['fecha'])
+
+        ResumenService._acumular(ResumenMetodoPago, [{
+            'fecha': fecha,
+            'metodo_pago': pago.metodo_pago,
+            'cantidad': 1,
+            'total': monto,
+        }], ['fecha', 'metodo_pago'])
+
+        # La factura cuenta como pagada en el día en que fue emitida
+        if factura_saldada:
+            ResumenService._acumular(ResumenDiario, [{
+                'fecha': factura.fecha_factura.date(),
+                'facturas_cantidad': 0,
+                'facturas_pagadas': 1,
+                'facturado_total': Decimal('0'),
+                'pagos_cantidad': 0,
+                'ingresos_total': Decimal('0'),
+            }], ['fecha'])
+
+    @staticmethod
+    def reconstruir(desde=None, hasta=None):
+        """Recalcular los resúmenes de un rango de fechas (o de todo el histórico)"""
+        filtros = {'desde': desde or datetime(1900, 1, 1).date(), 'hasta': hasta or datetime(2999, 12, 31).date()}
+
+        for tabla in ('resumen_diario', 'resumen_metodo_pago', 'resumen_estudio'):
+            db.session.execute(text(
+                f"DELETE FROM {tabla} WHERE fecha BETWEEN :desde AND :hasta"
+            ), filtros)
+
+        db.session.execute(text("""
+            INSERT INTO resumen_diario (fecha, facturas_cantidad, facturas_pagadas, facturado_total,
+                                        pagos_cantidad, ingresos_total)
+            SELECT fecha, SUM(facturas), SUM(pagadas), SUM(facturado), SUM(pagos), SUM(ingresos)
+            FROM (
+                SELECT DATE(fecha_factura) AS fecha, COUNT(*) AS facturas,
+                       COUNT(*) FILTER (WHERE estado = 'pagada') AS pagadas,
+                       SUM(total) AS facturado, 0 AS pagos, 0 AS ingresos
+                FROM facturas
+                WHERE estado != 'anulada'
+                  AND fecha_factura >= :desde AND fecha_factura < CAST(:hasta AS date) + 1
+                GROUP BY DATE(fecha_factura)
+                UNION ALL
+                SELECT DATE(fecha_pago), 0, 0, 0, COUNT(*), SUM(monto)
+                FROM pagos
+                WHERE fecha_pago >= :desde AND fecha_pago < CAST(:hasta AS date) + 1
+                GROUP BY DATE(fecha_pago)
+            ) t
+            GROUP BY fecha
+        """), filtros)
+
+        db.session.execute(text("""
+            INSERT INTO resumen_metodo_pago (fecha, metodo_pago, cantidad, total)
+            SELECT DATE(fecha_pago), metodo_pago, COUNT(*), SUM(monto)
+            FROM pagos
+            WHERE fecha_pago >= :desde AND fecha_pago < CAST(:hasta AS date) + 1
+            GROUP BY DATE(fecha_pago), metodo_pago
+        """), filtros)
+
+        db.session.execute(text("""
+            INSERT INTO resumen_estudio (fecha, estudio_id, cantidad, total)
+            SELECT DATE(f.fecha_factura), od.estudio_id, COUNT(*), SUM(fd.total)
+            FROM factura_detalles fd
+            JOIN facturas f ON f.id = fd.factura_id
+            JOIN orden_detalles od ON od.id = fd.orden_detalle_id
+            WHERE f.estado != 'anulada'
+              AND f.fecha_factura >= :desde AND f.fecha_factura < CAST(:hasta AS date) + 1
+            GROUP BY DATE(f.fecha_factura), od.estudio_id
+        """), filtros)
+
+        db.session.commit()
+
+    @staticmethod
+    def dashboard(hoy):
+        """Totales de facturación e ingresos del dashboard leídos de los resúmenes"""
+        inicio_mes = hoy.replace(day=1)
+        inicio_semana = hoy - timedelta(days=hoy.weekday())
+        inicio_diarios = hoy - timedelta(days=6)
+        desde = min(inicio_mes, inicio_semana, inicio_diarios)
+
+        filas = {r.fecha: r for r in ResumenDiario.query.filter(
+            ResumenDiario.fecha >= desde,
+            ResumenDiario.fecha <= hoy
+        ).all()}
+
+        def sumar(campo, inicio):
+            return sum((getattr(r, campo) for f, r in filas.items() if f >= inicio), Decimal('0'))
+
+        facturas_mes = int(sumar('facturas_cantidad', inicio_mes))
+        pagadas_mes = int(sumar('facturas_pagadas', inicio_mes))
+
+        ingresos_diarios = []
+        for i in range(6, -1, -1):
+            dia = hoy - timedelta(days=i)
+            fila = filas.get(dia)
+            ingresos_diarios.append({
+                'fecha': dia.isoformat(),
+                'dia': dia.strftime('%a'),
+                'monto': float(fila.ingresos_total) if fila else 0.0
+            })
+
+        pagos_por_metodo = db.session.query(
+            ResumenMetodoPago.metodo_pago,
+            func.sum(ResumenMetodoPago.total),
+            func.sum(ResumenMetodoPago.cantidad)
+        ).filter(
+            ResumenMetodoPago.fecha >= inicio_mes,
+            ResumenMetodoPago.fecha <= hoy
+        ).group_by(ResumenMetodoPago.metodo_pago).all()
+
+        estudios_populares = db.session.query(
+            Estudio.nombre,
+            func.sum(ResumenEstudio.cantidad)
+        ).join(
+            Estudio, Estudio.id == ResumenEstudio.estudio_id
+        ).filter(
+            ResumenEstudio.fecha >= inicio_mes,
+            ResumenEstudio.fecha <= hoy
+        ).group_by(Estudio.nombre).order_by(
+            func.sum(ResumenEstudio.cantidad).desc()
+        ).limit(5).all()
+
+        return {
+            'facturacion': {
+                'total_mes': float(sumar('facturado_total', inicio_mes)),
+                'facturas_mes': facturas_mes,
+                'pendientes': facturas_mes - pagadas_mes,
+                'pagadas': pagadas_mes
+            },
+            'ingresos': {
+                'hoy': float(filas[hoy].ingresos_total) if hoy in filas else 0.0,
+                'semana': float(sumar('ingresos_total', inicio_semana)),
+                'mes': float(sumar('ingresos_total', inicio_mes)),
+                'diarios': ingresos_diarios
+            },
+            'estudios_populares': [
+                {'nombre': nombre, 'cantidad': int(cantidad)}
+                for nombre, cantidad in estudios_populares
+            ],
+            'pagos_por_metodo': [
+                {'metodo': metodo, 'total': float(total), 'cantidad': int(cantidad)}
+                for metodo, total, cantidad in pagos_por_metodo
+            ]
+        }
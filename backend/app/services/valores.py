@@ -0,0 +1,178 @@
+"""
+Valores de los resultados, una fila por analito (resultado_valores)
+Los equipos mandan los valores como JSON ({código: {valor, unidad, referencia,
+nombre, bandera}} o {código: valor}) o dentro del texto HL7, y así quedan en
+resultados. Al guardar la ingesta se separan además en filas con el valor
+numérico y el rango de referencia ya interpretados: la evolución de un analito
+de un paciente es un recorrido del índice (paciente_id, analito, fecha), sin
+decodificar ningún JSON ni mensaje.
+"""
+from decimal import Decimal, InvalidOperation
+import re
+from sqlalchemy import insert, func
+from app import db
+from app.models import Orden, OrdenDetalle, ResultadoValor
+
+_NUMERO = r'[-+]?\d+(?:[.,]\d+)?'
+_RANGO = re.compile(rf'^\s*({_NUMERO})\s*(?:-|a)\s*({_NUMERO})\s*$')
+_LIMITE = re.compile(rf'^\s*([<>]=?)\s*({_NUMERO})\s*$')
+# Dígitos que admite Numeric(18, 6) en la parte entera
+_MAXIMO = Decimal(10) ** 12
+
+
+def _decimal(valor):
+    """Decimal de un número o texto numérico ('14.5', '14,5'); None si no lo es"""
+    if valor is None or isinstance(valor, bool):
+        return None
+    try:
+        numero = Decimal(str(valor).strip().replace(',', '.'))
+    except InvalidOperation:
+        return None
+    if not numero.is_finite() or abs(numero) >= _MAXIMO:
+        return None
+    return numero
+
+
+def rango_referencia(texto):
+    """(mínimo, máximo) de '12-16', '12 - 16', '<200' o '>=5'; None donde no hay límite"""
+    if not texto:
+        return None, None
+    texto = str(texto)
+    rango = _RANGO.match(texto)
+    if rango:
+        return _decimal(rango.group(1)), _decimal(rango.group(2))
+    limite = _LIMITE.match(texto)
+    if limite:
+        numero = _decimal(limite.group(2))
+        return (None, numero) if limite.group(1).startswith('<') else (numero, None)
+    return None, None
+
+
+def _bandera(valor, minimo, maximo):
+    if valor is None or (minimo is None and maximo is None):
+        return None
+    if minimo is not None and valor < minimo:
+        return 'L'
+    if maximo is not None and valor > maximo:
+        return 'H'
+    return 'N'
+
+
+def _texto(valor, largo):
+    if valor is None or valor == '':
+        return None
+    return str(valor).strip()[:largo] or None
+
+
+def filas_valores(valores, resultado_id, paciente_id, fecha):
+    """Filas de resultado_valores a partir del JSON de valores de un resultado"""
+    filas = []
+    if not isinstance(valores, dict):
+        return filas
+    for codigo, dato in valores.items():
+        analito = _texto(codigo, 50)
+        if not analito:
+            continue
+        if not isinstance(dato, dict):
+            dato = {'valor': dato}
+        crudo = dato.get('valor')
+        numero = _decimal(crudo)
+        minimo, maximo = rango_referencia(dato.get('referencia'))
+        if dato.get('referencia_min') is not None:
+            minimo = _decimal(dato['referencia_min'])
+        if dato.get('referencia_max') is not None:
+            maximo = _decimal(dato['referencia_max'])
+        filas.append({
+            'resultado_id': resultado_id,
+            'paciente_id': paciente_id,
+            'analito': analito.upper(),
+            'nombre': _texto(dato.get('nombre'), 100),
+            'valor': numero,
+            'valor_texto': None if numero is not None else _texto(crudo, 100),
+            'unidad': _texto(dato.get('unidad'), 30),
+            'referencia_min': minimo,
+            'referencia_max': maximo,
+            # El equipo manda la bandera en OBX-8; si no, se calcula con el rango
+            'bandera': _texto(dato.get('bandera'), 10) or _bandera(numero, minimo, maximo),
+            'fecha': fecha
+        })
+    return filas
+
+
+class ValoresService:
+
+    @staticmethod
+    def agregar(resultados):
+        """
+        Insertar los valores de resultados recién guardados, dentro de la
+        transacción en curso (sin commit). resultados: [(resultado_id,
+        orden_detalle_id, valores, fecha)]. Devuelve la cantidad de filas.
+        """
+        if not resultados:
+            return 0
+        pacientes = dict(db.session.query(OrdenDetalle.id, Orden.paciente_id).join(
+            Orden, Orden.id == OrdenDetalle.orden_id
+        ).filter(
+            OrdenDetalle.id.in_({detalle_id for _, detalle_id, _, _ in resultados})
+        ).all())
+        filas = []
+        for resultado_id, detalle_id, valores, fecha in resultados:
+            paciente_id = pacientes.get(detalle_id)
+            if paciente_id:
+                filas.extend(filas_valores(valores, resultado_id, paciente_id, fecha))
+        if filas:
+            db.session.execute(insert(ResultadoValor), filas)
+        return len(filas)
+
+    @staticmethod
+    def tendencia(paciente_id, analito, desde=None, hasta=None, limite=1000):
+        """
+        Valores de un analito del paciente en orden de fecha (los `limite` más
+        recientes del período). Un recorrido del índice en sentido inverso.
+        """
+        consulta = db.session.query(
+            ResultadoValor.fecha, ResultadoValor.valor, ResultadoValor.valor_texto, ResultadoValor.unidad,
+            ResultadoValor.referencia_min, ResultadoValor.referencia_max, ResultadoValor.bandera,
+            ResultadoValor.nombre, ResultadoValor.resultado_id
+        ).filter(
+            ResultadoValor.paciente_id == paciente_id,
+            ResultadoValor.analito == analito.strip().upper()
+        )
+        if desde:
+            consulta = consulta.filter(ResultadoValor.fecha >= desde)
+        if hasta:
+            consulta = consulta.filter(ResultadoValor.fecha <= hasta)
+        filas = consulta.order_by(ResultadoValor.fecha.desc()).limit(limite).all()
+        filas.reverse()
+
+        def numero(valor):
+            return float(valor) if valor is not None else None
+
+        return [{
+            'fecha': f.fecha.isoformat(),
+            'valor': numero(f.valor),
+            'valor_texto': f.valor_texto,
+            'unidad': f.unidad,
+            'referencia_min': numero(f.referencia_min),
+            'referencia_max': numero(f.referencia_max),
+            'bandera': f.bandera,
+            'nombre': f.nombre,
+            'resultado_id': f.resultado_id
+        } for f in filas]
+
+    @staticmethod
+    def analitos(paciente_id):
+        """Analitos con valores del paciente: cantidad y última fecha"""
+        filas = db.session.query(
+            ResultadoValor.analito, func.max(ResultadoValor.nombre), func.count(ResultadoValor.id),
+            func.max(ResultadoValor.fecha)
+        ).filter(
+            ResultadoValor.paciente_id == paciente_id
+        ).group_by(ResultadoValor.analito).order_by(ResultadoValor.analito).all()
+        return [{
+            'analito': analito,
+            'nombre': nombre,
+            'cantidad': cantidad,
+            'ultima_fecha': ultima.isoformat() if ultima else None
+        } for analito, nombre, cantidad, ultima in filas]
+
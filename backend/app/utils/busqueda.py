@@ -0,0 +1,63 @@
+"""
+Búsqueda de texto normalizado (sin acentos, minúsculas, teléfonos y cédulas solo dígitos)
+sobre columnas con índice GIN de pg_trgm
+"""
+import re
+import unicodedata
+from sqlalchemy import and_, or_, func, literal, cast, Numeric
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni diéresis (ñ -> n) y espacios simples"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto).lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def solo_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+
+def texto_busqueda_paciente(paciente):
+    """Valor de Paciente.busqueda: nombre, apellido, email y pasaporte normalizados + cédula y teléfonos en dígitos"""
+    partes = [normalizar(v) for v in (paciente.nombre, paciente.apellido, paciente.email, paciente.pasaporte)]
+    partes += [solo_digitos(v) for v in (paciente.cedula, paciente.telefono, paciente.celular)]
+    return ' '.join(p for p in partes if p)
+
+
+def terminos(termino):
+    """Palabras del término tal como están guardadas (cédulas y teléfonos quedan en dígitos)"""
+    palabras = []
+    for palabra in normalizar(termino).split(' '):
+        if any(c.isdigit() for c in palabra) and not any(c.isalpha() for c in palabra):
+            palabra = solo_digitos(palabra)
+        if palabra:
+            palabras.append(palabra)
+    return palabras
+
+
+def _escapar_like(texto):
+    return texto.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def buscar_texto(columna, termino):
+    """
+    Condición y relevancia (mayor = más parecido) para buscar `termino` en una columna normalizada.
+    Coinciden las filas que contienen todas las palabras del término, o que se le
+    parecen (operador <% de pg_trgm, tolera errores de escritura). Ambas usan el
+    índice GIN gin_trgm_ops de la columna. Devuelve (None, None) si no hay término.
+    """
+    palabras = terminos(termino)
+    if not palabras:
+        return None, None
+
+    normalizado = ' '.join(palabras)
+    contiene = and_(*[columna.like(f'%{_escapar_like(p)}%', escape='/') for p in palabras])
+    parecido = literal(normalizado).op('<%')(columna)
+    # word_similarity devuelve real (float4): como clave de la paginación por cursor
+    # se compara contra un float8 y las filas empatadas en el borde de la página
+    # se saltan o se repiten. Redondeada a numeric, el valor del cursor es exacto.
+    relevancia = func.round(cast(func.word_similarity(normalizado, columna), Numeric), 6)
+    return or_(contiene, parecido), relevancia
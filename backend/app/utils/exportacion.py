@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from flask import request, Response, stream_with_context
+
+FORMATOS_EXPORTACION = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# Filas que se acumulan antes de enviar un bloque al cliente
+FILAS_POR_BLOQUE = 500
+
+
+def formato_exportacion():
+    """Formato de exportación pedido con ?format=csv|ndjson (None = JSON normal)"""
+    formato = (request.args.get('format') or '').lower()
+    return formato if formato in FORMATOS_EXPORTACION else None
+
+
+def _bloques_csv(filas, columnas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columnas)
+    pendientes = 0
+    for fila in filas:
+        writer.writerow([fila.get(c) for c in columnas])
+        pendientes += 1
+        if pendientes >= FILAS_POR_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    yield buffer.getvalue()
+
+
+def _bloques_ndjson(filas):
+    bloque = []
+    for fila in filas:
+        bloque.append(json.dumps(fila, ensure_ascii=False, default=str))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield '\n'.join(bloque) + '\n'
+            bloque = []
+    if bloque:
+        yield '\n'.join(bloque) + '\n'
+
+
+def respuesta_streaming(filas, columnas, formato, nombre_archivo):
+    """
+    Respuesta que va escribiendo las filas a medida que llegan del cursor.
+    `filas` debe ser un iterable perezoso de dicts (p. ej. una consulta con yield_per)
+    para que la memoria no dependa del tamaño del reporte.
+    """
+    if formato == 'csv':
+        bloques = _bloques_csv(filas, columnas)
+    else:
+        bloques = _bloques_ndjson(filas)
+
+    return Response(
+        stream_with_context(bloques),
+        content_type=FORMATOS_EXPORTACION[formato],
+        headers={'Content-Disposition': f'attachment; filename={nombre_archivo}.{formato}'}
+    )
@@ -0,0 +1,119 @@
+"""
+Paginación por cursor (keyset) para los listados
+En lugar de OFFSET + COUNT(*) se pide "las filas después de esta", así la
+página 1000 cuesta lo mismo que la primera. El cursor (?after=) es opaco:
+los valores de orden de la última fila en base64.
+El total es opcional (?total=1) y aproximado.
+"""
+import base64
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from flask import request, jsonify
+from sqlalchemy import func, text, tuple_
+from app import db
+
+# Conteo máximo cuando hay filtros; más allá se informa "más de N"
+MAX_CONTEO = 10000
+
+
+def _valor_json(valor):
+    if isinstance(valor, datetime):
+        return {'dt': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'d': valor.isoformat()}
+    if isinstance(valor, Decimal):
+        return {'n': str(valor)}
+    return valor
+
+
+def _valor_python(valor):
+    if isinstance(valor, dict):
+        if 'dt' in valor:
+            return datetime.fromisoformat(valor['dt'])
+        if 'd' in valor:
+            return date.fromisoformat(valor['d'])
+        if 'n' in valor:
+            return Decimal(valor['n'])
+        raise ValueError('Valor de cursor desconocido')
+    return valor
+
+
+def codificar_cursor(valores):
+    datos = json.dumps([_valor_json(v) for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, cantidad):
+    """Valores del cursor; ValueError si está mal formado"""
+    try:
+        datos = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = [_valor_python(v) for v in json.loads(datos)]
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Cursor inválido') from e
+    if len(valores) != cantidad:
+        raise ValueError('Cursor inválido')
+    return valores
+
+
+def contar_aproximado(query):
+    """
+    Total del listado sin recorrer la tabla completa:
+    sin filtros se usa la estadística de Postgres (pg_class.reltuples);
+    con filtros se cuenta hasta MAX_CONTEO.
+    """
+    if query.whereclause is None:
+        tabla = query.column_descriptions[0]['entity'].__tablename__
+        total = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE relname = :tabla'), {'tabla': tabla}
+        ).scalar()
+        return {'total': max(int(total or 0), 0), 'total_exacto': False}
+
+    total = db.session.query(func.count()).select_from(
+        query.order_by(None).limit(MAX_CONTEO + 1).subquery()
+    ).scalar()
+    return {'total': min(total, MAX_CONTEO), 'total_exacto': total <= MAX_CONTEO}
+
+
+def paginar_keyset(query, claves, nombre, serializador=None):
+    """
+    Respuesta JSON con una página del listado, de mayor a menor según `claves`.
+    `claves` son las expresiones de orden; la última debe ser única (normalmente el id)
+    y ninguna puede ser NULL (la comparación de tuplas con NULL descarta la fila).
+    Los valores de las claves viajan en el cursor: usar tipos exactos (numeric,
+    timestamp, enteros), no real/float.
+    Con `serializador` (app.models.serializacion) las relaciones se cargan en la
+    misma consulta; sin él se usa to_dict() de cada fila.
+    Parámetros: ?after=<cursor>&per_page=50&total=1
+    """
+    try:
+        per_page = min(100, max(1, int(request.args.get('per_page', 50))))
+    except (ValueError, TypeError):
+        per_page = 50
+
+    pagina = serializador.preparar(query) if serializador else query
+    cursor = request.args.get('after')
+    if cursor:
+        try:
+            valores = decodificar_cursor(cursor, len(claves))
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        pagina = pagina.filter(tuple_(*claves) < tuple_(*valores))
+
+    filas = pagina.add_columns(*claves).order_by(
+        *[c.desc() for c in claves]
+    ).limit(per_page + 1).all()
+
+    hay_mas = len(filas) > per_page
+    filas = filas[:per_page]
+
+    items = [fila[0] for fila in filas]
+    respuesta = {
+        nombre: serializador.serializar(items) if serializador else [i.to_dict() for i in items],
+        'per_page': per_page,
+        'hay_mas': hay_mas,
+        'siguiente': codificar_cursor(filas[-1][1:]) if hay_mas else None
+    }
+    if request.args.get('total', '').lower() in ('1', 'true'):
+        respuesta.update(contar_aproximado(query))
+    return jsonify(respuesta)
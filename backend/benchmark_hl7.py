@@ -0,0 +1,157 @@
+"""
+Comparar app.services.hl7_parser con hl7apy sobre un corpus de mensajes
+
+Genera (o lee) mensajes ORU^R01, extrae con los dos lectores los mismos datos
+que HL7Service.parse_hl7_file (PID-3/5/7/8, OBX-3/5/6/7/11, MSH-9) y muestra
+tiempo por mensaje, mensajes por segundo y memoria pico. También verifica que
+los dos den el mismo resultado.
+
+Ejemplos:
+    python benchmark_hl7.py                       # 5000 mensajes generados
+    python benchmark_hl7.py --cantidad 20000 --obx 30
+    python benchmark_hl7.py capturas/*.hl7        # mensajes grabados (uno por bloque MSH)
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import tracemalloc
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.hl7_parser import parsear  # noqa: E402
+
+ANALITOS = [
+    ('HGB', 'Hemoglobina', 'g/dL', '12-16'), ('WBC', 'Leucocitos', 'cel/uL', '4000-11000'),
+    ('PLT', 'Plaquetas', '10*3/uL', '150-450'), ('GLU', 'Glucosa', 'mg/dL', '70-110'),
+    ('CRE', 'Creatinina', 'mg/dL', '0.6-1.2'), ('COL', 'Colesterol total', 'mg/dL', '<200'),
+    ('TGO', 'Transaminasa \\T\\ AST', 'U/L', '5-40'), ('NA', 'Sodio', 'mmol/L', '135-145'),
+]
+
+
+def generar(cantidad, obx, semilla=7):
+    """Mensajes variados: separadores de segmento \\r, \\n y \\r\\n, escapes y repeticiones"""
+    azar = random.Random(semilla)
+    mensajes = []
+    for i in range(cantidad):
+        fin = ('\r', '\n', '\r\n')[i % 3]
+        segmentos = [
+            f'MSH|^~\\&|COBAS|LAB|CENTRO_DIAGNOSTICO|LAB|20261018{i % 86400:06d}||ORU^R01^ORU_R01|M{i:08d}|P|2.5',
+            f'PID|1||{100000 + i}^^^CD^MR~{4000000 + i}^^^JCE^NI||PEREZ^MARIA^\\S\\{i % 10}||1980{i % 12 + 1:02d}15|{"FM"[i % 2]}',
+            f'ORC|RE|ORD-2610-{i:05d}',
+            f'OBR|1|ORD-2610-{i:05d}||PERFIL^Perfil|||20261018',
+        ]
+        for n in range(obx):
+            codigo, nombre, unidad, referencia = ANALITOS[n % len(ANALITOS)]
+            valor = f'{azar.uniform(1, 300):.2f}'
+            segmentos.append(f'OBX|{n + 1}|NM|{codigo}{n}^{nombre}^LN||{valor}|{unidad}|{referencia}|N|||F')
+        segmentos.append('NTE|1||Comentario con \\F\\ separador\\.br\\y salto')
+        mensajes.append(fin.join(segmentos) + fin)
+    return mensajes
+
+
+def cargar(rutas):
+    mensajes = []
+    for ruta in rutas:
+        with open(ruta, 'rb') as archivo:
+            texto = archivo.read().decode('utf-8', errors='replace').replace('\x0b', '').replace('\x1c', '')
+        mensajes.extend(b for b in re.split(r'(?m)^(?=MSH)', texto) if b.strip())
+    return mensajes
+
+
+def _sin_escapes(valor):
+    # hl7apy no decodifica las secuencias de escape al leer (separadores por defecto)
+    for codigo, caracter in (('\\F\\', '|'), ('\\S\\', '^'), ('\\T\\', '&'), ('\\R\\', '~'), ('\\E\\', '\\')):
+        valor = valor.replace(codigo, caracter)
+    return valor
+
+
+def extraer_hl7apy(texto):
+    """Mismos datos con hl7apy (árbol completo; segmentos sin grupos para poder llegar a PID/OBX)"""
+    from hl7apy.parser import parse_message
+
+    # hl7apy solo acepta \r entre segmentos
+    mensaje = parse_message(texto.replace('\r\n', '\r').replace('\n', '\r').strip('\r'), find_groups=False)
+
+    def er7(elemento):
+        return '~'.join(e.to_er7() for e in elemento) if elemento else None
+
+    pid = mensaje.pid
+    return {
+        'patient': {
+            'patient_id': er7(pid.pid_3), 'name': er7(pid.pid_5),
+            'dob': er7(pid.pid_7), 'sex': er7(pid.pid_8)
+        },
+        'results': [{
+            'test_id': er7(obx.obx_3),
+            'test_name': _sin_escapes(obx.obx_3.obx_3_2.value) if obx.obx_3 and obx.obx_3.obx_3_2 else None,
+            'value': er7(obx.obx_5), 'units': er7(obx.obx_6),
+            'reference_range': er7(obx.obx_7), 'status': er7(obx.obx_11)
+        } for obx in mensaje.obx],
+        'message_type': er7(mensaje.msh.msh_9)
+    }
+
+
+def medir(nombre, funcion, mensajes):
+    funcion(mensajes[0])  # imports y caches fuera de la medición
+    inicio = time.perf_counter()
+    for texto in mensajes:
+        funcion(texto)
+    duracion = time.perf_counter() - inicio
+
+    muestra = mensajes[:100]
+    tracemalloc.start()
+    for texto in muestra:
+        funcion(texto)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{nombre:<12} {len(mensajes):6d} msg {duracion:8.2f} s  {duracion / len(mensajes) * 1e6:9.1f} µs/msg  '
+          f'{len(mensajes) / duracion:10.0f} msg/s  pico {pico / 1024:8.1f} KiB')
+    return duracion
+
+
+def verificar(mensajes):
+    """Cantidad de mensajes en que los dos lectores no coinciden"""
+    diferentes = 0
+    for texto in mensajes:
+        rapido = parsear(texto)
+        rapido.pop('timestamp')
+        try:
+            referencia = extraer_hl7apy(texto)
+        except Exception:
+            continue
+        if rapido != referencia:
+            diferentes += 1
+            if diferentes == 1:
+                print('Primera diferencia:\n  hl7_parser:', rapido, '\n  hl7apy:    ', referencia)
+    return diferentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del lector HL7 contra hl7apy')
+    parser.add_argument('archivos', nargs='*', help='Archivos HL7 (si no se indican, se generan mensajes)')
+    parser.add_argument('--cantidad', type=int, default=5000, help='Mensajes a generar')
+    parser.add_argument('--obx', type=int, default=12, help='Resultados OBX por mensaje generado')
+    parser.add_argument('--muestra-hl7apy', type=int, default=300,
+                        help='Mensajes que se miden con hl7apy (es mucho más lento; 0 = todos)')
+    parser.add_argument('--sin-hl7apy', action='store_true', help='Medir solo hl7_parser')
+    args = parser.parse_args()
+
+    mensajes = cargar(args.archivos) if args.archivos else generar(args.cantidad, args.obx)
+    print(f'{len(mensajes)} mensajes, {sum(len(m) for m in mensajes) / 1024 / 1024:.1f} MiB')
+
+    rapido = medir('hl7_parser', parsear, mensajes)
+    if args.sin_hl7apy:
+        return
+    muestra = mensajes[:args.muestra_hl7apy] if args.muestra_hl7apy else mensajes
+    lento = medir('hl7apy', extraer_hl7apy, muestra)
+    print(f'hl7_parser es {lento / len(muestra) / (rapido / len(mensajes)):.0f}x más rápido por mensaje')
+    diferentes = verificar(muestra)
+    print('Resultados idénticos' if not diferentes else f'{diferentes} mensajes con resultados distintos')
+
+
+if __name__ == '__main__':
+    main()
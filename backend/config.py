@@ -38,10 +38,38 @@ class Config:
     TEMP_FOLDER = os.path.join(UPLOAD_FOLDER, 'temp')
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
     ALLOWED_EXTENSIONS = {'pdf', 'dcm', 'jpg', 'jpeg', 'png', 'hl7', 'txt'}
+    PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(TEMP_FOLDER, 'pdf_cache'))
+    PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    RENDER_PROCESOS = int(os.getenv('RENDER_PROCESOS', 2))  # procesos para generar PDFs por worker
+    RENDER_TRABAJOS_DIR = os.getenv('RENDER_TRABAJOS_DIR', os.path.join(TEMP_FOLDER, 'trabajos_render'))
+
+    # Cache de respuestas
+    # memoria: por proceso | sqlite: compartida entre workers de la máquina | redis: entre máquinas
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memoria')
+    CACHE_URL = os.getenv('CACHE_URL', '')  # ruta del archivo SQLite o URL de Redis
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1000))
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+    # Segundos entre sincronizaciones del índice de autocompletado
+    AUTOCOMPLETADO_INTERVALO = int(os.getenv('AUTOCOMPLETADO_INTERVALO', 30))
 
     # Monitoreo
     EQUIPOS_EXPORT_PATH = os.getenv('EQUIPOS_EXPORT_PATH', './uploads/equipos')
 
+    # Servidor MLLP para los equipos de laboratorio (flask servidor-mllp)
+    MLLP_HOST = os.getenv('MLLP_HOST', '0.0.0.0')
+    MLLP_PUERTO = int(os.getenv('MLLP_PUERTO', 2575))
+    MLLP_LOTE = int(os.getenv('MLLP_LOTE', 100))  # mensajes por transacción
+    MLLP_ESPERA_LOTE = float(os.getenv('MLLP_ESPERA_LOTE', 0.05))  # segundos que se espera para juntar un lote
+    MLLP_INACTIVIDAD = int(os.getenv('MLLP_INACTIVIDAD', 0))  # segundos sin mensajes antes de cerrar (0 = nunca)
+
+    # Ingesta diferida de resultados: diario local + guardado por lotes
+    INGESTA_DIR = os.getenv('INGESTA_DIR', os.path.join(UPLOAD_FOLDER, 'ingesta'))
+    INGESTA_LOTE = int(os.getenv('INGESTA_LOTE', 500))  # registros por INSERT
+    INGESTA_INTERVALO = float(os.getenv('INGESTA_INTERVALO', 1))  # segundos entre guardados
+    INGESTA_FSYNC = os.getenv('INGESTA_FSYNC', 'true').lower() == 'true'
+    ACCESIONES_CACHE = int(os.getenv('ACCESIONES_CACHE', 20000))  # accesiones del día en memoria por proceso
+
     # Nube
     CLOUD_SYNC_ENABLED = os.getenv('CLOUD_SYNC_ENABLED', 'false').lower() == 'true'
     AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
@@ -58,6 +86,7 @@ class Config:
 
     # NCF / ITBIS
     NCF_VALIDATION_ENABLED = True
+    NCF_BLOQUE = int(os.getenv('NCF_BLOQUE', 20))  # NCF reservados por proceso en cada viaje a la base de datos
     ITBIS_RATE = 0.18
 
     # Sesión
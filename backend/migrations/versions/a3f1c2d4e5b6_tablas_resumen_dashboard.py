@@ -0,0 +1,86 @@
+"""Tablas de resumen para el dashboard
+
+Revision ID: a3f1c2d4e5b6
+Revises: 6cce35a550cd
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c2d4e5b6'
+down_revision = '6cce35a550cd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resumen_diario',
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('facturas_cantidad', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('facturas_pagadas', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('facturado_total', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+    sa.Column('pagos_cantidad', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('ingresos_total', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('fecha')
+    )
+    op.create_table('resumen_metodo_pago',
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('metodo_pago', sa.String(length=30), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('fecha', 'metodo_pago')
+    )
+    op.create_table('resumen_estudio',
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('estudio_id', sa.Integer(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['estudio_id'], ['estudios.id'], ),
+    sa.PrimaryKeyConstraint('fecha', 'estudio_id')
+    )
+
+    # Histórico, igual que ResumenService.reconstruir (si no, el dashboard arranca en cero)
+    op.execute("""
+        INSERT INTO resumen_diario (fecha, facturas_cantidad, facturas_pagadas, facturado_total,
+                                    pagos_cantidad, ingresos_total)
+        SELECT fecha, SUM(facturas), SUM(pagadas), SUM(facturado), SUM(pagos), SUM(ingresos)
+        FROM (
+            SELECT DATE(fecha_factura) AS fecha, COUNT(*) AS facturas,
+                   COUNT(*) FILTER (WHERE estado = 'pagada') AS pagadas,
+                   SUM(total) AS facturado, 0 AS pagos, 0 AS ingresos
+            FROM facturas
+            WHERE estado != 'anulada' AND fecha_factura IS NOT NULL
+            GROUP BY DATE(fecha_factura)
+            UNION ALL
+            SELECT DATE(fecha_pago), 0, 0, 0, COUNT(*), SUM(monto)
+            FROM pagos
+            WHERE fecha_pago IS NOT NULL
+            GROUP BY DATE(fecha_pago)
+        ) t
+        GROUP BY fecha
+    """)
+    op.execute("""
+        INSERT INTO resumen_metodo_pago (fecha, metodo_pago, cantidad, total)
+        SELECT DATE(fecha_pago), metodo_pago, COUNT(*), SUM(monto)
+        FROM pagos
+        WHERE fecha_pago IS NOT NULL AND metodo_pago IS NOT NULL
+        GROUP BY DATE(fecha_pago), metodo_pago
+    """)
+    op.execute("""
+        INSERT INTO resumen_estudio (fecha, estudio_id, cantidad, total)
+        SELECT DATE(f.fecha_factura), od.estudio_id, COUNT(*), SUM(fd.total)
+        FROM factura_detalles fd
+        JOIN facturas f ON f.id = fd.factura_id
+        JOIN orden_detalles od ON od.id = fd.orden_detalle_id
+        WHERE f.estado != 'anulada' AND f.fecha_factura IS NOT NULL AND od.estudio_id IS NOT NULL
+        GROUP BY DATE(f.fecha_factura), od.estudio_id
+    """)
+
+
+def downgrade():
+    op.drop_table('resumen_estudio')
+    op.drop_table('resumen_metodo_pago')
+    op.drop_table('resumen_diario')
@@ -0,0 +1,39 @@
+"""Claves de la paginación por cursor: NOT NULL
+
+Revision ID: a4c8e1f2b3d7
+Revises: f3b7d0e1a2c6
+Create Date: 2026-10-19 11:20:48.062915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c8e1f2b3d7'
+down_revision = 'f3b7d0e1a2c6'
+branch_labels = None
+depends_on = None
+
+# tabla -> (columna, respaldo para las filas que la tienen vacía)
+COLUMNAS = {
+    'pacientes': ('created_at', "COALESCE(updated_at, TIMESTAMP '2000-01-01')"),
+    'ordenes': ('fecha_orden', "COALESCE(created_at, TIMESTAMP '2000-01-01')"),
+    'facturas': ('fecha_factura', "COALESCE(created_at, TIMESTAMP '2000-01-01')"),
+    'ncf_huecos': ('fecha', "TIMESTAMP '2000-01-01'"),
+}
+
+
+def upgrade():
+    # (fecha, id) < (cursor) es NULL si la fecha es NULL: esas filas no aparecían en ninguna página
+    for tabla, (columna, respaldo) in COLUMNAS.items():
+        op.execute(f'UPDATE {tabla} SET {columna} = {respaldo} WHERE {columna} IS NULL')
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.alter_column(columna, existing_type=sa.DateTime(), nullable=False,
+                                  server_default=sa.text('now()'))
+
+
+def downgrade():
+    for tabla, (columna, _) in COLUMNAS.items():
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.alter_column(columna, existing_type=sa.DateTime(), nullable=True, server_default=None)
@@ -0,0 +1,62 @@
+"""Bloques reservados y huecos de NCF
+
+Revision ID: a8c2e5f6b7d1
+Revises: f7b1d4e5a6c0
+Create Date: 2026-10-18 16:48:31.902716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c2e5f6b7d1'
+down_revision = 'f7b1d4e5a6c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ncf_bloques',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('secuencia_id', sa.Integer(), nullable=False),
+    sa.Column('tipo_comprobante', sa.String(length=20), nullable=False),
+    sa.Column('serie', sa.String(length=3), nullable=False),
+    sa.Column('inicio', sa.BigInteger(), nullable=False),
+    sa.Column('fin', sa.BigInteger(), nullable=False),
+    sa.Column('proceso', sa.String(length=50), nullable=True),
+    sa.Column('reservado_en', sa.DateTime(), nullable=True),
+    sa.Column('liberado_en', sa.DateTime(), nullable=True),
+    sa.Column('revisado', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['secuencia_id'], ['ncf_secuencias.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ncf_bloques_secuencia_id'), 'ncf_bloques', ['secuencia_id'], unique=False)
+    op.create_index(op.f('ix_ncf_bloques_revisado'), 'ncf_bloques', ['revisado'], unique=False)
+
+    op.create_table('ncf_huecos',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ncf', sa.String(length=19), nullable=False),
+    sa.Column('tipo_comprobante', sa.String(length=20), nullable=False),
+    sa.Column('secuencia_id', sa.Integer(), nullable=True),
+    sa.Column('bloque_id', sa.Integer(), nullable=True),
+    sa.Column('motivo', sa.String(length=50), nullable=True),
+    sa.Column('fecha', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['secuencia_id'], ['ncf_secuencias.id'], ),
+    sa.ForeignKeyConstraint(['bloque_id'], ['ncf_bloques.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('ncf')
+    )
+    op.create_index(op.f('ix_ncf_huecos_fecha'), 'ncf_huecos', ['fecha'], unique=False)
+
+    # Búsqueda de NCF usados al revisar cada bloque
+    op.create_index('idx_facturas_ncf', 'facturas', ['ncf'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_facturas_ncf', table_name='facturas')
+    op.drop_index(op.f('ix_ncf_huecos_fecha'), table_name='ncf_huecos')
+    op.drop_table('ncf_huecos')
+    op.drop_index(op.f('ix_ncf_bloques_revisado'), table_name='ncf_bloques')
+    op.drop_index(op.f('ix_ncf_bloques_secuencia_id'), table_name='ncf_bloques')
+    op.drop_table('ncf_bloques')
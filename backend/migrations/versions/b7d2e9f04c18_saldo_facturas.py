@@ -0,0 +1,40 @@
+"""Saldo denormalizado en facturas
+
+Revision ID: b7d2e9f04c18
+Revises: a3f1c2d4e5b6
+Create Date: 2026-10-18 10:03:17.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e9f04c18'
+down_revision = 'a3f1c2d4e5b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('facturas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('monto_pagado', sa.Numeric(precision=10, scale=2), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('saldo', sa.Numeric(precision=10, scale=2), nullable=False, server_default='0'))
+
+    # Saldos de las facturas existentes a partir de los pagos (si no, todas quedarían en 0)
+    op.execute("""
+        UPDATE facturas
+        SET monto_pagado = COALESCE((SELECT SUM(p.monto) FROM pagos p WHERE p.factura_id = facturas.id), 0)
+    """)
+    op.execute('UPDATE facturas SET saldo = total - monto_pagado')
+
+    # Solo las facturas con saldo pendiente: el índice se mantiene pequeño
+    op.create_index('idx_facturas_por_cobrar', 'facturas', ['fecha_factura'], unique=False,
+                    postgresql_where=sa.text("estado IN ('pendiente', 'parcial')"))
+
+
+def downgrade():
+    op.drop_index('idx_facturas_por_cobrar', table_name='facturas')
+    with op.batch_alter_table('facturas', schema=None) as batch_op:
+        batch_op.drop_column('saldo')
+        batch_op.drop_column('monto_pagado')
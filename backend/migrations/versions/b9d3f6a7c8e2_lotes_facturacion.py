@@ -0,0 +1,53 @@
+"""Lotes de facturación
+
+Revision ID: b9d3f6a7c8e2
+Revises: a8c2e5f6b7d1
+Create Date: 2026-10-18 17:25:14.360882
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d3f6a7c8e2'
+down_revision = 'a8c2e5f6b7d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lotes_facturacion',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('seguro_medico', sa.String(length=100), nullable=True),
+    sa.Column('fecha_desde', sa.Date(), nullable=True),
+    sa.Column('fecha_hasta', sa.Date(), nullable=True),
+    sa.Column('opciones', sa.Text(), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=True),
+    sa.Column('total_ordenes', sa.Integer(), nullable=True),
+    sa.Column('procesadas', sa.Integer(), nullable=True),
+    sa.Column('facturas_creadas', sa.Integer(), nullable=True),
+    sa.Column('monto_total', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('ultima_orden_id', sa.Integer(), nullable=True),
+    sa.Column('errores', sa.Text(), nullable=True),
+    sa.Column('mensaje', sa.Text(), nullable=True),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    with op.batch_alter_table('facturas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('lote_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_facturas_lote_id'), ['lote_id'], unique=False)
+        batch_op.create_foreign_key('fk_facturas_lote_id', 'lotes_facturacion', ['lote_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('facturas', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_facturas_lote_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_facturas_lote_id'))
+        batch_op.drop_column('lote_id')
+
+    op.drop_table('lotes_facturacion')
@@ -0,0 +1,28 @@
+"""Resultados: id de ingesta
+
+Revision ID: c0e4a7b8d9f3
+Revises: b9d3f6a7c8e2
+Create Date: 2026-10-18 19:05:41.218930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c0e4a7b8d9f3'
+down_revision = 'b9d3f6a7c8e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('resultados', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('id_ingesta', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_resultados_id_ingesta'), ['id_ingesta'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('resultados', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_resultados_id_ingesta'))
+        batch_op.drop_column('id_ingesta')
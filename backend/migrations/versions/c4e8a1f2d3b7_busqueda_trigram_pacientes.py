@@ -0,0 +1,45 @@
+"""Columna de búsqueda normalizada en pacientes con índice trigram
+
+Revision ID: c4e8a1f2d3b7
+Revises: b7d2e9f04c18
+Create Date: 2026-10-18 11:42:05.118236
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f2d3b7'
+down_revision = 'b7d2e9f04c18'
+branch_labels = None
+depends_on = None
+
+
+# Mismo resultado que app.utils.busqueda.normalizar para los caracteres del español
+NORMALIZAR = """regexp_replace(trim(translate(lower(coalesce({0}, '')),
+    'áàâäãéèêëíìîïóòôöõúùûüñç', 'aaaaaeeeeiiiiooooouuuunc')), '\\s+', ' ', 'g')"""
+DIGITOS = "regexp_replace(coalesce({0}, ''), '\\D', '', 'g')"
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    with op.batch_alter_table('pacientes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('busqueda', sa.Text(), nullable=True))
+
+    partes = [NORMALIZAR.format(c) for c in ('nombre', 'apellido', 'email', 'pasaporte')]
+    partes += [DIGITOS.format(c) for c in ('cedula', 'telefono', 'celular')]
+    op.execute(
+        'UPDATE pacientes SET busqueda = concat_ws(\' \', '
+        + ', '.join(f"NULLIF({p}, '')" for p in partes) + ')'
+    )
+
+    op.create_index('idx_pacientes_busqueda_trgm', 'pacientes', ['busqueda'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'busqueda': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('idx_pacientes_busqueda_trgm', table_name='pacientes')
+    with op.batch_alter_table('pacientes', schema=None) as batch_op:
+        batch_op.drop_column('busqueda')
@@ -0,0 +1,29 @@
+"""Orden detalles: número de accesión de la muestra
+
+Revision ID: d1f5b8c9e0a4
+Revises: c0e4a7b8d9f3
+Create Date: 2026-10-18 21:12:07.483105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f5b8c9e0a4'
+down_revision = 'c0e4a7b8d9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Los detalles existentes reciben su accesión al imprimir la etiqueta
+    with op.batch_alter_table('orden_detalles', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('accesion', sa.String(length=20), nullable=True))
+        batch_op.create_index(batch_op.f('ix_orden_detalles_accesion'), ['accesion'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('orden_detalles', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_orden_detalles_accesion'))
+        batch_op.drop_column('accesion')
@@ -0,0 +1,88 @@
+"""Claves de bloqueo y pares de pacientes duplicados
+
+Revision ID: d5f9b2c3e4a8
+Revises: c4e8a1f2d3b7
+Create Date: 2026-10-18 14:31:52.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f9b2c3e4a8'
+down_revision = 'c4e8a1f2d3b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('paciente_claves',
+    sa.Column('clave', sa.String(length=80), nullable=False),
+    sa.Column('paciente_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['paciente_id'], ['pacientes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('clave', 'paciente_id')
+    )
+    with op.batch_alter_table('paciente_claves', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_paciente_claves_paciente_id'), ['paciente_id'], unique=False)
+
+    _cargar_claves()
+
+    op.create_table('paciente_duplicados',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('paciente_id', sa.Integer(), nullable=False),
+    sa.Column('duplicado_id', sa.Integer(), nullable=False),
+    sa.Column('puntaje', sa.Numeric(precision=4, scale=3), nullable=False),
+    sa.Column('motivos', sa.String(length=200), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=True),
+    sa.Column('revisado_por', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['paciente_id'], ['pacientes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['duplicado_id'], ['pacientes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['revisado_por'], ['usuarios.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('paciente_id', 'duplicado_id', name='uq_paciente_duplicado')
+    )
+    with op.batch_alter_table('paciente_duplicados', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_paciente_duplicados_duplicado_id'), ['duplicado_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_paciente_duplicados_estado'), ['estado'], unique=False)
+
+
+def _cargar_claves():
+    """
+    Claves de los pacientes existentes, por lotes de id. Sin esto el aviso de
+    posibles duplicados al crear un paciente no encuentra a nadie hasta correr
+    `flask detectar-duplicados --reindexar`. Se usa el mismo código que
+    DuplicadosService.reindexar (el código fonético no tiene equivalente en SQL).
+    """
+    from app.services.duplicados import claves_paciente, CAMPOS_CLAVE, PACIENTES_POR_LOTE
+
+    conexion = op.get_bind()
+    tabla = sa.table('paciente_claves', sa.column('clave', sa.String), sa.column('paciente_id', sa.Integer))
+    pacientes = sa.table('pacientes', sa.column('id', sa.Integer), *(
+        sa.column(campo, sa.Date if campo == 'fecha_nacimiento' else sa.String) for campo in CAMPOS_CLAVE
+    ))
+    ultimo_id = 0
+    while True:
+        filas = conexion.execute(
+            sa.select(pacientes).where(pacientes.c.id > ultimo_id).order_by(pacientes.c.id).limit(PACIENTES_POR_LOTE)
+        ).fetchall()
+        if not filas:
+            break
+        claves = [{'clave': clave, 'paciente_id': f.id} for f in filas for clave in claves_paciente(f)]
+        if claves:
+            op.bulk_insert(tabla, claves)
+        ultimo_id = filas[-1].id
+
+
+def downgrade():
+    with op.batch_alter_table('paciente_duplicados', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_paciente_duplicados_estado'))
+        batch_op.drop_index(batch_op.f('ix_paciente_duplicados_duplicado_id'))
+
+    op.drop_table('paciente_duplicados')
+    with op.batch_alter_table('paciente_claves', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_paciente_claves_paciente_id'))
+
+    op.drop_table('paciente_claves')
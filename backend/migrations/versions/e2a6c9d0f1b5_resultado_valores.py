@@ -0,0 +1,49 @@
+"""Valores de resultados por analito
+
+Revision ID: e2a6c9d0f1b5
+Revises: d1f5b8c9e0a4
+Create Date: 2026-10-18 22:40:16.905317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a6c9d0f1b5'
+down_revision = 'd1f5b8c9e0a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resultado_valores',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('resultado_id', sa.Integer(), nullable=False),
+    sa.Column('paciente_id', sa.Integer(), nullable=False),
+    sa.Column('analito', sa.String(length=50), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=True),
+    sa.Column('valor', sa.Numeric(precision=18, scale=6), nullable=True),
+    sa.Column('valor_texto', sa.String(length=100), nullable=True),
+    sa.Column('unidad', sa.String(length=30), nullable=True),
+    sa.Column('referencia_min', sa.Numeric(precision=18, scale=6), nullable=True),
+    sa.Column('referencia_max', sa.Numeric(precision=18, scale=6), nullable=True),
+    sa.Column('bandera', sa.String(length=10), nullable=True),
+    sa.Column('fecha', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['paciente_id'], ['pacientes.id'], ),
+    sa.ForeignKeyConstraint(['resultado_id'], ['resultados.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('resultado_valores', schema=None) as batch_op:
+        batch_op.create_index('idx_resultado_valores_paciente_analito_fecha',
+                              ['paciente_id', 'analito', 'fecha'], unique=False)
+        batch_op.create_index(batch_op.f('ix_resultado_valores_resultado_id'), ['resultado_id'], unique=False)
+    # Los resultados anteriores se cargan con: flask reconstruir-valores
+
+
+def downgrade():
+    with op.batch_alter_table('resultado_valores', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_resultado_valores_resultado_id'))
+        batch_op.drop_index('idx_resultado_valores_paciente_analito_fecha')
+
+    op.drop_table('resultado_valores')
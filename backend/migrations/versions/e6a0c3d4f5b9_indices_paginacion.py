@@ -0,0 +1,36 @@
+"""Índices compuestos para la paginación por cursor
+
+Revision ID: e6a0c3d4f5b9
+Revises: d5f9b2c3e4a8
+Create Date: 2026-10-18 15:06:40.271953
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a0c3d4f5b9'
+down_revision = 'd5f9b2c3e4a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (orden, id): cada página es un recorrido del índice desde el cursor
+    op.create_index('idx_pacientes_created_id', 'pacientes', ['created_at', 'id'], unique=False)
+    op.create_index('idx_ordenes_fecha_id', 'ordenes', ['fecha_orden', 'id'], unique=False)
+    op.create_index('idx_ordenes_estado_fecha_id', 'ordenes', ['estado', 'fecha_orden', 'id'], unique=False)
+    op.create_index('idx_facturas_fecha_id', 'facturas', ['fecha_factura', 'id'], unique=False)
+    op.create_index('idx_facturas_estado_fecha_id', 'facturas', ['estado', 'fecha_factura', 'id'], unique=False)
+    op.create_index('idx_paciente_duplicados_estado_puntaje', 'paciente_duplicados',
+                    ['estado', 'puntaje', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_paciente_duplicados_estado_puntaje', table_name='paciente_duplicados')
+    op.drop_index('idx_facturas_estado_fecha_id', table_name='facturas')
+    op.drop_index('idx_facturas_fecha_id', table_name='facturas')
+    op.drop_index('idx_ordenes_estado_fecha_id', table_name='ordenes')
+    op.drop_index('idx_ordenes_fecha_id', table_name='ordenes')
+    op.drop_index('idx_pacientes_created_id', table_name='pacientes')
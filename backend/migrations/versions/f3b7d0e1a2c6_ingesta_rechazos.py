@@ -0,0 +1,29 @@
+"""Ingesta: registros rechazados
+
+Revision ID: f3b7d0e1a2c6
+Revises: e2a6c9d0f1b5
+Create Date: 2026-10-19 10:02:33.517204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b7d0e1a2c6'
+down_revision = 'e2a6c9d0f1b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ingesta_rechazos',
+    sa.Column('id_ingesta', sa.String(length=64), nullable=False),
+    sa.Column('motivo', sa.String(length=500), nullable=True),
+    sa.Column('fecha', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id_ingesta')
+    )
+
+
+def downgrade():
+    op.drop_table('ingesta_rechazos')
@@ -0,0 +1,111 @@
+"""Contadores para números de factura y orden
+
+Revision ID: f7b1d4e5a6c0
+Revises: e6a0c3d4f5b9
+Create Date: 2026-10-18 16:12:08.513204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7b1d4e5a6c0'
+down_revision = 'e6a0c3d4f5b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('numeradores',
+    sa.Column('serie', sa.String(length=20), nullable=False),
+    sa.Column('periodo', sa.String(length=10), nullable=False),
+    sa.Column('valor', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('serie', 'periodo')
+    )
+
+    # Continuar desde el último número emitido en cada período
+    op.execute(r"""
+        INSERT INTO numeradores (serie, periodo, valor)
+        SELECT 'factura', split_part(numero_factura, '-', 2), MAX(split_part(numero_factura, '-', 3)::bigint)
+        FROM facturas
+        WHERE numero_factura ~ '^FAC-\d{4}-\d+$'
+        GROUP BY 2
+    """)
+    op.execute(r"""
+        INSERT INTO numeradores (serie, periodo, valor)
+        SELECT 'orden', split_part(numero_orden, '-', 2), MAX(split_part(numero_orden, '-', 3)::bigint)
+        FROM ordenes
+        WHERE numero_orden ~ '^ORD-\d{4}-\d+$'
+        GROUP BY 2
+    """)
+
+    # Las funciones SQL usan el mismo contador que la aplicación
+    op.execute("""
+        CREATE OR REPLACE FUNCTION generar_numero_orden()
+        RETURNS VARCHAR AS $$
+        DECLARE
+            v_periodo VARCHAR := TO_CHAR(CURRENT_DATE, 'YYMM');
+            contador BIGINT;
+        BEGIN
+            INSERT INTO numeradores (serie, periodo, valor) VALUES ('orden', v_periodo, 1)
+            ON CONFLICT (serie, periodo) DO UPDATE SET valor = numeradores.valor + 1
+            RETURNING valor INTO contador;
+            RETURN 'ORD-' || v_periodo || '-' || LPAD(contador::TEXT, 5, '0');
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION generar_numero_factura()
+        RETURNS VARCHAR AS $$
+        DECLARE
+            v_periodo VARCHAR := TO_CHAR(CURRENT_DATE, 'YYYY');
+            contador BIGINT;
+        BEGIN
+            INSERT INTO numeradores (serie, periodo, valor) VALUES ('factura', v_periodo, 1)
+            ON CONFLICT (serie, periodo) DO UPDATE SET valor = numeradores.valor + 1
+            RETURNING valor INTO contador;
+            RETURN 'FAC-' || v_periodo || '-' || LPAD(contador::TEXT, 6, '0');
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def downgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION generar_numero_orden()
+        RETURNS VARCHAR AS $$
+        DECLARE
+            nuevo_numero VARCHAR;
+            anio VARCHAR;
+            mes VARCHAR;
+            contador INTEGER;
+        BEGIN
+            anio := TO_CHAR(CURRENT_DATE, 'YY');
+            mes := TO_CHAR(CURRENT_DATE, 'MM');
+            SELECT COUNT(*) + 1 INTO contador
+            FROM ordenes
+            WHERE TO_CHAR(fecha_orden, 'YYMM') = anio || mes;
+            nuevo_numero := 'ORD-' || anio || mes || '-' || LPAD(contador::TEXT, 5, '0');
+            RETURN nuevo_numero;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION generar_numero_factura()
+        RETURNS VARCHAR AS $$
+        DECLARE
+            nuevo_numero VARCHAR;
+            anio VARCHAR;
+            contador INTEGER;
+        BEGIN
+            anio := TO_CHAR(CURRENT_DATE, 'YYYY');
+            SELECT COUNT(*) + 1 INTO contador
+            FROM facturas
+            WHERE TO_CHAR(fecha_factura, 'YYYY') = anio;
+            nuevo_numero := 'FAC-' || anio || '-' || LPAD(contador::TEXT, 6, '0');
+            RETURN nuevo_numero;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.drop_table('numeradores')
@@ -0,0 +1,180 @@
+"""
+Reproducir tráfico HL7 contra el servidor MLLP (flask servidor-mllp)
+
+Lee mensajes grabados (captura con marcos MLLP o texto con un mensaje por
+bloque que empieza con MSH) o los genera, y los envía a la tasa indicada por
+varias conexiones, como harían varios equipos. Al final muestra cuántos ACK
+fueron AA/AE/AR y la latencia hasta el ACK.
+
+Ejemplos:
+    python mllp_replay.py capturas/cobas_2026-10.hl7 --tasa 50 --conexiones 4
+    python mllp_replay.py --generar 5000 --orden ORD-2610-00001 --tasa 0 --ventana 10
+"""
+import argparse
+import asyncio
+import re
+import statistics
+import time
+from collections import Counter
+from datetime import datetime
+
+INICIO = b'\x0b'
+FIN = b'\x1c\r'
+
+
+def cargar(rutas):
+    mensajes = []
+    for ruta in rutas:
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+        if INICIO in datos:
+            # Captura MLLP: un mensaje por marco
+            for marco in datos.split(FIN):
+                inicio = marco.rfind(INICIO)
+                if inicio >= 0:
+                    mensajes.append(marco[inicio + 1:])
+        else:
+            # Texto: cada mensaje empieza en una línea MSH; segmentos separados por \r
+            texto = datos.decode('utf-8', errors='replace')
+            for bloque in re.split(r'(?m)^(?=MSH)', texto):
+                segmentos = [s for s in re.split(r'\r\n|\r|\n', bloque) if s.strip()]
+                if segmentos:
+                    mensajes.append('\r'.join(segmentos).encode('utf-8') + b'\r')
+    return mensajes
+
+
+def generar(cantidad, ordenes):
+    """Mensajes ORU^R01 de hemograma con valores variables"""
+    mensajes = []
+    ahora = datetime.now().strftime('%Y%m%d%H%M%S')
+    for i in range(cantidad):
+        orden = ordenes[i % len(ordenes)]
+        segmentos = [
+            f'MSH|^~\\&|REPLAY|LAB|CENTRO_DIAGNOSTICO|LAB|{ahora}||ORU^R01|RP{i:08d}|P|2.5',
+            f'PID|1||{1000 + i % 97}||PRUEBA^PACIENTE',
+            f'OBR|1|{orden}||HEMO^Hemograma',
+            f'OBX|1|NM|HGB^Hemoglobina||{12 + (i % 40) / 10:.1f}|g/dL|12-16|N|||F',
+            f'OBX|2|NM|WBC^Leucocitos||{4000 + (i * 37) % 7000}|cel/uL|4000-11000|N|||F',
+            f'OBX|3|NM|PLT^Plaquetas||{150 + (i * 13) % 300}|10*3/uL|150-450|N|||F',
+        ]
+        mensajes.append(('\r'.join(segmentos) + '\r').encode('utf-8'))
+    return mensajes
+
+
+def codigo_ack(respuesta):
+    for segmento in respuesta.split(b'\r'):
+        if segmento.startswith(b'MSA'):
+            campos = segmento.split(segmento[3:4])
+            return campos[1].decode() if len(campos) > 1 else '?'
+    return '?'
+
+
+class Reproductor:
+
+    def __init__(self, mensajes, host, puerto, tasa, conexiones, ventana):
+        self.mensajes = mensajes
+        self.host = host
+        self.puerto = puerto
+        self.tasa = tasa
+        self.conexiones = conexiones
+        self.ventana = ventana
+        self.codigos = Counter()
+        self.latencias = []
+        self.sin_ack = 0
+        self.siguiente = 0
+
+    def _tomar(self):
+        if self.siguiente >= len(self.mensajes):
+            return None
+        indice = self.siguiente
+        self.siguiente += 1
+        return indice
+
+    async def _conexion(self, inicio):
+        reader, writer = await asyncio.open_connection(self.host, self.puerto)
+        enviados = asyncio.Queue(maxsize=self.ventana)  # tiempos de envío sin ACK
+        cortada = False
+
+        async def leer_acks():
+            nonlocal cortada
+            while True:
+                enviado = await enviados.get()
+                if enviado is None:
+                    return
+                if not cortada:
+                    try:
+                        respuesta = await reader.readuntil(FIN)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        cortada = True
+                if cortada:
+                    self.sin_ack += 1
+                    continue
+                self.latencias.append(time.perf_counter() - enviado)
+                self.codigos[codigo_ack(respuesta)] += 1
+
+        lector = asyncio.create_task(leer_acks())
+        while not cortada and (indice := self._tomar()) is not None:
+            if self.tasa:
+                # Envío programado: el mensaje i sale en inicio + i / tasa
+                espera = inicio + indice / self.tasa - time.perf_counter()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+            await enviados.put(time.perf_counter())
+            try:
+                writer.write(INICIO + self.mensajes[indice] + FIN)
+                await writer.drain()
+            except ConnectionError:
+                cortada = True
+        await enviados.put(None)
+        await lector
+        writer.close()
+
+    async def ejecutar(self):
+        inicio = time.perf_counter()
+        await asyncio.gather(*(self._conexion(inicio) for _ in range(self.conexiones)))
+        return time.perf_counter() - inicio
+
+
+def percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproducir tráfico HL7 contra el servidor MLLP')
+    parser.add_argument('archivos', nargs='*', help='Capturas HL7 (marcos MLLP o texto)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=2575)
+    parser.add_argument('--tasa', type=float, default=10, help='Mensajes por segundo en total (0 = sin límite)')
+    parser.add_argument('--conexiones', type=int, default=1, help='Conexiones simultáneas (equipos)')
+    parser.add_argument('--ventana', type=int, default=1, help='Mensajes sin ACK por conexión (1 = modo original)')
+    parser.add_argument('--repetir', type=int, default=1, help='Veces que se envía la captura')
+    parser.add_argument('--generar', type=int, default=0, help='Generar N mensajes ORU^R01 en vez de leer archivos')
+    parser.add_argument('--orden', action='append', default=[], help='Número de orden para los mensajes generados')
+    args = parser.parse_args()
+
+    if args.generar:
+        mensajes = generar(args.generar, args.orden or ['1'])
+    else:
+        if not args.archivos:
+            parser.error('Indicar archivos de captura o --generar N')
+        mensajes = cargar(args.archivos)
+    mensajes = mensajes * args.repetir
+    if not mensajes:
+        parser.error('No se encontraron mensajes')
+
+    reproductor = Reproductor(mensajes, args.host, args.puerto, args.tasa, args.conexiones, args.ventana)
+    duracion = asyncio.run(reproductor.ejecutar())
+
+    latencias = sorted(reproductor.latencias)
+    print(f'{len(latencias)} mensajes en {duracion:.2f} s ({len(latencias) / duracion:.1f} msg/s)')
+    print('ACK: ' + ', '.join(f'{codigo}={total}' for codigo, total in sorted(reproductor.codigos.items())))
+    if reproductor.sin_ack:
+        print(f'{reproductor.sin_ack} mensajes sin ACK (el servidor cerró la conexión)')
+    if latencias:
+        print(f'Latencia ms: media {statistics.mean(latencias) * 1000:.1f}, '
+              f'p50 {percentil(latencias, 0.5) * 1000:.1f}, p95 {percentil(latencias, 0.95) * 1000:.1f}, '
+              f'p99 {percentil(latencias, 0.99) * 1000:.1f}, máx {latencias[-1] * 1000:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -49,27 +49,18 @@ def create_app(config_name=None):
     # =====================
     # RATE LIMITING BÁSICO
     # =====================
-    login_attempts = {}
-
+    # El contador vive en el almacén de cache para que el límite sea
+    # el mismo en todos los workers (CACHE_BACKEND=sqlite|redis)
     @app.before_request
     def rate_limit_login():
         if request.path == '/api/auth/login' and request.method == 'POST':
+            from app.cache import get_cache
             ip = request.headers.get('X-Real-IP', request.remote_addr)
-            import time
-            now = time.time()
-
-            if ip in login_attempts:
-                attempts = [t for t in login_attempts[ip] if now - t < 300]
-                login_attempts[ip] = attempts
-
-                if len(attempts) >= 10:
-                    return jsonify({
-                        'error': 'Demasiados intentos. Espere 5 minutos.'
-                    }), 429
 
-                login_attempts[ip].append(now)
-            else:
-                login_attempts[ip] = [now]
+            if get_cache().incrementar(f'login:{ip}', 300) > 10:
+                return jsonify({
+                    'error': 'Demasiados intentos. Espere 5 minutos.'
+                }), 429
 
     # =====================
     # LOGGING
@@ -129,6 +120,12 @@ def create_app(config_name=None):
         except Exception as e:
             app.logger.warning(f'No se pudo cargar {module_path}: {e}')
 
+    # =====================
+    # COMANDOS CLI
+    # =====================
+    from app.commands import registrar_comandos
+    registrar_comandos(app)
+
     # =====================
     # RUTAS BASE
     # =====================
@@ -60,10 +60,20 @@ function Facturas() {
   const descargarPDF = async (facturaId, numeroFactura) => {
     setDescargando(true);
     try {
-      const res = await axios.get(`${API}/impresion/factura-termica/${facturaId}`, {
+      let res = await axios.get(`${API}/impresion/factura-termica/${facturaId}`, {
         headers,
         responseType: 'blob'
       });
+      // 202: el PDF sigue en la cola de impresión; se espera en el trabajo
+      while (res.status === 202) {
+        const trabajo = JSON.parse(await res.data.text());
+        res = await axios.get(`${API}/impresion/trabajos/${trabajo.id}/archivo?esperar=10`, {
+          headers,
+          responseType: 'blob',
+          validateStatus: (status) => status === 200 || status === 409
+        });
+        if (res.status === 409) res = { ...res, status: 202 };
+      }
       const blob = new Blob([res.data], { type: 'application/pdf' });
       const url = window.URL.createObjectURL(blob);
       const win = window.open(url, '_blank');